@@ -0,0 +1,74 @@
+from typing import AsyncIterator
+
+from fastapi import Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+
+from app.core.config import settings
+from app.services.poster_pipeline import PosterResult
+from app.services.storage.store import artifact_store
+
+
+def etag_for_key(key: str) -> str:
+    """对象键按内容寻址（派生图的键由原图哈希与参数决定），文件名即可作为强 ETag。"""
+    return f'"{key.rsplit("/", 1)[-1]}"'
+
+
+def etag_matches(request: Request | None, etag: str) -> bool:
+    """请求的 If-None-Match 是否包含该 ETag（客户端已有相同内容）。"""
+    if request is None:
+        return False
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match 使用弱比较，忽略 W/ 前缀
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+async def _chunks(data: bytes, chunk_size: int) -> AsyncIterator[memoryview]:
+    # memoryview 切片不复制数据，每次只把一小段交给服务器写出
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def binary_response(
+    data: bytes,
+    media_type: str,
+    key: str | None = None,
+    headers: dict | None = None,
+    request: Request | None = None,
+) -> Response:
+    """
+    图片响应：带 Content-Length 与 ETag（key 为对象键时），以 RESPONSE_CHUNK_KB 分段流式发出，
+    不为响应体另外拼接一份完整内容，并关闭反向代理缓冲，代理收到第一段就转发给客户端。
+    请求的 If-None-Match 与 ETag 相同时返回 304。
+    """
+    headers = dict(headers or {})
+    if key:
+        headers["ETag"] = etag_for_key(key)
+        if etag_matches(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+    headers["Content-Length"] = str(len(data))
+    headers["X-Accel-Buffering"] = "no"
+    return StreamingResponse(_chunks(data, settings.RESPONSE_CHUNK_KB * 1024), media_type=media_type, headers=headers)
+
+
+async def poster_response(result: PosterResult, delivery: str, headers: dict) -> Response:
+    """
+    生成 / 修改接口的响应：指定了 output 时为第一个规格的图片，否则为原尺寸 JPEG。
+    delivery="redirect" 时不返回图片内容，而是 303 跳转到已保存的产物：
+    存储可直接访问时跳转到存储地址（等待该对象落盘后再跳转），否则跳转到海报图片接口（写入完成前从内存读取）。
+    """
+    if result.variants:
+        variant = result.variants[0]
+        data, media_type, key, url = variant.data, variant.content_type, variant.key, variant.describe(result.poster_id)["url"]
+    else:
+        data, media_type, key = result.image_bytes, "image/jpeg", result.image_key
+        url = result.image_url or f"/api/posters/{result.poster_id}/image"
+    if delivery == "redirect":
+        if artifact_store.url(key):
+            await artifact_store.wait([key])
+        return RedirectResponse(url, status_code=303, headers=headers)
+    return binary_response(data, media_type, key, headers)
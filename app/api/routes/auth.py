@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from pydantic import BaseModel
 from typing import Annotated
 import httpx
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 
 from app.core.config import settings
+from app.services.scheduler import default_tier, normalize_tier
 # 假设你有一个处理数据库用户操作的服务
 # from app.services import user_service 
 
@@ -20,8 +21,9 @@ class WxLoginRequest(BaseModel):
 
 # --- JWT 工具函数 ---
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
-    """创建 JWT access token"""
+    """创建 JWT access token，tier 声明为用户等级（paid / free），决定生成请求的调度优先级"""
     to_encode = data.copy()
+    to_encode["tier"] = normalize_tier(to_encode.get("tier"))
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
@@ -31,6 +33,41 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
     return encoded_jwt
 
+def get_user_tier(user_id: str) -> str:
+    """查询用户等级（***接入用户数据库后改为读取订阅状态***），目前按 PRIORITY_PAID_USERS 配置判断"""
+    paid_users = {item.strip() for item in settings.PRIORITY_PAID_USERS.split(",") if item.strip()}
+    return "paid" if user_id in paid_users else default_tier()
+
+def _token_payload(request: Request) -> dict | None:
+    """解析请求携带的 Bearer Token，没有 token 时返回 None，token 无效时返回 401"""
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token.", headers={"WWW-Authenticate": "Bearer"})
+
+def get_request_user_id(request: Request) -> str:
+    """
+    获取请求方的用户标识，用于按用户限流。
+    携带 Bearer Token 时取 JWT 的 sub；未登录的请求按客户端 IP 区分。
+    """
+    payload = _token_payload(request)
+    if payload and payload.get("sub"):
+        return f"user:{payload['sub']}"
+    client_host = request.client.host if request.client else "unknown"
+    return f"ip:{client_host}"
+
+def get_request_tier(request: Request) -> str:
+    """
+    获取请求方的用户等级，用于各阶段的优先级调度。
+    取 JWT 的 tier 声明；未登录或旧 token 没有该声明时为默认等级。
+    """
+    payload = _token_payload(request)
+    return normalize_tier(payload.get("tier") if payload else None)
+
 @router.post("/login", response_model=Token)
 async def wechat_login(payload: Annotated[WxLoginRequest, Body()]):
     """
@@ -81,7 +118,7 @@ async def wechat_login(payload: Annotated[WxLoginRequest, Body()]):
     # 5. 创建 JWT
     access_token_expires = timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user_id}, expires_delta=access_token_expires
+        data={"sub": user_id, "tier": get_user_tier(user_id)}, expires_delta=access_token_expires
     )
 
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
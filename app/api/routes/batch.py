@@ -0,0 +1,137 @@
+import json
+import zipfile
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.core.config import settings
+from app.schemas.batch import BatchRequest
+from app.services.admission import admission
+from app.services.batch_service import BatchEntry, BatchItemResult, BatchRun, describe_item, with_size
+from app.services.image_variants import FORMATS, variant_specs
+from app.services.scheduler import priority
+from app.api.routes.auth import get_request_tier, get_request_user_id
+
+router = APIRouter()
+
+
+class _ZipSink:
+    """ZipFile 的只写输出：写入的数据先暂存，由响应逐段取走（不能 seek 时 zipfile 会改用数据描述符）。"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _write_poster(archive: zipfile.ZipFile, item: BatchItemResult) -> list[str]:
+    """把一张海报的图片、派生图与 HTML 写入压缩包，返回文件名列表。图片本身已压缩，不再 deflate。"""
+    prefix = f"{item.entry.index + 1:03d}-{item.result.width}x{item.result.height}"
+    files = [(f"{prefix}.jpg", item.result.image_bytes, zipfile.ZIP_STORED)]
+    for variant in item.result.variants:
+        extension = FORMATS[variant.format][0]
+        files.append((f"{prefix}-{variant.width}w{extension}", variant.data, zipfile.ZIP_STORED))
+    files.append((f"{prefix}.html", item.result.html_content.encode("utf-8"), zipfile.ZIP_DEFLATED))
+    for name, data, compress_type in files:
+        archive.writestr(name, data, compress_type=compress_type)
+    return [name for name, _, _ in files]
+
+
+class _ZipRelease:
+    """
+    ZIP 流结束时停止批次并释放准入名额，可以重复调用、只生效一次。
+    响应体开始迭代后由生成器的 finally 调用；客户端在第一段之前断开等生成器从未开始的情况，由响应的后台任务调用。
+    """
+
+    def __init__(self, batch: BatchRun, slot):
+        self.batch = batch
+        self.slot = slot
+        self.released = False
+
+    async def __call__(self):
+        if self.released:
+            return
+        self.released = True
+        try:
+            await self.batch.close()
+        finally:
+            await self.slot.__aexit__(None, None, None)
+
+
+async def _zip_stream(batch: BatchRun, release: _ZipRelease):
+    """每完成一张海报就写入压缩包并发出，最后写入 manifest.json；结束或客户端断开时释放准入名额。"""
+    sink = _ZipSink()
+    try:
+        with zipfile.ZipFile(sink, "w") as archive:
+            items = []
+            async for item in batch.results():
+                entry = describe_item(item)
+                if item.result is not None:
+                    entry["files"] = _write_poster(archive, item)
+                items.append(entry)
+                yield sink.drain()
+            items.sort(key=lambda entry: entry["index"])
+            manifest = {**batch.summary(), "items": items}
+            archive.writestr(
+                "manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2), compress_type=zipfile.ZIP_DEFLATED
+            )
+        yield sink.drain()
+    finally:
+        await release()
+
+
+@router.post("/batches")
+async def generate_batch(
+    batch_request: BatchRequest,
+    user_id: str = Depends(get_request_user_id),
+    tier: str = Depends(get_request_tier),
+):
+    """
+    批量生成海报（如同一活动的多个尺寸、多个商品），整批按请求方的用户等级调度。
+    prompt 相同、只是尺寸不同的海报共用一次规划，相同的图片描述只生成一次，HTML 生成与渲染并发数受 BATCH_CONCURRENCY 限制。
+    response=manifest 时全部完成后返回产物地址清单；response=zip 时以 ZIP 流式返回，每完成一张写入一张，最后附带 manifest.json。
+    清单中的 posters_per_minute 为本批的吞吐。整批只占用一个请求准入名额。
+    """
+    entries = []
+    for index, item in enumerate(batch_request.items):
+        try:
+            variants = variant_specs(item.output.format, item.output.quality, item.output.widths) if item.output else []
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"items[{index}]: {e}")
+        entries.append(BatchEntry(index, with_size(item.prompt, item.width, item.height), variants))
+
+    # 批次在创建时复制上下文，其中的生成都按该等级排队（ZIP 流在另一个任务中迭代也是如此）
+    with priority(tier):
+        batch = BatchRun(entries, use_cache=not batch_request.no_cache, concurrency=settings.BATCH_CONCURRENCY)
+
+        if batch_request.response == "manifest":
+            async with admission.request(user_id):
+                items = [describe_item(item) async for item in batch.results()]
+            items.sort(key=lambda entry: entry["index"])
+            return {**batch.summary(), "items": items}
+
+        # 准入在开始输出之前完成，拒绝时仍可返回 429 / 503；名额在流结束时释放
+        slot = admission.request(user_id)
+        await slot.__aenter__()
+    release = _ZipRelease(batch, slot)
+    try:
+        return StreamingResponse(
+            _zip_stream(batch, release),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="posters.zip"', "X-Accel-Buffering": "no"},
+            background=BackgroundTask(release),
+        )
+    except BaseException:
+        await release()
+        raise
@@ -0,0 +1,90 @@
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from app.schemas.poster import GenerateRequest
+from app.schemas.job import JobStatus, JobSubmitResponse
+from app.services.jobs.manager import JobQueueFull, job_manager
+from app.services.storage.store import artifact_store
+from app.services.image_variants import variant_specs
+from app.api.responses import binary_response, etag_for_key, etag_matches
+from app.api.routes.auth import get_request_tier, get_request_user_id
+
+router = APIRouter()
+
+@router.post("/jobs", response_model=JobSubmitResponse, status_code=202)
+async def submit_job(
+    gen_request: GenerateRequest,
+    user_id: str = Depends(get_request_user_id),
+    tier: str = Depends(get_request_tier),
+):
+    """
+    提交海报生成任务，立即返回任务 ID。
+    之后通过状态接口轮询，或订阅 SSE 事件流获取各阶段进度。
+    """
+    output = gen_request.output
+    if output:
+        try:
+            variant_specs(output.format, output.quality, output.widths)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        job = await job_manager.submit(
+            gen_request.prompt,
+            use_cache=not gen_request.no_cache,
+            user_id=user_id,
+            tier=tier,
+            output=output.model_dump() if output else None,
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job['id']}",
+        "events_url": f"/api/jobs/{job['id']}/events",
+    }
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """查询任务状态。"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    以 Server-Sent Events 推送任务进度，每次状态或阶段变化发送一条事件，任务结束后关闭连接。
+    """
+    if await job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def event_stream():
+        async for job in job_manager.subscribe(job_id):
+            event = job["status"] if job["status"] in ("succeeded", "failed") else "progress"
+            yield f"event: {event}\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, request: Request):
+    """下载已完成任务的海报图片，带 ETag，If-None-Match 相同时返回 304。"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}.")
+    image_key = job["result"]["image_key"]
+    etag = etag_for_key(image_key)
+    if etag_matches(request, etag):
+        # 客户端已有该图片时不读取存储
+        return Response(status_code=304, headers={"ETag": etag})
+    image_bytes = await artifact_store.get(image_key)
+    if image_bytes is None:
+        raise HTTPException(status_code=404, detail="Poster artifact not found.")
+    return binary_response(image_bytes, "image/jpeg", image_key)
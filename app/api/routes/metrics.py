@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.core.telemetry import metrics
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus 指标：阶段耗时直方图、AI 服务商错误与重试计数、渲染页面与排队深度等。
+    """
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="指标未启用 (TELEMETRY_ENABLED=false)")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,41 @@
+from fastapi import APIRouter
+
+from app.services.ai_clients import ai_clients
+from app.services.generator.painter import image_hedging
+from app.services.generator.prompt_cache import prompt_cache
+from app.services.resilience import resilience
+from app.services.renderer_service import render_farm, render_flight
+from app.services.renderer.asset_cache import asset_cache
+from app.services.renderer.image_ingest import image_ingest
+from app.services.jobs.manager import job_manager
+from app.services.result_cache import result_cache
+from app.services.poster_pipeline import generation_flight
+from app.services.admission import admission
+from app.services.storage.store import artifact_store
+from app.services.storage.retention import retention
+
+router = APIRouter()
+
+@router.get("/ops/stats")
+async def get_stats():
+    """
+    运行状态统计：AI 连接池、渲染集群、资源缓存、任务队列与结果缓存命中率，用于容量规划。
+    """
+    return {
+        "ai_clients": ai_clients.stats(),
+        "image_hedging": image_hedging.stats(),
+        "prompt_cache": prompt_cache.stats(),
+        "circuit_breakers": resilience.stats(),
+        "render_farm": render_farm.stats(),
+        "asset_cache": asset_cache.stats(),
+        "image_ingest": image_ingest.stats(),
+        "jobs": job_manager.stats(),
+        "result_cache": result_cache.stats(),
+        "storage": artifact_store.stats(),
+        "retention": retention.stats(),
+        "admission": admission.stats(),
+        "singleflight": {
+            "generation": generation_flight.stats(),
+            "render": render_flight.stats(),
+        },
+    }
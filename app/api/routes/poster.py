@@ -1,36 +1,45 @@
-import time
-from fastapi import APIRouter, Depends, Request
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, HTTPException, Request
 from app.schemas.poster import GenerateRequest, GenerateResponse
-from app.services.ai_service import generate_html_from_ai
-from app.services.renderer_service import render_html_to_image
-from app.services.storage_service import save_artifacts
+from app.services.poster_pipeline import run_poster_pipeline
+from app.services.admission import admission
+from app.services.image_variants import variant_specs
+from app.services.scheduler import priority
+from app.api.responses import poster_response
+from app.api.routes.auth import get_request_tier, get_request_user_id
 
 router = APIRouter()
 
 @router.post("/generate")
-async def generate_poster(gen_request: GenerateRequest):
+async def generate_poster(
+    gen_request: GenerateRequest,
+    user_id: str = Depends(get_request_user_id),
+    tier: str = Depends(get_request_tier),
+):
     """
     接收用户 prompt，生成海报。
+    耗时较长，客户端容易超时的场景请使用 /api/jobs 异步接口。
+    指定 output 时返回第一个宽度的对应格式图片，其余尺寸同时保存，可通过 /api/posters/{id}/image 获取。
+    delivery=redirect 时不返回图片内容，303 跳转到保存的产物地址。
     """
-    start_time = time.time()
-    # 1. 调用 AI 生成 HTML、尺寸和图片 URL
-    step1_start = time.time()
-    html_content, width, height, image_urls = await generate_html_from_ai(gen_request.prompt)
-    print(f"Step 1 - AI 内容生成耗时: {time.time() - step1_start:.2f}秒")
+    output = gen_request.output
+    try:
+        variants = variant_specs(output.format, output.quality, output.widths) if output else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with priority(tier):
+        async with admission.request(user_id):
+            result = await run_poster_pipeline(gen_request.prompt, use_cache=not gen_request.no_cache, variants=variants)
 
-    # 2. 渲染 HTML 为图片
-    step2_start = time.time()
-    final_image_bytes = await render_html_to_image(html_content, width, height)
-    print(f"Step 2 - HTML 渲染耗时: {time.time() - step2_start:.2f}秒")
-
-    # 3. 保存所有产物
-    # 这一步仍然执行，以便在服务器上留档，但我们不再使用它的返回值
-    step3_start = time.time()
-    await save_artifacts(html_content, image_urls, final_image_bytes)
-    print(f"Step 3 - 产物保存耗时: {time.time() - step3_start:.2f}秒")
-    
-    print(f"Total - 接口总耗时: {time.time() - start_time:.2f}秒")
-    # 4. 直接返回图片二进制内容
-    # FastAPI 会自动设置正确的 Content-Type (image/png)
-    return Response(content=final_image_bytes, media_type="image/jpeg")
\ No newline at end of file
+    headers = {"X-Cache": "HIT" if result.cached else "MISS", "X-Poster-Id": result.poster_id}
+    if result.metrics:
+        # 通过 Server-Timing 上报各阶段耗时（毫秒），如 plan / image / html / html-ttft / render.ready / store / total
+        headers["Server-Timing"] = ", ".join(
+            f"{name.replace('_', '-')};dur={seconds * 1000:.0f}" for name, seconds in result.metrics.items()
+        )
+    if result.timeline:
+        # 阶段时间线（毫秒，相对请求开始），可以看出规划、生图与 HTML 生成的重叠情况
+        headers["X-Stage-Timeline"] = ", ".join(
+            f"{item['name'].replace('_', '-')};start={item['start_ms']:.0f};end={item['end_ms']:.0f}"
+            for item in result.timeline
+        )
+    return await poster_response(result, gen_request.delivery, headers)
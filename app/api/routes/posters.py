@@ -0,0 +1,98 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response
+
+from app.schemas.poster import EditRequest
+from app.services.admission import admission
+from app.services.generator.editor import EditError
+from app.services.poster_pipeline import run_edit_pipeline
+from app.services.storage_service import load_poster
+from app.services.image_variants import FORMATS, MAX_WIDTH, MIN_WIDTH, image_variants, negotiate_format, variant_specs
+from app.services.storage.store import variant_key
+from app.services.scheduler import priority
+from app.api.responses import binary_response, etag_for_key, etag_matches, poster_response
+from app.api.routes.auth import get_request_tier, get_request_user_id
+
+router = APIRouter()
+
+# 派生图按内容寻址、不会改变，可以长期缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@router.get("/posters/{poster_id}")
+async def get_poster(poster_id: str):
+    """海报清单：提示词、尺寸、素材图片与产物的对象键。"""
+    poster = await load_poster(poster_id)
+    if poster is None:
+        raise HTTPException(status_code=404, detail="Poster not found.")
+    return poster
+
+@router.get("/posters/{poster_id}/image")
+async def get_poster_image(
+    request: Request,
+    poster_id: str,
+    format: Literal["jpeg", "png", "webp", "avif"] | None = None,
+    width: int | None = Query(None, ge=MIN_WIDTH, le=MAX_WIDTH),
+    quality: int = Query(85, ge=1, le=100),
+):
+    """
+    按需输出海报图片：可指定格式、宽度（按比例缩放，不放大）与质量。
+    未指定格式时根据 Accept 头选择（AVIF > WebP > JPEG）；派生结果会保存下来，之后的请求直接读取。
+    响应带 ETag，If-None-Match 相同时返回 304。
+    """
+    poster = await load_poster(poster_id)
+    if poster is None:
+        raise HTTPException(status_code=404, detail="Poster not found.")
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "X-Poster-Id": poster_id}
+    if format is None:
+        format = negotiate_format(request.headers.get("Accept"))
+        headers["Vary"] = "Accept"
+    try:
+        specs = variant_specs(format, quality, [width] if width else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if width:
+        # 指定宽度时不读取图片就能算出派生图的键，客户端已有该版本时直接返回 304
+        etag = etag_for_key(variant_key(poster["image"], width, specs[0].quality, FORMATS[format][0]))
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={**headers, "ETag": etag})
+    try:
+        [variant] = await image_variants.get_or_create(poster["image"], None, specs)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Poster artifact not found.")
+    return binary_response(variant.data, variant.content_type, variant.key, headers, request)
+
+@router.post("/posters/{poster_id}/edit")
+async def edit_poster(
+    poster_id: str,
+    edit_request: EditRequest,
+    user_id: str = Depends(get_request_user_id),
+    tier: str = Depends(get_request_tier),
+):
+    """
+    增量修改已有海报（改标题、文案、配色、字体等），只重新渲染这一页，不重新规划和生图。
+    修改结果保存为新海报，通过 X-Poster-Id 返回新 id；返回内容与 /api/generate 相同。
+    """
+    poster = await load_poster(poster_id)
+    if poster is None:
+        raise HTTPException(status_code=404, detail="Poster not found.")
+    output = edit_request.output
+    try:
+        variants = variant_specs(output.format, output.quality, output.widths) if output else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        with priority(tier):
+            async with admission.request(user_id):
+                result = await run_edit_pipeline(poster, edit_request.instruction, variants=variants)
+    except EditError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Poster artifact not found.")
+
+    headers = {"X-Poster-Id": result.poster_id, "X-Edited-From": poster_id, "X-Edit-Mode": result.edit_mode}
+    if result.metrics:
+        headers["Server-Timing"] = ", ".join(
+            f"{name.replace('_', '-')};dur={seconds * 1000:.0f}" for name, seconds in result.metrics.items()
+        )
+    return await poster_response(result, edit_request.delivery, headers)
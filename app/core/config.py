@@ -13,6 +13,115 @@ class Settings(BaseSettings):
     AI_IMAGE_API_KEY: str
     AI_IMAGE_BASE_URL: str = "https://api.siliconflow.cn/v1"
     AI_IMAGE_MODEL: str = "black-forest-labs/FLUX.1-dev"
+    # 备用生图服务（可选，OpenAI 兼容接口），对冲请求优先发往这里；留空时对冲请求仍发往主服务
+    AI_IMAGE_SECONDARY_BASE_URL: str = ""
+    AI_IMAGE_SECONDARY_API_KEY: str = ""
+    AI_IMAGE_SECONDARY_MODEL: str = ""  # 留空时与 AI_IMAGE_MODEL 相同
+
+    # --- 生图对冲请求（主请求超过滚动 p95 耗时后再发一份，取先成功的） ---
+    IMAGE_HEDGE_ENABLED: bool = True
+    IMAGE_HEDGE_QUANTILE: float = 0.95  # 对冲阈值取该服务商最近耗时的分位数
+    IMAGE_HEDGE_DEFAULT_DELAY: float = 15.0  # 样本不足时的对冲阈值（秒）
+    IMAGE_HEDGE_MIN_DELAY: float = 1.0  # 对冲阈值下限（秒）
+    IMAGE_HEDGE_MIN_SAMPLES: int = 20  # 样本数达到后才使用分位数
+    IMAGE_HEDGE_WINDOW: int = 200  # 每个服务商保留的最近耗时样本数
+    IMAGE_HEDGE_BUDGET_RATIO: float = 0.1  # 额外请求占比上限
+    IMAGE_HEDGE_MAX_PER_IMAGE: int = 1  # 每张图片最多额外发出的请求数
+
+    # --- AI 客户端连接池配置 ---
+    AI_HTTP_MAX_CONNECTIONS: int = 50  # 每个 (base_url, api_key) 的最大连接数
+    AI_HTTP_MAX_KEEPALIVE: int = 20  # 保持的空闲长连接数
+    AI_HTTP_KEEPALIVE_EXPIRY: float = 60.0  # 空闲长连接保留秒数
+    AI_HTTP2: bool = True  # 安装了 h2 时启用 HTTP/2
+    AI_PLAN_TIMEOUT: float = 30.0  # 各阶段请求超时（秒）
+    AI_HTML_TIMEOUT: float = 120.0
+    AI_IMAGE_TIMEOUT: float = 90.0
+
+    # --- 调用保护（截止时间、重试预算与熔断） ---
+    REQUEST_DEADLINE: float = 240.0  # 单次生成的端到端截止时间（秒），0 表示不限
+    EDIT_DEADLINE: float = 30.0  # 增量修改海报的端到端截止时间（秒），0 表示不限
+    AI_MAX_ATTEMPTS: int = 3  # 单次 AI 调用最多尝试次数（含首次）
+    AI_RETRY_BACKOFF_BASE: float = 0.5  # 指数退避的基数（秒），第 n 次重试最多等待 base * 2^n
+    AI_RETRY_BACKOFF_MAX: float = 8.0
+    AI_RETRY_BUDGET_RATIO: float = 0.2  # 每个服务商的重试流量上限（占调用数的比例）
+    BREAKER_FAILURE_RATIO: float = 0.5  # 最近调用中失败比例达到该值时熔断
+    BREAKER_MIN_CALLS: int = 10  # 至少统计到这么多次调用才会熔断
+    BREAKER_WINDOW: int = 50  # 统计最近多少次调用
+    BREAKER_OPEN_SECONDS: float = 30.0  # 熔断持续时间，之后放行一个探测调用
+
+    # --- HTML 流式生成 ---
+    HTML_STREAMING: bool = True  # 流式获取 HTML，可上报首 token 耗时
+    HTML_SPECULATIVE_RENDER: bool = True  # <head> 生成后立即在预渲染页面中加载 CSS 和字体
+    # "template"：模型只返回版式 id、文案与配色，由本地版式库填充 HTML（失败时回退到完整生成）；"llm"：模型生成完整 HTML
+    HTML_MODE: str = "template"
+    # "streaming"：流式规划，每个图片描述一完整就开始生图，规划声明图片数量后即开始生成 HTML；"sequential"：规划完成后再生图与生成 HTML
+    PLAN_MODE: str = "streaming"
+    AI_PLAN_JSON_MODE: bool = True  # 规划请求使用 JSON 模式（response_format=json_object），服务商不支持时设为 false
+    # 提示词前缀缓存："auto" 依赖服务商的自动前缀缓存并统计命中；"ark_context" 使用火山方舟上下文缓存；"off" 关闭
+    AI_PROMPT_CACHE: str = "auto"
+    AI_PROMPT_CACHE_TTL: int = 3600  # 方舟上下文缓存的有效期（秒）
+
+    # --- 异步任务配置 ---
+    JOB_STORE_BACKEND: str = "memory"  # 任务状态存储："memory" 或 "sqlite"
+    JOB_STORE_PATH: str = "jobs.sqlite3"  # sqlite 后端的数据库文件
+    JOB_WORKER_CONCURRENCY: int = 4  # 同时执行的任务数
+    JOB_QUEUE_SIZE: int = 100  # 排队任务上限，超出后提交接口返回 503
+
+    # --- 结果缓存配置（相同 prompt + 尺寸 + 模型 + 模板版本直接返回） ---
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_DIR: str = "generated_content/cache"
+    RESULT_CACHE_MAX_MB: int = 2048  # 超出后按 LRU 淘汰
+    RESULT_CACHE_TTL_SECONDS: int = 7 * 24 * 3600  # 条目有效期，0 表示不过期
+
+    # --- 产物存储配置（后台批量写入，按内容 SHA-256 寻址） ---
+    STORAGE_BACKEND: str = "local"  # "local" 或 "s3"（兼容 S3 的对象存储，如 MinIO）
+    STORAGE_LOCAL_DIR: str = "generated_content/store"  # 位于 generated_content 下时可通过 /static 访问
+    STORAGE_PUBLIC_BASE_URL: str = ""  # 产物对外访问地址前缀（如 CDN），留空时本地存储使用 /static
+    STORAGE_S3_ENDPOINT: str = ""  # 如 http://127.0.0.1:9000
+    STORAGE_S3_BUCKET: str = ""
+    STORAGE_S3_REGION: str = "us-east-1"
+    STORAGE_S3_ACCESS_KEY: str = ""
+    STORAGE_S3_SECRET_KEY: str = ""
+    STORAGE_S3_PREFIX: str = ""
+    STORAGE_WRITE_QUEUE_SIZE: int = 256  # 写入队列上限，满了之后请求会等待（反压）
+    STORAGE_WRITE_BATCH_SIZE: int = 16  # 每批最多写入的对象数
+    STORAGE_WRITE_WORKERS: int = 2
+    STORAGE_FLUSH_TIMEOUT: float = 30.0  # 关闭时等待队列写完的最长秒数
+
+    # --- 产物保留策略（按年龄与总大小回收，按最近访问淘汰） ---
+    RETENTION_ENABLED: bool = True
+    RETENTION_INDEX_PATH: str = "artifacts.sqlite3"  # 产物索引（不要放在 /static 挂载的目录下）
+    RETENTION_MAX_AGE_DAYS: float = 30  # 超过该天数未被访问的海报会被回收，0 表示不限
+    RETENTION_MAX_GB: float = 20  # 存储总大小上限，超出后按最近访问时间淘汰，0 表示不限
+    RETENTION_SWEEP_INTERVAL: float = 60  # 清理间隔（秒）
+    RETENTION_SWEEP_BATCH: int = 200  # 每轮最多回收的海报 / 对象数
+    RETENTION_ORPHAN_GRACE: float = 3600  # 无引用对象的宽限期（秒），避免回收正在被新海报复用的对象
+
+    # --- 输出格式与尺寸（由同一张截图派生 WebP/AVIF/缩略图） ---
+    IMAGE_VARIANT_WORKERS: int = 2  # 解码 / 缩放 / 编码所用的线程数
+    RESPONSE_CHUNK_KB: int = 64  # 图片响应分段发送的大小（KB），不为响应体另外复制一份完整图片
+
+    # --- 批量生成 ---
+    BATCH_CONCURRENCY: int = 4  # 每个批次同时生成 HTML 与渲染的海报数
+
+    # --- 准入控制配置 ---
+    ADMISSION_MAX_IN_FLIGHT: int = 32  # 全局同时处理的生成请求上限，超出返回 503
+    ADMISSION_USER_MAX_CONCURRENT: int = 2  # 单个用户（JWT sub 或 IP）同时进行的生成数，超出返回 429
+    ADMISSION_CHAT_CONCURRENCY: int = 16  # 各阶段并发上限
+    ADMISSION_IMAGE_CONCURRENCY: int = 8
+    ADMISSION_RENDER_CONCURRENCY: int = 8
+    ADMISSION_STAGE_MAX_WAITING: int = 64  # 每个阶段的等待队列长度，已满时立即拒绝
+    ADMISSION_STAGE_WAIT_TIMEOUT: float = 60.0  # 阶段内排队的最长秒数
+
+    # --- 优先级调度（用户等级来自 JWT 的 tier 声明：paid / free） ---
+    PRIORITY_DEFAULT_TIER: str = "free"  # 未登录或 token 中没有 tier 时的等级
+    PRIORITY_PAID_USERS: str = ""  # 付费用户的 openid，逗号分隔；登录时据此写入 tier（接入用户库前的临时来源）
+    PRIORITY_PAID_WEIGHT: int = 4  # 各阶段名额按权重在等级间分配，都有积压时付费 : 免费 = 4 : 1
+    PRIORITY_FREE_WEIGHT: int = 1
+    PRIORITY_AGING_SECONDS: float = 15.0  # 排队超过该秒数的调用不论等级优先放行，避免免费流量被饿死
+    PRIORITY_PAID_SLO_SECONDS: float = 60.0  # 各等级的端到端耗时目标，用于统计 SLO 达成情况
+    PRIORITY_FREE_SLO_SECONDS: float = 180.0
+    PRIORITY_LATENCY_WINDOW: int = 500  # 计算各等级 p95 耗时的滑动窗口（请求数）
 
 
 
@@ -35,5 +144,36 @@ class Settings(BaseSettings):
     SKIP_IMAGE_GENERATION: bool = False
     SKIP_HTML_GENERATION: bool = False
 
+    # --- 渲染页面池配置 ---
+    RENDER_POOL_SIZE: int = 4  # 预热的页面（BrowserContext）数量，也是并发渲染上限
+    RENDER_PAGE_MAX_USES: int = 50  # 单个页面最多复用次数，超过后回收重建
+    RENDER_POOL_ACQUIRE_TIMEOUT: float = 30.0  # 池耗尽时等待空闲页面的最长秒数
+    RENDER_POOL_HEALTH_CHECK_INTERVAL: float = 30.0  # 空闲页面探活间隔（秒），0 表示关闭
+
+    # --- 渲染集群配置 ---
+    RENDER_FARM_SIZE: int = 1  # 浏览器实例数量，建议不超过渲染节点的 CPU 核数
+    RENDER_BROWSER_MAX_RENDERS: int = 1000  # 单个浏览器渲染多少次后排空重启（防内存泄漏），0 表示不限
+    RENDER_READY_TIMEOUT_MS: int = 10000  # 等待页面就绪（字体/图片/绘制）的截止时间，超时后直接截图
+
+    # --- 渲染资源缓存配置（字体 / 图片请求拦截） ---
+    ASSET_CACHE_ENABLED: bool = True
+    ASSET_CACHE_DIR: str = ".asset_cache"
+    ASSET_CACHE_MAX_MB: int = 1024  # 磁盘缓存上限，超出后按 LRU 淘汰
+    ASSET_CACHE_MEMORY_MB: int = 128  # 内存热点缓存上限
+    ASSET_CACHE_PREFILL: bool = True  # 启动时预热提示词中允许的字体
+    ASSET_CACHE_OFFLINE: bool = False  # 离线模式：未命中缓存的资源请求直接中止（用于测试）
+
+    # --- 生成图片预取（下载后按海报尺寸缩小，渲染时从内存返回） ---
+    IMAGE_INGEST_ENABLED: bool = True
+    IMAGE_INGEST_WORKERS: int = 2  # 解码 / 缩放所用的线程数
+    IMAGE_INGEST_MEMORY_MB: int = 128  # 内存中保留的已缩小图片上限，超出后按 LRU 淘汰
+    IMAGE_INGEST_TIMEOUT: float = 30.0  # 单张图片的下载超时（秒）
+    IMAGE_INGEST_MAX_MB: int = 32  # 单张图片的大小上限，超过时由页面直接加载
+    IMAGE_INGEST_QUALITY: int = 90  # 缩小后重新编码的 JPEG 质量
+
+    # --- 可观测性配置 ---
+    TELEMETRY_ENABLED: bool = True  # 阶段追踪与 /metrics 指标；关闭后接口不再返回 Server-Timing
+    TELEMETRY_TRACE_LOG: bool = False  # 每个请求结束时输出一行 JSON 格式的追踪日志
+
 # 创建一个全局可用的配置实例
 settings = Settings()
\ No newline at end of file
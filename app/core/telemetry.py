@@ -0,0 +1,301 @@
+"""
+轻量的请求级追踪与 Prometheus 指标。
+
+- span(name)：记录一个阶段的耗时，写入阶段耗时直方图，并挂到当前请求的 Trace 上；
+- Trace：一次请求内所有 span 的集合，用于 Server-Timing 与结构化日志；
+- metrics：进程内的指标注册表（Counter / Gauge / Histogram），由 /metrics 以 Prometheus 文本格式导出。
+
+TELEMETRY_ENABLED=false 时 span() 返回共享的空对象，指标的记录方法直接返回，几乎没有额外开销。
+"""
+import json
+import math
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Callable
+
+from app.core.config import settings
+
+# 阶段耗时直方图的桶（秒）：覆盖毫秒级的渲染子阶段到分钟级的 AI 调用
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        """返回 [(指标名后缀, 标签串, 数值)]。"""
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{self.name}{suffix}{labels} {_format_value(value)}" for suffix, labels, value in self.samples()]
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        return [("", _format_labels(self.labelnames, key), value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """
+    仪表盘指标。传入 callback 时在抓取时才计算（返回数值，或 {标签值元组: 数值}），
+    不需要在业务代码中维护。
+    """
+    type = "gauge"
+
+    def __init__(self, *args, callback: Callable[[], float | dict] | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.callback = callback
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        self._values[self._key(labels)] = value
+
+    def samples(self):
+        values = self._values
+        if self.callback:
+            result = self.callback()
+            values = result if isinstance(result, dict) else {(): result}
+        return [("", _format_labels(self.labelnames, key), value) for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DURATION_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # 每个标签组合：[各桶计数..., 总和, 总数]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def samples(self):
+        samples = []
+        for key, state in self._values.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                samples.append(("_bucket", _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"'), cumulative))
+            samples.append(("_bucket", _format_labels(self.labelnames, key, 'le="+Inf"'), state[-1]))
+            samples.append(("_sum", _format_labels(self.labelnames, key), state[-2]))
+            samples.append(("_count", _format_labels(self.labelnames, key), state[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """进程内指标注册表，同名指标只注册一次。"""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, cls, name: str, help: str, labelnames: tuple[str, ...], **kwargs):
+        if name not in self._metrics:
+            self._metrics[name] = cls(self, name, help, labelnames, **kwargs)
+        return self._metrics[name]
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = (), callback=None) -> Gauge:
+        return self._register(Gauge, name, help, labelnames, callback=callback)
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）。"""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines += metric.render()
+            except Exception as e:
+                print(f"导出指标 {metric.name} 时出错: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics = MetricsRegistry(enabled=settings.TELEMETRY_ENABLED)
+
+stage_duration = metrics.histogram(
+    "poster_stage_duration_seconds", "各阶段耗时（秒）", ("stage",)
+)
+stage_errors = metrics.counter(
+    "poster_stage_errors_total", "各阶段抛出异常的次数", ("stage",)
+)
+
+
+class Trace:
+    """一次请求内的全部 span。"""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans: list[dict] = []
+
+    def add(self, name: str, start: float, duration: float, attrs: dict | None, error: str | None = None):
+        span = {"name": name, "start_ms": round((start - self.start) * 1000, 1), "duration_ms": round(duration * 1000, 1)}
+        if attrs:
+            span["attrs"] = attrs
+        if error:
+            span["error"] = error
+        self.spans.append(span)
+
+    def timings(self) -> dict[str, float]:
+        """{阶段: 秒}；同名 span（如并行的多次生图）取最长的一次，即关键路径上的耗时。"""
+        timings = {}
+        for span in self.spans:
+            seconds = span["duration_ms"] / 1000
+            if seconds > timings.get(span["name"], -1.0):
+                timings[span["name"]] = seconds
+        return timings
+
+    def timeline(self) -> list[dict]:
+        """按开始时间排序的阶段时间线 [{name, start_ms, end_ms}]，用于观察各阶段是否重叠。"""
+        return [
+            {"name": span["name"], "start_ms": span["start_ms"], "end_ms": round(span["start_ms"] + span["duration_ms"], 1)}
+            for span in sorted(self.spans, key=lambda span: span["start_ms"])
+        ]
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.id, "name": self.name, "spans": self.spans}
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("poster_trace", default=None)
+
+
+class Span:
+    """with span("render.screenshot") as s: ...; s.set(key=value) 附加属性。"""
+
+    __slots__ = ("name", "attrs", "_start")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        stage_duration.observe(duration, stage=self.name)
+        error = None
+        if exc_type is not None:
+            error = exc_type.__name__
+            stage_errors.inc(stage=self.name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(self.name, self._start, duration, self.attrs, error)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attrs) -> Span | _NoopSpan:
+    """记录一个阶段；关闭遥测时返回共享的空对象。"""
+    if not metrics.enabled:
+        return _NOOP_SPAN
+    return Span(name, attrs)
+
+
+def record(name: str, seconds: float, **attrs):
+    """记录一个已经测得的耗时（如首 token 耗时），效果与同名 span 相同。"""
+    if not metrics.enabled:
+        return
+    stage_duration.observe(seconds, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter() - seconds, seconds, attrs or None)
+
+
+def start_trace(name: str) -> Trace | None:
+    """在当前上下文中开始一次请求追踪，返回 Trace；关闭遥测时返回 None。"""
+    if not metrics.enabled:
+        return None
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace: Trace | None):
+    """结束追踪；开启 TELEMETRY_TRACE_LOG 时输出一行 JSON 格式的追踪日志。"""
+    if trace is None:
+        return
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    if settings.TELEMETRY_TRACE_LOG:
+        print(json.dumps({"type": "trace", **trace.to_dict()}, ensure_ascii=False))
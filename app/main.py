@@ -1,23 +1,63 @@
 # 必须在导入任何其他模块之前设置事件循环策略（Windows 上 Playwright 兼容性修复）
+import os
 import sys
 import asyncio
+import math
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from app.api.routes import poster, auth # 引入 auth 路由
-from app.services.renderer_service import browser_manager
+from app.api.routes import poster, posters, batch, auth, ops, jobs, metrics # 引入 auth 路由
+from app.services.renderer_service import render_farm
+from app.services.ai_clients import ai_clients
+from app.services.generator.prompt_cache import prompt_cache
+from app.services.jobs.manager import job_manager
+from app.services.result_cache import result_cache
+from app.services.storage.store import artifact_store
+from app.services.storage.retention import TrackingStaticFiles, retention
+from app.services.image_variants import image_variants
+from app.services.admission import AdmissionRejected
+from app.services.resilience import CircuitOpen, DeadlineExceeded
+from app.services.renderer.asset_cache import asset_cache, prompt_font_css_urls
+from app.services.renderer.image_ingest import image_ingest
+from app.core.config import settings
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 应用启动时执行
-    await browser_manager.start_browser()
+    prefill_task = None
+    if settings.ASSET_CACHE_ENABLED:
+        await asset_cache.load()
+        if settings.ASSET_CACHE_PREFILL:
+            # 后台预热提示词允许使用的字体，不阻塞启动
+            prefill_task = asyncio.create_task(asset_cache.prefill(prompt_font_css_urls()))
+    if settings.RESULT_CACHE_ENABLED:
+        await result_cache.load()
+    await artifact_store.start()
+    if settings.RETENTION_ENABLED:
+        await retention.start()
+    await ai_clients.start()
+    await prompt_cache.start(ai_clients.chat("plan"))
+    await render_farm.start()
+    await job_manager.start()
     yield
     # 应用关闭时执行
-    await browser_manager.close_browser()
+    if prefill_task:
+        prefill_task.cancel()
+    await job_manager.close()
+    # 把尚未落盘的产物写完再退出
+    await artifact_store.close()
+    if settings.RETENTION_ENABLED:
+        await retention.close()
+    image_variants.close()
+    await render_farm.close()
+    await image_ingest.close()
+    await ai_clients.close()
+    if settings.ASSET_CACHE_ENABLED:
+        await asset_cache.close()
 
 app = FastAPI(title="AI Poster Generator", lifespan=lifespan)
 
@@ -28,12 +68,47 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-# 挂载静态文件目录，用于访问生成的海报图片
-app.mount("/static", StaticFiles(directory="generated_content"), name="static")
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    # 准入控制拒绝：返回 429/503，并通过 Retry-After 提示客户端退避
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request: Request, exc: CircuitOpen):
+    # AI 服务商熔断中：快速失败，提示客户端熔断结束后再试
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+# 挂载静态文件目录，用于访问生成的海报图片；访问存储目录下的文件会记录访问时间（LRU 保留策略）
+app.mount(
+    "/static",
+    TrackingStaticFiles(
+        directory="generated_content",
+        retention=retention,
+        store_prefix=os.path.relpath(settings.STORAGE_LOCAL_DIR, "generated_content").replace(os.sep, "/"),
+    ),
+    name="static",
+)
 
 # 注册路由
 app.include_router(poster.router, prefix="/api")
+app.include_router(posters.router, prefix="/api", tags=["Posters"])
+app.include_router(jobs.router, prefix="/api", tags=["Jobs"])
+app.include_router(batch.router, prefix="/api", tags=["Batches"])
 app.include_router(auth.router, prefix="/api", tags=["Authentication"]) # 注册 auth 路由
+app.include_router(ops.router, prefix="/api", tags=["Ops"])
+app.include_router(metrics.router, tags=["Ops"])  # Prometheus 抓取地址: /metrics
 
 @app.get("/")
 def root():
@@ -0,0 +1,18 @@
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+from app.schemas.poster import OutputOptions
+
+class BatchItem(BaseModel):
+    prompt: str
+    # 同时指定宽高时覆盖 prompt 中的尺寸描述；prompt 相同、只是尺寸不同的海报共用一次规划
+    width: int | None = Field(None, ge=16, le=4096)
+    height: int | None = Field(None, ge=16, le=4096)
+    output: OutputOptions | None = None  # 为空时只输出原尺寸 JPEG
+
+class BatchRequest(BaseModel):
+    items: list[BatchItem] = Field(min_length=1, max_length=100)
+    no_cache: bool = False  # True 时不使用结果缓存，强制重新生成
+    # manifest：全部完成后返回 JSON 清单（产物访问地址）；zip：以 ZIP 流式返回，每完成一张写入一张
+    response: Literal["manifest", "zip"] = "manifest"
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    events_url: str
+
+class JobStatus(BaseModel):
+    id: str
+    prompt: str
+    status: str  # queued / running / succeeded / failed
+    stage: str | None = None  # 最近完成的阶段：planned / images_ready / html_ready / rendered / stored
+    stages: dict[str, float] = {}  # 各阶段完成时距开始执行的秒数
+    error: str | None = None
+    result: dict | None = None
+    created_at: float
+    updated_at: float
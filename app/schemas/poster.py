@@ -1,7 +1,25 @@
-from pydantic import BaseModel
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field
+
+class OutputOptions(BaseModel):
+    """输出协商：格式、质量与一组宽度，全部由同一张截图派生。"""
+    format: Literal["jpeg", "png", "webp", "avif"] = "jpeg"
+    quality: int = Field(85, ge=1, le=100)  # PNG 无损，忽略该值
+    # 需要的宽度（像素），超过原图宽度时按原图输出；为空时只输出原尺寸。同步接口返回第一个宽度的图片
+    widths: list[Annotated[int, Field(ge=16, le=4096)]] = Field(default_factory=list, max_length=8)
 
 class GenerateRequest(BaseModel):
     prompt: str
+    no_cache: bool = False  # True 时不使用结果缓存，强制重新生成
+    output: OutputOptions | None = None  # 为空时返回原尺寸 JPEG
+    # "inline"：响应体为图片；"redirect"：303 跳转到保存的产物地址，不经应用传输图片内容
+    delivery: Literal["inline", "redirect"] = "inline"
+
+class EditRequest(BaseModel):
+    instruction: str = Field(min_length=1, max_length=500)  # 修改要求，如“标题改成『限时五折』，主色换成蓝色”
+    output: OutputOptions | None = None  # 为空时返回原尺寸 JPEG
+    delivery: Literal["inline", "redirect"] = "inline"  # 同 GenerateRequest.delivery
 
 class GenerateResponse(BaseModel):
     url: str
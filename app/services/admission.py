@@ -0,0 +1,257 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+from app.core.config import settings
+from app.core.telemetry import metrics
+from app.services.hedging import LatencyTracker
+from app.services.scheduler import TIERS, FairQueue, current_tier, tier_weights
+
+stage_wait = metrics.histogram(
+    "poster_stage_wait_seconds", "各阶段并发闸门前的排队耗时，按用户等级区分", ("stage", "tier")
+)
+request_duration = metrics.histogram(
+    "poster_request_duration_seconds", "生成请求的端到端耗时（异步任务含排队），按用户等级区分", ("tier",)
+)
+slo_requests = metrics.counter(
+    "poster_slo_requests_total", "生成请求是否在所属等级的耗时目标内完成（outcome: met / missed）", ("tier", "outcome")
+)
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝，由全局异常处理转换为 429/503 响应。"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class _Ewma:
+    """指数滑动平均，用于估算等待与处理耗时。"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.value = 0.0
+
+    def add(self, sample: float):
+        self.value = sample if not self.value else self.alpha * sample + (1 - self.alpha) * self.value
+
+
+class StageLimiter:
+    """
+    单个阶段（chat / image / render）的并发闸门：
+    固定并发 + 有界等待队列；队列已满立即拒绝，等待超时同样拒绝。
+    名额空出时按用户等级加权公平地放行等待者（见 FairQueue），排队过久的等待者优先，
+    因此 chat / image（对外的模型调用）与 render 阶段在高负载下既优先付费流量，也不会饿死免费流量。
+    """
+
+    def __init__(self, name: str, concurrency: int, max_waiting: int, wait_timeout: float, aging: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._free = self.concurrency
+        self._waiters: FairQueue[asyncio.Future] = FairQueue(name, tier_weights(), aging)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.wait_time = _Ewma()
+        self.max_wait_time = 0.0
+        self.service_time = _Ewma()
+
+    def retry_after(self) -> int:
+        """按当前排队长度与平均处理耗时估算多久后重试。"""
+        batches = (self.waiting + self.active) / self.concurrency
+        return max(1, math.ceil(batches * (self.service_time.value or 1.0)))
+
+    async def _acquire(self, tier: str):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.put(tier, waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=self.wait_timeout)
+        except BaseException:
+            if not self._waiters.remove(tier, waiter) and waiter.done() and not waiter.cancelled():
+                # 名额已经交给了本次等待，但调用方被取消，转交给下一个等待者
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, waiter = self._waiters.pop()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._free += 1
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.active >= self.concurrency and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise AdmissionRejected(503, f"{self.name} 阶段繁忙，排队已满", self.retry_after())
+
+        tier = current_tier()
+        self.waiting += 1
+        wait_start = time.monotonic()
+        try:
+            await self._acquire(tier)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise AdmissionRejected(503, f"{self.name} 阶段排队超时", self.retry_after())
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - wait_start
+        stage_wait.observe(waited, stage=self.name, tier=tier)
+        self.wait_time.add(waited)
+        self.max_wait_time = max(self.max_wait_time, waited)
+
+        self.active += 1
+        service_start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.service_time.add(time.monotonic() - service_start)
+            self.active -= 1
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_time.value * 1000, 1),
+            "max_wait_ms": round(self.max_wait_time * 1000, 1),
+            "avg_service_ms": round(self.service_time.value * 1000, 1),
+            "aged": self._waiters.aged,
+            "tiers": self._waiters.stats(),
+        }
+
+
+class AdmissionController:
+    """
+    生成流水线的准入控制：
+    - 请求级：全局在途请求上限（超出返回 503）与按用户的并发配额（超出返回 429）；
+    - 阶段级：chat / image / render 各自独立的并发闸门与有界等待队列，按用户等级调度。
+
+    请求的等级由调用方通过 scheduler.priority(tier) 设置在上下文中；
+    每个等级的端到端耗时与 SLO（PRIORITY_*_SLO_SECONDS）达成情况单独统计。
+    """
+
+    def __init__(self, max_in_flight: int, user_max_concurrent: int, stages: dict[str, StageLimiter]):
+        self.max_in_flight = max_in_flight
+        self.user_max_concurrent = user_max_concurrent
+        self.stages = stages
+        self.in_flight = 0
+        self.rejected = 0
+        self._users: dict[str, int] = {}
+        self.request_time = _Ewma()
+        self._latency = {tier: LatencyTracker(settings.PRIORITY_LATENCY_WINDOW) for tier in TIERS}
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.request_time.value or 1.0))
+
+    def acquire_user(self, user_id: str):
+        """占用一个用户配额，超出配额时抛出 429。"""
+        if self._users.get(user_id, 0) >= self.user_max_concurrent:
+            self.rejected += 1
+            raise AdmissionRejected(429, "当前用户的生成请求过多，请稍后再试", self._retry_after())
+        self._users[user_id] = self._users.get(user_id, 0) + 1
+
+    def release_user(self, user_id: str):
+        remaining = self._users.get(user_id, 0) - 1
+        if remaining > 0:
+            self._users[user_id] = remaining
+        else:
+            self._users.pop(user_id, None)
+
+    def record_latency(self, tier: str, seconds: float):
+        """记录一次请求的端到端耗时，并与该等级的耗时目标比较。"""
+        slo = settings.PRIORITY_PAID_SLO_SECONDS if tier == "paid" else settings.PRIORITY_FREE_SLO_SECONDS
+        request_duration.observe(seconds, tier=tier)
+        slo_requests.inc(tier=tier, outcome="met" if seconds <= slo else "missed")
+        self._latency[tier].add(seconds)
+
+    def latency_p95(self, tier: str) -> float | None:
+        return self._latency[tier].quantile(0.95)
+
+    @asynccontextmanager
+    async def request(self, user_id: str):
+        """一次生成请求的准入：先检查全局容量，再占用用户配额。耗时按进入时上下文中的等级统计。"""
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise AdmissionRejected(503, "服务繁忙，请稍后再试", self._retry_after())
+        self.acquire_user(user_id)
+        self.in_flight += 1
+        tier = current_tier()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self.request_time.add(elapsed)
+            self.record_latency(tier, elapsed)
+            self.in_flight -= 1
+            self.release_user(user_id)
+
+    def stage(self, name: str):
+        """进入某个阶段的并发闸门：async with admission.stage("chat"): ..."""
+        return self.stages[name].slot()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "rejected": self.rejected,
+            "active_users": len(self._users),
+            "avg_request_ms": round(self.request_time.value * 1000, 1),
+            "queue_depth": sum(stage.waiting for stage in self.stages.values()),
+            "stages": {name: stage.stats() for name, stage in self.stages.items()},
+            "tiers": {
+                tier: {
+                    "requests": len(self._latency[tier]),
+                    "p95_ms": round((self.latency_p95(tier) or 0.0) * 1000, 1),
+                }
+                for tier in TIERS
+            },
+        }
+
+
+# 全局准入控制器
+admission = AdmissionController(
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    user_max_concurrent=settings.ADMISSION_USER_MAX_CONCURRENT,
+    stages={
+        name: StageLimiter(
+            name,
+            concurrency,
+            settings.ADMISSION_STAGE_MAX_WAITING,
+            settings.ADMISSION_STAGE_WAIT_TIMEOUT,
+            settings.PRIORITY_AGING_SECONDS,
+        )
+        for name, concurrency in (
+            ("chat", settings.ADMISSION_CHAT_CONCURRENCY),
+            ("image", settings.ADMISSION_IMAGE_CONCURRENCY),
+            ("render", settings.ADMISSION_RENDER_CONCURRENCY),
+        )
+    },
+)
+
+metrics.gauge("poster_requests_in_flight", "正在处理的生成请求数", callback=lambda: admission.in_flight)
+metrics.gauge(
+    "poster_stage_queue_depth", "各阶段并发闸门前排队的调用数", ("stage",),
+    callback=lambda: {(name,): stage.waiting for name, stage in admission.stages.items()},
+)
+metrics.gauge(
+    "poster_stage_active", "各阶段正在执行的调用数", ("stage",),
+    callback=lambda: {(name,): stage.active for name, stage in admission.stages.items()},
+)
+metrics.gauge(
+    "poster_request_p95_seconds", "最近 PRIORITY_LATENCY_WINDOW 个请求的 p95 端到端耗时，按用户等级区分", ("tier",),
+    callback=lambda: {(tier,): admission.latency_p95(tier) or 0.0 for tier in TIERS},
+)
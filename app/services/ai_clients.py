@@ -0,0 +1,158 @@
+import importlib.util
+from urllib.parse import urlsplit
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.core.telemetry import metrics
+
+# 安装了 h2 时才能启用 HTTP/2
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+provider_requests = metrics.counter(
+    "poster_provider_requests_total", "发往 AI 服务商的 HTTP 请求数（含重试）", ("provider",)
+)
+provider_errors = metrics.counter(
+    "poster_provider_errors_total", "AI 服务商请求失败次数（HTTP 错误码或网络异常）", ("provider", "kind")
+)
+
+
+def provider_name(base_url: str) -> str:
+    """服务商标识（用于指标、熔断器与对冲统计）：base_url 的 host:port。"""
+    return urlsplit(base_url).netloc
+
+
+def stage_timeout(stage: str) -> float:
+    """各阶段单次调用的超时时间（秒）。"""
+    return {
+        "plan": settings.AI_PLAN_TIMEOUT,
+        "html": settings.AI_HTML_TIMEOUT,
+        "image": settings.AI_IMAGE_TIMEOUT,
+    }[stage]
+
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    """在连接池之上统计在途请求数，用于观察连接池是否饱和。"""
+
+    def __init__(self, provider: str, max_connections: int, **kwargs):
+        super().__init__(**kwargs)
+        self.provider = provider
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.saturated = 0  # 发起请求时在途数已达连接上限的次数（需要排队等连接）
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        provider_requests.inc(provider=self.provider)
+        if self.in_flight >= self.max_connections:
+            self.saturated += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            response = await super().handle_async_request(request)
+        except Exception as e:
+            provider_errors.inc(provider=self.provider, kind=type(e).__name__)
+            raise
+        finally:
+            self.in_flight -= 1
+        if response.status_code >= 400:
+            provider_errors.inc(provider=self.provider, kind=str(response.status_code))
+        return response
+
+    def stats(self) -> dict:
+        connections = getattr(getattr(self, "_pool", None), "connections", [])
+        return {
+            "max_connections": self.max_connections,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "saturated": self.saturated,
+        }
+
+
+class AIClientRegistry:
+    """
+    应用级的 AI 客户端注册表。
+
+    按 (base_url, api_key) 复用 AsyncOpenAI 客户端及其底层 httpx 连接池，
+    保持长连接（可用时启用 HTTP/2），避免每次调用都重新 TLS 握手。
+    """
+
+    def __init__(self, max_connections: int, max_keepalive: int, keepalive_expiry: float, http2: bool):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._clients: dict[tuple[str, str], tuple[AsyncOpenAI, _CountingTransport]] = {}
+
+    def get(self, base_url: str, api_key: str) -> AsyncOpenAI:
+        key = (base_url, api_key)
+        if key not in self._clients:
+            transport = _CountingTransport(
+                provider=provider_name(base_url),
+                max_connections=self.max_connections,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+            http_client = httpx.AsyncClient(transport=transport, follow_redirects=True)
+            # 重试由 resilience 统一处理（退避、重试预算与熔断），关闭 SDK 自带的重试
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+            self._clients[key] = (client, transport)
+            print(f"已创建 AI 客户端连接池: {base_url} (HTTP/2: {self.http2})")
+        return self._clients[key][0]
+
+    def chat(self, stage: str) -> AsyncOpenAI:
+        """获取聊天模型客户端，stage 为 "plan" 或 "html"，决定该阶段的超时时间。"""
+        client = self.get(settings.AI_CHAT_BASE_URL, settings.AI_CHAT_API_KEY)
+        return client.with_options(timeout=stage_timeout(stage))
+
+    def image(self) -> AsyncOpenAI:
+        """获取生图模型客户端。"""
+        client = self.get(settings.AI_IMAGE_BASE_URL, settings.AI_IMAGE_API_KEY)
+        return client.with_options(timeout=settings.AI_IMAGE_TIMEOUT)
+
+    def image_secondary(self) -> AsyncOpenAI | None:
+        """获取备用生图服务的客户端，未配置时返回 None。"""
+        if not settings.AI_IMAGE_SECONDARY_BASE_URL:
+            return None
+        client = self.get(settings.AI_IMAGE_SECONDARY_BASE_URL, settings.AI_IMAGE_SECONDARY_API_KEY)
+        return client.with_options(timeout=settings.AI_IMAGE_TIMEOUT)
+
+    async def start(self):
+        """在应用启动时调用，预先创建聊天与生图客户端。"""
+        self.get(settings.AI_CHAT_BASE_URL, settings.AI_CHAT_API_KEY)
+        self.get(settings.AI_IMAGE_BASE_URL, settings.AI_IMAGE_API_KEY)
+        self.image_secondary()
+
+    async def close(self):
+        """在应用关闭时调用，关闭所有连接池。"""
+        clients, self._clients = self._clients, {}
+        for client, _ in clients.values():
+            try:
+                await client.close()
+            except Exception as e:
+                print(f"关闭 AI 客户端时出错: {e}")
+
+    def stats(self) -> list[dict]:
+        return [
+            {"base_url": base_url, **transport.stats()}
+            for (base_url, _), (_, transport) in self._clients.items()
+        ]
+
+
+# 全局 AI 客户端注册表
+ai_clients = AIClientRegistry(
+    max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+    max_keepalive=settings.AI_HTTP_MAX_KEEPALIVE,
+    keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+    http2=settings.AI_HTTP2,
+)
@@ -1,14 +1,37 @@
-from app.services.generator.planner import plan_image_generation
-from app.services.generator.painter import generate_images_from_ai
-from app.services.generator.coder import generate_html_code
+from app.services.generator.planner import plan_image_generation, stream_image_prompts
+from app.services.generator.painter import generate_images_from_ai, generate_images_from_stream
+from app.services.generator.coder import generate_html_code, generate_html_from_template, html_generations
 from app.utils.extract_dimensions import extract_dimensions
 from app.core.config import settings
-import time
+from app.services.renderer.image_ingest import image_ingest
+from app.services.admission import AdmissionRejected
+from app.services.resilience import CircuitOpen, DeadlineExceeded
+from app.core.telemetry import span
+from dataclasses import dataclass
+from typing import Awaitable, Callable
 import asyncio
 
-async def generate_html_from_ai(prompt: str) -> tuple[str, int, int, list[str]]:
+@dataclass
+class SharedGeneration:
+    """批量生成时多张海报共用的规划与生图：plan 返回（共享的）图片描述，generate_images 负责（跨海报去重的）生图。"""
+    plan: Callable[[], Awaitable[list[str]]]
+    generate_images: Callable[[list[str]], Awaitable[list[str]]]
+
+async def generate_html_from_ai(
+    prompt: str,
+    on_head: Callable[[str, int, int], None] | None = None,
+    on_stage: Callable[[str], Awaitable[None]] | None = None,
+    shared: SharedGeneration | None = None,
+) -> tuple[str, int, int, list[str]]:
     """
     重构后的主函数，采用四步法生成海报：提取尺寸 -> 规划 -> 生成图片 -> 生成HTML。
+    HTML 的 <head> 一生成就调用 on_head(head, width, height)（用于提前在预渲染页面中加载字体）；
+    各阶段耗时以 span 记录（plan / images / image / ingest / html / html_ttft / inject）；
+    on_stage 在各阶段完成时被调用（"planned" / "images_ready" / "html_ready"）。
+    PLAN_MODE=streaming 时规划流式返回，每个图片描述一完整就开始生图；规划开头声明图片数量（image_count）时
+    完整 HTML 生成随即按该数量预留占位符开始，没有声明时在规划完成后开始。规划出的图片多于声明数量时按实际数量重新生成 HTML，
+    不丢弃任何描述；少于声明数量时多出的占位符复用最后一张图片。模板模式的请求需要图片描述，仍在规划完成后开始。
+    传入 shared 时（批量生成）规划与生图由调用方共享，不再单独调用。
     返回: (html_content, width, height, image_urls)
     """
     print(f"向 AI 发送总任务 prompt: {prompt}")
@@ -22,60 +45,172 @@ async def generate_html_from_ai(prompt: str) -> tuple[str, int, int, list[str]]:
         width, height = extract_dimensions(prompt)
 
         # 2. 规划图片生成
-        if settings.SKIP_PLANNING:
-            print("  [DEBUG] 跳过规划，直接使用原始提示词作为图片描述")
-            image_prompts = [prompt]
+        streaming = (
+            shared is None
+            and settings.PLAN_MODE == "streaming"
+            and not settings.SKIP_PLANNING
+            and not settings.SKIP_IMAGE_GENERATION
+        )
+        if streaming:
+            # 规划与生图一起进行；planned_prompts 把规划出的描述逐个追加到 image_prompts，规划结束时 plan_done 完成。
+            # image_count 在规划声明图片数量时完成，规划没有声明时在规划结束时以实际数量完成
+            image_prompts: list[str] = []
+            loop = asyncio.get_running_loop()
+            plan_done = loop.create_future()
+            image_count = loop.create_future()
+            for future in (plan_done, image_count):
+                # 规划失败时 HTML 生成可能已经结束、不再等待，标记异常已读取
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
         else:
-            plan_start = time.time()
-            plan = await plan_image_generation(prompt)
-            image_prompts = plan.get("image_prompts", [prompt])
-            print(f"  [AI Detail] 图片规划耗时: {time.time() - plan_start:.2f}秒")
+            if settings.SKIP_PLANNING:
+                print("  [DEBUG] 跳过规划，直接使用原始提示词作为图片描述")
+                image_prompts = [prompt]
+            elif shared:
+                with span("plan", mode="shared") as s:
+                    image_prompts = await shared.plan()
+                    s.set(images=len(image_prompts))
+            else:
+                with span("plan") as s:
+                    plan = await plan_image_generation(prompt)
+                    image_prompts = plan.get("image_prompts", [prompt])
+                    s.set(images=len(image_prompts))
+            if on_stage:
+                await on_stage("planned")
+
+        def count_declared(count: int):
+            if not image_count.done():
+                image_count.set_result(count)
+
+        async def planned_prompts():
+            try:
+                with span("plan", mode="streaming") as s:
+                    async for image_prompt in stream_image_prompts(prompt, on_count=count_declared):
+                        image_prompts.append(image_prompt)
+                        yield image_prompt
+                    s.set(images=len(image_prompts))
+            except BaseException as e:
+                # 规划失败或被取消时，等待规划的 HTML 生成随之结束
+                for future in (image_count, plan_done):
+                    if not future.done():
+                        if isinstance(e, Exception):
+                            future.set_exception(e)
+                        else:
+                            future.cancel()
+                raise
+            plan_done.set_result(None)
+            count_declared(len(image_prompts))
+            if on_stage:
+                await on_stage("planned")
 
         # 3 & 4. 并行执行：生成图片 和 生成 HTML
-        # 为了并行，我们需要先定义 HTML 生成时使用的临时图片占位符
-        temp_image_urls = [f"https://temp-image-placeholder.local/{i}.png" for i in range(len(image_prompts))]
+        # 为了并行，我们需要先定义 HTML 生成时使用的临时图片占位符（流式规划时在图片数量确定后填入）
+        def placeholders(count: int) -> list[str]:
+            return [f"https://temp-image-placeholder.local/{i}.png" for i in range(count)]
+
+        temp_image_urls = [] if streaming else placeholders(len(image_prompts))
         
         async def task_generate_images():
             if settings.SKIP_IMAGE_GENERATION:
                 print("  [DEBUG] 跳过生图，生成占位图 URL")
                 # 生成带尺寸和序号的占位图，方便前端查看布局
-                return [f"https://placehold.co/{width}x{height}/png?text=Image+{i+1}" for i in range(len(image_prompts))]
+                urls = [f"https://placehold.co/{width}x{height}/png?text=Image+{i+1}" for i in range(len(image_prompts))]
+            elif streaming:
+                with span("images"):
+                    urls = await generate_images_from_stream(planned_prompts())
+            elif shared:
+                with span("images", mode="shared"):
+                    urls = await shared.generate_images(image_prompts)
             else:
-                t_start = time.time()
-                urls = await generate_images_from_ai(image_prompts)
-                print(f"  [AI Detail] 图片生成耗时: {time.time() - t_start:.2f}秒")
-                return urls
+                with span("images"):
+                    urls = await generate_images_from_ai(image_prompts)
+            if not settings.SKIP_IMAGE_GENERATION:
+                # 与 HTML 生成并行：等下载完成并缩小到海报尺寸，渲染时页面直接从内存取图
+                with span("ingest"):
+                    await image_ingest.prepare(urls, width, height)
+            if on_stage:
+                await on_stage("images_ready")
+            return urls
 
         async def task_generate_html():
+            html = await _generate_html()
+            if on_stage:
+                await on_stage("html_ready")
+            return html
+
+        async def _generate_html():
             if settings.SKIP_HTML_GENERATION:
                 print("  [DEBUG] 跳过 HTML 生成，返回简单测试页面")
                 return f"<html><body style='background:#f0f0f0; display:flex; justify-content:center; align-items:center; height:100vh;'><h1>DEBUG MODE</h1><p>Prompt: {prompt}</p></body></html>"
-            else:
-                print("  [并行任务] 开始生成 HTML (使用占位符)...")
-                t_start = time.time()
-                # 使用临时占位符 URL 生成 HTML
-                html = await generate_html_code(prompt, temp_image_urls, width, height)
-                print(f"  [AI Detail] HTML 代码生成耗时: {time.time() - t_start:.2f}秒")
-                return html
+            if not streaming:
+                return await _generate_html_with_placeholders()
+            with span("html.wait_plan") as s:
+                # 完整 HTML 生成只需要图片数量，规划声明后立即开始；
+                # 模板请求很短且需要图片描述，生图仍在进行时它不在关键路径上，等规划完成再开始
+                count = await image_count
+                if settings.HTML_MODE == "template":
+                    await plan_done
+                    count = len(image_prompts)
+                s.set(images=count)
+            temp_image_urls.extend(placeholders(count))
+            html = await _generate_html_with_placeholders()
+            await plan_done
+            if len(image_prompts) > len(temp_image_urls):
+                # 规划出的图片多于声明的数量：HTML 中没有多出图片的位置，按实际数量重新生成
+                print(f"⚠️ [警告] 规划出 {len(image_prompts)} 张图片，多于声明的 {len(temp_image_urls)} 张，重新生成 HTML")
+                temp_image_urls.extend(placeholders(len(image_prompts))[len(temp_image_urls):])
+                html = await _generate_html_with_placeholders()
+            return html
+
+        async def _generate_html_with_placeholders():
+            print("  [并行任务] 开始生成 HTML (使用占位符)...")
+            # 使用临时占位符 URL 生成 HTML
+            head_ready = (lambda head: on_head(head, width, height)) if on_head else None
+            with span("html") as s:
+                if settings.HTML_MODE == "template":
+                    try:
+                        html = await generate_html_from_template(
+                            prompt, temp_image_urls, image_prompts, width, height, on_head=head_ready
+                        )
+                        html_generations.inc(mode="template")
+                        s.set(mode="template")
+                        return html
+                    except (AdmissionRejected, CircuitOpen, DeadlineExceeded):
+                        raise
+                    except Exception as e:
+                        # 版式数据不可用时回退到完整 HTML 生成
+                        print(f"⚠️ [警告] 模板模式失败，回退到完整 HTML 生成: {e}")
+                        html_generations.inc(mode="fallback")
+                        s.set(mode="fallback")
+                else:
+                    html_generations.inc(mode="llm")
+                    s.set(mode="llm")
+                return await generate_html_code(prompt, temp_image_urls, width, height, on_head=head_ready)
 
         print("启动并行任务：图片生成 & HTML生成...")
-        parallel_start = time.time()
         
         # 并发执行
-        image_urls, clean_html = await asyncio.gather(task_generate_images(), task_generate_html())
-        
-        print(f"  [AI Detail] 并行阶段总耗时: {time.time() - parallel_start:.2f}秒")
+        with span("parallel"):
+            image_urls, clean_html = await asyncio.gather(task_generate_images(), task_generate_html())
 
         # 5. 拼接：将 HTML 中的占位符替换为真实图片 URL
         if not settings.SKIP_HTML_GENERATION:
             print("正在将真实图片 URL 注入 HTML...")
-            for temp_url, real_url in zip(temp_image_urls, image_urls):
-                if temp_url not in clean_html:
-                    print(f"⚠️ [警告] 占位符 {temp_url} 未在 HTML 中找到，AI 可能篡改了 URL 格式，导致图片无法显示！")
-                clean_html = clean_html.replace(temp_url, real_url)
+            with span("inject") as s:
+                missing = 0
+                # 部分图片生成失败、成功的图片少于占位符时复用最后一张
+                real_urls = image_urls + image_urls[-1:] * (len(temp_image_urls) - len(image_urls))
+                for temp_url, real_url in zip(temp_image_urls, real_urls):
+                    if temp_url not in clean_html:
+                        missing += 1
+                        print(f"⚠️ [警告] 占位符 {temp_url} 未在 HTML 中找到，AI 可能篡改了 URL 格式，导致图片无法显示！")
+                    clean_html = clean_html.replace(temp_url, real_url)
+                s.set(missing=missing)
             
         return clean_html, width, height, image_urls
 
+    except (AdmissionRejected, CircuitOpen, DeadlineExceeded):
+        # 准入拒绝、服务熔断与超过截止时间交给接口层返回 429/503/504，而不是渲染错误海报
+        raise
     except Exception as e:
         print(f"调用 AI API 时发生错误: {e}")
         if "InvalidEndpointOrModel" in str(e):
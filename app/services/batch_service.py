@@ -0,0 +1,198 @@
+import asyncio
+import contextvars
+import re
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable
+
+from app.core.telemetry import metrics
+from app.services.admission import AdmissionRejected
+from app.services.ai_service import SharedGeneration
+from app.services.generator.painter import generate_images_from_ai
+from app.services.generator.planner import plan_image_generation
+from app.services.image_variants import VariantSpec
+from app.services.poster_pipeline import PosterResult, run_poster_pipeline
+from app.services.resilience import CircuitOpen, DeadlineExceeded
+from app.services.result_cache import normalize_prompt
+
+# prompt 中描述尺寸的部分：1920x1080、800*600、16:9、横版 / 竖版
+_SIZE_PATTERN = re.compile(r"\d+\s*[x*×:]\s*\d+|横版|竖版")
+
+batch_items = metrics.counter(
+    "poster_batch_items_total", "批量生成的海报数，按结果分类（generated / cached / error）", ("outcome",)
+)
+batch_shared = metrics.counter(
+    "poster_batch_shared_total", "批量生成中复用的规划与图片数（kind: plan / image）", ("kind",)
+)
+batch_throughput = metrics.gauge(
+    "poster_batch_posters_per_minute", "最近一次批量生成的吞吐（张 / 分钟）"
+)
+
+
+def with_size(prompt: str, width: int | None, height: int | None) -> str:
+    """指定了尺寸时，去掉 prompt 中原有的尺寸描述并追加 WxH（extract_dimensions 会读取它）。"""
+    if not width or not height:
+        return prompt
+    base = re.sub(r"\d+\s*[x*×]\s*\d+|横版", "", prompt).strip()
+    return f"{base} {width}x{height}"
+
+
+def plan_key(prompt: str) -> str:
+    """去掉尺寸描述后的归一化 prompt：只有尺寸不同的海报共用一次规划。"""
+    return normalize_prompt(_SIZE_PATTERN.sub(" ", prompt))
+
+
+@dataclass
+class BatchEntry:
+    index: int
+    prompt: str
+    variants: list[VariantSpec]
+
+
+@dataclass
+class BatchItemResult:
+    entry: BatchEntry
+    result: PosterResult | None = None
+    error: str | None = None
+    seconds: float = 0.0
+
+
+class BatchRun:
+    """
+    一次批量生成：同一批中 prompt 相同（只是尺寸不同）的海报共用一次规划，
+    相同的图片描述在整批中只生成一次；HTML 生成与渲染最多同时进行 concurrency 张。
+    共享的规划与生图不属于某一张海报，在批次自己的上下文中执行，不受单张海报截止时间的影响；
+    每张海报的生成也从批次的上下文启动，继承创建批次时设置的用户等级。
+    """
+
+    def __init__(self, entries: list[BatchEntry], use_cache: bool, concurrency: int):
+        self.entries = entries
+        self.use_cache = use_cache
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._context = contextvars.copy_context()
+        self._plans: dict[str, asyncio.Task] = {}
+        self._images: dict[str, asyncio.Task] = {}
+        self._tasks: list[asyncio.Task] = []
+        self.plans_shared = 0
+        self.images_shared = 0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self.succeeded = 0
+        self.failed = 0
+
+    def _shared_task(self, tasks: dict[str, asyncio.Task], key: str, factory: Callable[[], Awaitable]) -> tuple[asyncio.Task, bool]:
+        if key in tasks:
+            return tasks[key], True
+        tasks[key] = self._context.run(asyncio.create_task, factory())
+        return tasks[key], False
+
+    def _shared_generation(self, prompt: str) -> SharedGeneration:
+        base = _SIZE_PATTERN.sub(" ", prompt).strip() or prompt
+
+        async def plan() -> list[str]:
+            task, reused = self._shared_task(self._plans, plan_key(prompt), lambda: plan_image_generation(base))
+            if reused:
+                self.plans_shared += 1
+                batch_shared.inc(kind="plan")
+            plan = await asyncio.shield(task)
+            return plan.get("image_prompts", [base])
+
+        async def generate_images(image_prompts: list[str]) -> list[str]:
+            tasks = []
+            for image_prompt in image_prompts:
+                task, reused = self._shared_task(
+                    self._images, image_prompt, lambda p=image_prompt: generate_images_from_ai([p])
+                )
+                if reused:
+                    self.images_shared += 1
+                    batch_shared.inc(kind="image")
+                tasks.append(asyncio.shield(task))
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for error in results:
+                if isinstance(error, (AdmissionRejected, CircuitOpen, DeadlineExceeded)):
+                    raise error
+            urls = [result[0] for result in results if isinstance(result, list) and result]
+            if not urls:
+                raise Exception("所有图片生成均失败。")
+            return urls
+
+        return SharedGeneration(plan=plan, generate_images=generate_images)
+
+    async def _run_entry(self, entry: BatchEntry) -> BatchItemResult:
+        async with self._slots:
+            start = time.monotonic()
+            item = BatchItemResult(entry)
+            try:
+                item.result = await run_poster_pipeline(
+                    entry.prompt,
+                    use_cache=self.use_cache,
+                    variants=entry.variants,
+                    shared_generation=self._shared_generation(entry.prompt),
+                )
+                self.succeeded += 1
+                batch_items.inc(outcome="cached" if item.result.cached else "generated")
+            except Exception as e:
+                # 单张失败不影响整批，错误记录在清单中
+                print(f"批量生成第 {entry.index + 1} 张海报失败: {e}")
+                item.error = str(e)
+                self.failed += 1
+                batch_items.inc(outcome="error")
+            item.seconds = time.monotonic() - start
+            return item
+
+    async def results(self) -> AsyncIterator[BatchItemResult]:
+        """按完成顺序逐张产出结果；中途停止迭代时取消尚未完成的生成。"""
+        self.started_at = time.monotonic()
+        self._tasks = [self._context.run(asyncio.create_task, self._run_entry(entry)) for entry in self.entries]
+        try:
+            for next_done in asyncio.as_completed(self._tasks):
+                yield await next_done
+        finally:
+            self.finished_at = time.monotonic()
+            await self.close()
+            batch_throughput.set(self.posters_per_minute())
+            print(f"批量生成完成: {self.succeeded} 张成功，{self.failed} 张失败，{self.posters_per_minute():.1f} 张/分钟")
+
+    async def close(self):
+        tasks = self._tasks + list(self._plans.values()) + list(self._images.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def posters_per_minute(self) -> float:
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return self.succeeded * 60 / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "items": len(self.entries),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "plans": len(self._plans),
+            "plans_shared": self.plans_shared,
+            "images": len(self._images),
+            "images_shared": self.images_shared,
+            "elapsed_seconds": round((self.finished_at or time.monotonic()) - self.started_at, 2),
+            "posters_per_minute": round(self.posters_per_minute(), 2),
+        }
+
+
+def describe_item(item: BatchItemResult) -> dict:
+    """批量清单中的一项：海报 id、对象键与访问地址，失败时为错误信息。"""
+    entry = {"index": item.entry.index, "prompt": item.entry.prompt, "seconds": round(item.seconds, 2)}
+    if item.result is None:
+        return {**entry, "status": "failed", "error": item.error}
+    result = item.result
+    return {
+        **entry,
+        "status": "succeeded",
+        "width": result.width,
+        "height": result.height,
+        "poster_id": result.poster_id,
+        "image_key": result.image_key,
+        "cached": result.cached,
+        # 存储不能直接访问时，通过海报图片接口下载
+        "url": result.image_url or f"/api/posters/{result.poster_id}/image",
+        "variants": [variant.describe(result.poster_id) for variant in result.variants],
+    }
+
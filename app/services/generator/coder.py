@@ -1,41 +1,199 @@
-from openai import AsyncOpenAI
 from app.core.config import settings
-from app.core.prompts import SYSTEM_PROMPT, HTML_USER_PROMPT
+from app.services.ai_clients import ai_clients, provider_name, stage_timeout
+from app.services.admission import admission
+from app.services.resilience import resilience
+from app.services.generator.prompt_cache import PROMPTS, CompiledPrompt, prompt_cache
+from app.core.telemetry import metrics, record
+from app.services.generator.layouts import COMMON_HEAD, SlotError, render_layout
+from app.services.generator.planner import parse_plan
+from typing import Callable
+import json
 import re
+import time
 
-async def generate_html_code(prompt: str, image_urls: list[str], width: int, height: int) -> str:
+# 超过这个长度仍未出现 </head>，就放弃提前预渲染
+HEAD_SCAN_LIMIT = 64 * 1024
+# 模板模式下版式 JSON 的输出上限，远小于完整 HTML
+TEMPLATE_MAX_TOKENS = 800
+
+html_generations = metrics.counter(
+    "poster_html_generations_total", "HTML 生成次数，按方式分类（template / llm / fallback）", ("mode",)
+)
+
+class HeadScanner:
     """
-    生成 HTML 代码。
+    从流式输出中截取 HTML 开头（```html 之后）到 </head> 的部分。
+    每段只扫描新到的内容，加上上一段末尾可能被截断的标记，总耗时与输出长度成线性关系。
     """
-    client = AsyncOpenAI(
-        api_key=settings.AI_CHAT_API_KEY,
-        base_url=settings.AI_CHAT_BASE_URL,
-    )
-    
-    image_urls_str = "\n".join(image_urls)
-    html_prompt_content = HTML_USER_PROMPT.format(
-        width=width,
-        height=height,
-        image_urls_str=image_urls_str,
-        prompt=prompt
-    )
-    
-    response = await client.chat.completions.create(
-        model=settings.AI_CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": html_prompt_content},
-        ],
+
+    FENCE = "```html"
+    END = "</head>"
+
+    def __init__(self, limit: int = HEAD_SCAN_LIMIT):
+        self.limit = limit
+        self.done = False
+        self._parts: list[str] = []
+        self._length = 0
+        self._tail = ""  # 上一段末尾的小写内容，长度小于标记长度
+        self._start: int | None = None  # ```html 之后的位置
+
+    def feed(self, delta: str) -> str | None:
+        """追加一段输出，找到 </head> 时返回截取的 <head> 部分；找到或超过 limit 后不再扫描。"""
+        if self.done:
+            return None
+        self._parts.append(delta)
+        offset = self._length - len(self._tail)  # window 在完整输出中的起始位置
+        window = self._tail + delta.lower()
+        self._length += len(delta)
+        if self._start is None:
+            fence = window.find(self.FENCE)
+            if fence != -1:
+                self._start = offset + fence + len(self.FENCE)
+        end = window.find(self.END, max(0, (self._start or 0) - offset))
+        if end != -1:
+            self.done = True
+            text = "".join(self._parts)
+            self._parts = []
+            return text[self._start or 0:offset + end + len(self.END)].strip()
+        if self._length > self.limit:
+            self.done = True
+            self._parts = []
+            return None
+        self._tail = window[-(len(self.END) - 1):]
+        return None
+
+async def _stream_completion(
+    client, prompt: CompiledPrompt, messages: list[dict], on_head: Callable[[str], None] | None
+) -> str:
+    """流式获取补全内容；解析到 </head> 时立即回调 on_head，并记录首 token 耗时。"""
+    start = time.time()
+    stream = await prompt_cache.create(
+        client,
+        prompt,
+        messages,
+        stream=True,
         extra_body={
             "thinking": {"type": "disabled"}
         },
     )
-    html_content = response.choices[0].message.content
+    parts = []
+    ttft = None
+    scanner = HeadScanner() if on_head else None
+    async for chunk in stream:
+        if getattr(chunk, "usage", None):
+            prompt_cache.record_usage(prompt, chunk.usage)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if ttft is None:
+            ttft = time.time() - start
+            record("html_ttft", ttft)
+        parts.append(delta)
+        if scanner and not scanner.done:
+            head = scanner.feed(delta)
+            if head:
+                on_head(head)
+    return "".join(parts)
+
+async def generate_html_code(
+    prompt: str,
+    image_urls: list[str],
+    width: int,
+    height: int,
+    on_head: Callable[[str], None] | None = None,
+) -> str:
+    """
+    生成 HTML 代码。
+    开启 HTML_STREAMING 时以流式方式获取，<head> 生成完毕即通过 on_head 通知调用方，
+    首 token 耗时记录为 html_ttft。
+    """
+    client = ai_clients.chat("html")
+
+    messages = PROMPTS["html"].messages(
+        width=width,
+        height=height,
+        image_urls_str="\n".join(image_urls),
+        prompt=prompt,
+    )
+
+    async def complete() -> str:
+        if settings.HTML_STREAMING:
+            # 重试时从头重新流式获取；on_head 对同一个预渲染页面只生效一次
+            return await _stream_completion(client, PROMPTS["html"], messages, on_head)
+        response = await prompt_cache.create(
+            client,
+            PROMPTS["html"],
+            messages,
+            extra_body={
+                "thinking": {"type": "disabled"}
+            },
+        )
+        prompt_cache.record_usage(PROMPTS["html"], response.usage)
+        return response.choices[0].message.content
+
+    async with admission.stage("chat"):
+        html_content = await resilience.call(
+            provider_name(settings.AI_CHAT_BASE_URL), "html", complete, timeout=stage_timeout("html")
+        )
     print("成功从 AI 获取 HTML 内容。")
-    
+
     match = re.search(r"```html(.*)```", html_content, re.DOTALL)
     if match:
         clean_html = match.group(1).strip()
     else:
         clean_html = html_content.strip().replace("```html", "").replace("```", "")
-    return clean_html
\ No newline at end of file
+    return clean_html
+
+
+async def generate_html_from_template(
+    prompt: str,
+    image_urls: list[str],
+    image_prompts: list[str],
+    width: int,
+    height: int,
+    on_head: Callable[[str], None] | None = None,
+) -> str:
+    """
+    模板快速路径：模型只返回版式 id、文案与配色的小 JSON，由本地版式库填充成完整 HTML。
+    所有版式共用同一个 <head>，因此在请求模型之前就可以通知 on_head 开始预渲染。
+    返回的 JSON 无法使用时抛出 SlotError，由调用方回退到完整 HTML 模式。
+    """
+    client = ai_clients.chat("plan")
+    if on_head:
+        on_head(COMMON_HEAD)
+
+    messages = PROMPTS["template"].messages(
+        width=width,
+        height=height,
+        image_count=len(image_urls),
+        image_descriptions="\n".join(f"{i + 1}. {p}" for i, p in enumerate(image_prompts)),
+        prompt=prompt,
+    )
+
+    async def complete() -> str:
+        response = await prompt_cache.create(
+            client,
+            PROMPTS["template"],
+            messages,
+            max_tokens=TEMPLATE_MAX_TOKENS,
+            extra_body={
+                "thinking": {"type": "disabled"}
+            },
+        )
+        prompt_cache.record_usage(PROMPTS["template"], response.usage)
+        return response.choices[0].message.content or ""
+
+    async with admission.stage("chat"):
+        content = await resilience.call(
+            provider_name(settings.AI_CHAT_BASE_URL), "html", complete, timeout=stage_timeout("plan")
+        )
+
+    try:
+        # 与规划一样只解析第一个完整的 JSON 对象，后面附带的说明文字不影响解析
+        slots = parse_plan(content)
+    except json.JSONDecodeError as e:
+        raise SlotError(f"版式 JSON 解析失败: {e}")
+    print(f"成功从 AI 获取版式数据: {slots.get('layout')}")
+    return render_layout(slots, image_urls, width, height)
@@ -0,0 +1,97 @@
+from app.core.config import settings
+from app.services.ai_clients import ai_clients, provider_name, stage_timeout
+from app.services.admission import admission
+from app.services.resilience import resilience
+from app.services.generator.layouts import SLOT_KEYS, SlotError, extract_slots, render_layout
+from app.services.generator.planner import parse_plan
+from app.services.generator.prompt_cache import PROMPTS, CompiledPrompt, prompt_cache
+import json
+
+# 单次修改最多接受的替换数，超过时说明模型在重写页面
+MAX_HTML_EDITS = 20
+# 修改只输出补丁，远小于完整 HTML
+EDIT_MAX_TOKENS = 1200
+
+
+class EditError(ValueError):
+    """模型给出的修改无法应用（补丁无效、替换的片段在 HTML 中不存在等），接口返回 422。"""
+
+
+async def _request_patch(prompt: CompiledPrompt, **values) -> dict:
+    """请求模型给出 JSON 补丁；与模板模式一样使用规划阶段的超时。"""
+    client = ai_clients.chat("plan")
+    options = {"response_format": {"type": "json_object"}} if settings.AI_PLAN_JSON_MODE else {}
+
+    async def complete() -> str:
+        response = await prompt_cache.create(
+            client,
+            prompt,
+            prompt.messages(**values),
+            max_tokens=EDIT_MAX_TOKENS,
+            extra_body={
+                "thinking": {"type": "disabled"}
+            },
+            **options,
+        )
+        prompt_cache.record_usage(prompt, response.usage)
+        return response.choices[0].message.content or ""
+
+    async with admission.stage("chat"):
+        content = await resilience.call(
+            provider_name(settings.AI_CHAT_BASE_URL), "edit", complete, timeout=stage_timeout("plan")
+        )
+    try:
+        return parse_plan(content)
+    except json.JSONDecodeError as e:
+        raise EditError(f"修改内容解析失败: {e}")
+
+
+def apply_slot_patch(slots: dict, patch: dict) -> dict:
+    """合并版式数据补丁：只接受已知字段，palette 按颜色逐项合并。"""
+    merged = dict(slots)
+    for key, value in patch.items():
+        if key not in SLOT_KEYS:
+            continue
+        if key == "palette" and isinstance(value, dict):
+            merged["palette"] = {**(slots.get("palette") or {}), **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def apply_html_edits(html_content: str, edits) -> str:
+    """依次应用 find / replace 替换（每条只替换第一次出现）；片段不存在时抛出 EditError。"""
+    if not isinstance(edits, list) or not edits:
+        raise EditError("模型没有给出任何修改")
+    if len(edits) > MAX_HTML_EDITS:
+        raise EditError(f"修改过多（{len(edits)} 处），请重新生成海报")
+    for edit in edits:
+        find = edit.get("find") if isinstance(edit, dict) else None
+        replace = edit.get("replace") if isinstance(edit, dict) else None
+        if not isinstance(find, str) or not find or not isinstance(replace, str):
+            raise EditError(f"无效的修改: {edit!r}")
+        if find not in html_content:
+            raise EditError(f"要替换的片段不在 HTML 中: {find[:80]!r}")
+        html_content = html_content.replace(find, replace, 1)
+    return html_content
+
+
+async def edit_html(
+    html_content: str, image_urls: list[str], width: int, height: int, instruction: str
+) -> tuple[str, str]:
+    """
+    按修改要求增量修改海报 HTML，返回 (新 HTML, 修改方式)。
+    模板模式生成的页面带有版式数据：模型只给出版式数据补丁，在本地重新填充版式（"slots"）；
+    其余页面由模型给出 HTML 片段替换（"html"）。两种方式都不重新规划、不重新生图。
+    """
+    slots = extract_slots(html_content)
+    if slots is not None:
+        patch = await _request_patch(
+            PROMPTS["edit_slots"], slots=json.dumps(slots, ensure_ascii=False), instruction=instruction
+        )
+        try:
+            return render_layout(apply_slot_patch(slots, patch), image_urls, width, height), "slots"
+        except SlotError as e:
+            raise EditError(f"修改后的版式数据不可用: {e}")
+    result = await _request_patch(PROMPTS["edit_html"], html=html_content, instruction=instruction)
+    return apply_html_edits(html_content, result.get("edits")), "html"
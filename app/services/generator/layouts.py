@@ -0,0 +1,308 @@
+"""
+模板快速路径的版式库：对应 SYSTEM_PROMPT「版式选择逻辑」中的几类构图，
+模型只返回文案、配色与版式 id（见 TEMPLATE_SYSTEM_PROMPT），由这里在本地填充成完整 HTML。
+"""
+import hashlib
+import html
+import json
+import re
+from string import Template
+
+from app.core.prompts import SYSTEM_PROMPT
+
+# 与完整 HTML 模式使用同一份字体 CSS，预热与资源缓存可以直接复用
+FONT_CSS_URL = re.search(r"@import url\('([^']+)'\)", SYSTEM_PROMPT).group(1)
+
+# 模型可选的字体（key -> font-family，均带兜底字体）
+FONTS = {
+    "sans": "'Noto Sans SC', 'Microsoft YaHei', sans-serif",
+    "serif": "'Noto Serif SC', 'SimSun', serif",
+    "brush": "'Ma Shan Zheng', 'Noto Serif SC', serif",
+    "running": "'Long Cang', 'Noto Serif SC', serif",
+    "vigorous": "'Zhi Mang Xing', 'Noto Serif SC', serif",
+    "cursive": "'Liu Jian Mao Cao', 'Noto Serif SC', serif",
+    "bold_art": "'ZCOOL QingKe HuangYou', 'Noto Sans SC', sans-serif",
+    "woodcut": "'ZCOOL XiaoWei', 'Noto Serif SC', serif",
+    "cute": "'ZCOOL KuaiLe', 'Noto Sans SC', sans-serif",
+}
+
+# 标题特效（对应提示词中的发光 / 描边 / 渐变 / 立体阴影）
+TITLE_EFFECTS = {
+    "shadow": "text-shadow: 4px 4px 0 rgba(0,0,0,.35), 0 8px 24px rgba(0,0,0,.45);",
+    "glow": "text-shadow: 0 0 12px $accent, 0 0 32px $accent, 0 2px 4px rgba(0,0,0,.4);",
+    "stroke": "-webkit-text-stroke: 2px $accent; text-shadow: 0 6px 18px rgba(0,0,0,.35);",
+    "gradient": (
+        "background: linear-gradient(180deg, $text 10%, $accent 90%); "
+        "-webkit-background-clip: text; background-clip: text; color: transparent;"
+    ),
+}
+
+DEFAULT_PALETTE = {
+    "background": "#1a1a1a",
+    "text": "#ffffff",
+    "accent": "#ffd700",
+    "overlay": "rgba(0,0,0,0.55)",
+}
+_COLOR_RE = re.compile(r"#[0-9a-fA-F]{3,8}|(rgb|rgba|hsl|hsla)\(\s*[\d.%,\s/]+\)")
+
+# 所有版式共用的 <head>；流式预渲染时可以在模型返回之前就开始加载字体
+COMMON_HEAD = (
+    '<!DOCTYPE html><html lang="zh-CN"><head><meta charset="utf-8">'
+    f"<style>@import url('{FONT_CSS_URL}');</style></head>"
+)
+
+# 正文区域溢出时逐步缩小字号（最小 16px）；竖排文字按宽度判断溢出
+AUTOFIT_JS = """
+document.querySelectorAll('.fit').forEach(function (el) {
+  var size = parseFloat(getComputedStyle(el).fontSize);
+  while ((el.scrollHeight > el.clientHeight || el.scrollWidth > el.clientWidth) && size > 16) {
+    size -= 1;
+    el.style.fontSize = size + 'px';
+  }
+});
+"""
+
+SKELETON = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<style>
+@import url('$font_css_url');
+* { box-sizing: border-box; margin: 0; padding: 0; }
+html, body { width: ${width}px; height: ${height}px; overflow: hidden; }
+body { background: $background; color: $text; font-family: $body_font; }
+.poster { position: relative; width: ${width}px; height: ${height}px; overflow: hidden; background: $background; }
+.title { font-family: $title_font; font-size: ${title_size}px; line-height: 1.15; font-weight: 900; color: $text; $title_effect }
+.subtitle { font-size: ${subtitle_size}px; letter-spacing: 0.3em; color: $accent; margin-bottom: 0.6em; }
+.body { font-size: ${body_size}px; line-height: 1.7; white-space: pre-line; overflow: hidden; }
+.footer { font-size: 18px; letter-spacing: 0.2em; opacity: 0.8; margin-top: 1em; }
+.extra { position: absolute; width: 30%; aspect-ratio: 1; object-fit: cover; border-radius: 24px;
+         box-shadow: 0 18px 48px rgba(0,0,0,.45); border: 4px solid rgba(255,255,255,.85); }
+.extra-0 { right: 6%; top: 30%; transform: rotate(4deg); }
+.extra-1 { left: 6%; top: 46%; transform: rotate(-5deg); width: 24%; }
+.extra-2 { right: 10%; top: 60%; transform: rotate(-2deg); width: 20%; }
+.extra-3 { left: 30%; top: 20%; transform: rotate(3deg); width: 18%; }
+$layout_css
+</style>
+</head>
+<body>
+<div class="poster">
+$layout_body
+$extra_images
+</div>
+<script type="application/json" id="poster-slots">$slots_json</script>
+<script>$autofit_js</script>
+</body>
+</html>
+"""
+
+# 版式 id -> (说明, CSS, 主体结构)；说明与 TEMPLATE_SYSTEM_PROMPT 中的版式列表保持一致
+LAYOUTS = {
+    # 方案 A：沉浸式全屏，对角线构图（标题左上，正文右下）
+    "immersive_diagonal": (
+        "全屏背景图，标题左上、正文右下的对角线构图",
+        """
+.bg { position: absolute; inset: 0; width: 100%; height: 100%; object-fit: cover; }
+.shade { position: absolute; inset: 0; background: linear-gradient(135deg, $overlay 0%, transparent 45%, transparent 55%, $overlay 100%); }
+.head { position: absolute; top: 7%; left: 7%; width: 72%; transform: rotate(-3deg); }
+.copy { position: absolute; right: 7%; bottom: 7%; width: 56%; text-align: right; }
+.copy .body { max-height: ${body_max_height}px; }
+""",
+        """
+<img class="bg" src="$image_main">
+<div class="shade"></div>
+<div class="head"><div class="subtitle">$subtitle</div><h1 class="title">$title</h1></div>
+<div class="copy"><p class="body fit">$body</p><div class="footer">$footer</div></div>
+""",
+    ),
+    # 方案 A：杂志封面感（超大标题压住画面，正文形成悬浮色块）
+    "immersive_magazine": (
+        "全屏背景图，超大标题压在画面上方，正文放在底部悬浮色块中",
+        """
+.bg { position: absolute; inset: 0; width: 100%; height: 100%; object-fit: cover; }
+.shade { position: absolute; inset: 0; background: linear-gradient(to bottom, $overlay 0%, transparent 35%, transparent 60%, $overlay 100%); }
+.head { position: absolute; top: 5%; left: 5%; right: 5%; text-align: center; }
+.head .title { font-size: ${title_size_large}px; letter-spacing: 0.05em; }
+.card { position: absolute; left: 6%; bottom: 6%; width: 60%; padding: 28px 32px; background: $overlay;
+        border-left: 8px solid $accent; backdrop-filter: blur(6px); }
+.card .body { max-height: ${body_max_height}px; }
+""",
+        """
+<img class="bg" src="$image_main">
+<div class="shade"></div>
+<div class="head"><div class="subtitle">$subtitle</div><h1 class="title">$title</h1></div>
+<div class="card"><p class="body fit">$body</p><div class="footer">$footer</div></div>
+""",
+    ),
+    # 方案 A：侧边留白（文字集中在一侧 1/3，非对称）
+    "immersive_side": (
+        "全屏背景图，文字集中在左侧或右侧约 1/3 区域，渐变蒙层保证可读性",
+        """
+.bg { position: absolute; inset: 0; width: 100%; height: 100%; object-fit: cover; }
+.shade { position: absolute; inset: 0; background: linear-gradient(to $side_opposite, $overlay 0%, $overlay 30%, transparent 65%); }
+.column { position: absolute; top: 0; bottom: 0; $side: 0; width: 40%; padding: 10% 6%;
+          display: flex; flex-direction: column; justify-content: center; text-align: $side; }
+.column .body { max-height: ${body_max_height}px; margin-top: 1em; }
+""",
+        """
+<img class="bg" src="$image_main">
+<div class="shade"></div>
+<div class="column"><div class="subtitle">$subtitle</div><h1 class="title">$title</h1><p class="body fit">$body</p><div class="footer">$footer</div></div>
+""",
+    ),
+    # 方案 B：纯色 / 渐变背景，孤立主体悬浮
+    "minimal_floating": (
+        "纯色或渐变背景，图片作为主体悬浮在画面上部（适合产品、人物等孤立主体）",
+        """
+.poster { background: radial-gradient(circle at 50% 35%, $accent 0%, $background 65%); }
+.subject { position: absolute; top: 6%; left: 12%; width: 76%; height: 50%; object-fit: cover;
+           border-radius: 32px; box-shadow: 0 30px 80px rgba(0,0,0,.45); }
+.copy { position: absolute; left: 8%; right: 8%; top: 60%; bottom: 5%; }
+.copy .title { margin-top: 0.1em; }
+.copy .body { max-height: ${body_max_height}px; margin-top: 0.6em; }
+""",
+        """
+<img class="subject" src="$image_main">
+<div class="copy"><div class="subtitle">$subtitle</div><h1 class="title">$title</h1><p class="body fit">$body</p><div class="footer">$footer</div></div>
+""",
+    ),
+    # 方案 B：边框 / 留白，文艺日签
+    "minimal_frame": (
+        "纯色背景加细边框，图片居上作画框，文字左对齐留白（适合文艺、日签、强调文字）",
+        """
+.frame { position: absolute; inset: 4%; border: 2px solid $accent; }
+.picture { position: absolute; top: 8%; left: 8%; right: 8%; height: 48%; width: 84%; object-fit: cover; }
+.copy { position: absolute; left: 10%; right: 14%; top: 60%; bottom: 7%; }
+.copy .body { max-height: ${body_max_height}px; margin-top: 0.6em; }
+""",
+        """
+<div class="frame"></div>
+<img class="picture" src="$image_main">
+<div class="copy"><div class="subtitle">$subtitle</div><h1 class="title">$title</h1><p class="body fit">$body</p><div class="footer">$footer</div></div>
+""",
+    ),
+    # 竖排：古风 / 文艺 / 高端
+    "vertical_classic": (
+        "竖排标题与正文，图片占据右侧并渐隐（适合古风、文艺、高端主题）",
+        """
+.picture { position: absolute; top: 0; right: 0; width: 68%; height: 100%; object-fit: cover;
+           -webkit-mask-image: linear-gradient(to left, #000 60%, transparent 100%); mask-image: linear-gradient(to left, #000 60%, transparent 100%); }
+.vertical { writing-mode: vertical-rl; text-orientation: upright; }
+.head { position: absolute; top: 7%; left: 8%; height: 70%; }
+.head .title { font-size: ${title_size_vertical}px; letter-spacing: 0.15em; }
+.head .subtitle { letter-spacing: 0.4em; margin: 0 0 0 0.6em; }
+.copy { position: absolute; bottom: 6%; left: 24%; height: 38%; max-width: 30%; }
+.copy .body { height: 100%; max-width: ${body_max_width}px; }
+""",
+        """
+<img class="picture" src="$image_main">
+<div class="head vertical"><h1 class="title">$title</h1><div class="subtitle">$subtitle</div></div>
+<div class="copy vertical"><p class="body fit">$body</p></div>
+<div class="footer" style="position:absolute; left:8%; bottom:4%;">$footer</div>
+""",
+    ),
+}
+
+DEFAULT_LAYOUT = "immersive_diagonal"
+
+# 启动时把每个版式与骨架合并，预编译为 Template
+_COMPILED = {
+    layout_id: Template(SKELETON.replace("$layout_css", css).replace("$layout_body", body))
+    for layout_id, (_, css, body) in LAYOUTS.items()
+}
+
+# 版式库的版本哈希，参与结果缓存键（改动模板后旧缓存失效）
+LAYOUTS_VERSION = hashlib.sha256(
+    (SKELETON + AUTOFIT_JS + repr(sorted(LAYOUTS.items())) + repr(sorted(TITLE_EFFECTS.items()))).encode()
+).hexdigest()[:16]
+
+
+# 版式数据中可以由模型填写的字段
+SLOT_KEYS = (
+    "layout", "title", "subtitle", "body", "footer", "title_font", "body_font", "title_effect", "side", "palette",
+)
+
+_SLOTS_SCRIPT_RE = re.compile(r'<script type="application/json" id="poster-slots">(.*?)</script>', re.DOTALL)
+
+
+class SlotError(ValueError):
+    """模型返回的版式数据无法使用（缺少标题、版式不存在等），调用方应回退到完整 HTML 模式。"""
+
+
+def _color(value, default: str) -> str:
+    if isinstance(value, str) and _COLOR_RE.fullmatch(value.strip()):
+        return value.strip()
+    return default
+
+
+def _text(value, limit: int) -> str:
+    text = str(value or "").strip()[:limit]
+    return html.escape(text)
+
+
+def render_layout(slots: dict, image_urls: list[str], width: int, height: int) -> str:
+    """
+    按模型返回的版式数据填充模板，返回完整 HTML。
+    文案全部转义，颜色与字体只接受白名单内的值；标题为空或版式不存在时抛出 SlotError。
+    """
+    layout_id = slots.get("layout")
+    if layout_id not in _COMPILED:
+        raise SlotError(f"未知的版式: {layout_id!r}")
+    title = str(slots.get("title") or "").strip()
+    if not title:
+        raise SlotError("缺少标题")
+    if not image_urls:
+        raise SlotError("没有可用的图片")
+
+    palette = slots.get("palette") if isinstance(slots.get("palette"), dict) else {}
+    colors = {name: _color(palette.get(name), default) for name, default in DEFAULT_PALETTE.items()}
+    effect = Template(TITLE_EFFECTS.get(slots.get("title_effect"), TITLE_EFFECTS["shadow"])).substitute(colors)
+    side = "right" if slots.get("side") == "right" else "left"
+
+    # 标题越长字号越小，避免一行放不下
+    base = width * 0.11
+    title_size = max(width * 0.055, base * min(1.0, 8 / max(1, len(title))))
+    extras = "\n".join(
+        f'<img class="extra extra-{i}" src="{html.escape(url)}">' for i, url in enumerate(image_urls[1:5])
+    )
+    return _COMPILED[layout_id].substitute(
+        font_css_url=FONT_CSS_URL,
+        autofit_js=AUTOFIT_JS,
+        width=width,
+        height=height,
+        title=_text(title, 40),
+        subtitle=_text(slots.get("subtitle"), 40),
+        body=_text(slots.get("body"), 300),
+        footer=_text(slots.get("footer"), 60),
+        title_font=FONTS.get(slots.get("title_font"), FONTS["serif"]),
+        body_font=FONTS.get(slots.get("body_font"), FONTS["sans"]),
+        title_effect=effect,
+        title_size=round(title_size),
+        title_size_large=round(title_size * 1.3),
+        title_size_vertical=round(min(height * 0.7 / max(1, len(title)), width * 0.12)),
+        subtitle_size=max(20, round(width * 0.03)),
+        body_size=max(24, min(32, round(width * 0.035))),
+        body_max_height=round(height * 0.26),
+        body_max_width=round(width * 0.3),
+        side=side,
+        side_opposite="left" if side == "right" else "right",
+        image_main=html.escape(image_urls[0]),
+        extra_images=extras,
+        # 版式数据随 HTML 一起保存，修改海报时直接在此基础上打补丁
+        slots_json=json.dumps(
+            {key: slots[key] for key in SLOT_KEYS if key in slots}, ensure_ascii=False
+        ).replace("</", "<\\/"),
+        **colors,
+    )
+
+
+def extract_slots(html_content: str) -> dict | None:
+    """从模板模式生成的 HTML 中取出版式数据；完整 HTML 模式生成的页面返回 None。"""
+    match = _SLOTS_SCRIPT_RE.search(html_content)
+    if not match:
+        return None
+    try:
+        slots = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return None
+    return slots if isinstance(slots, dict) else None
@@ -1,34 +1,93 @@
-from openai import AsyncOpenAI
 from app.core.config import settings
+from app.services.ai_clients import ai_clients, provider_name, stage_timeout
+from app.services.admission import admission, AdmissionRejected
+from app.services.hedging import HedgeTarget, HedgingEngine
+from app.services.resilience import CircuitOpen, DeadlineExceeded, resilience
+from app.services.renderer.image_ingest import image_ingest
+from app.core.telemetry import span
+from typing import AsyncIterator
 import asyncio
 
-async def generate_images_from_ai(image_prompts: list[str]) -> list[str]:
-    """
-    根据规划好的图片描述列表，并行调用文生图模型生成图片。
-    """
-    client = AsyncOpenAI(
-        api_key=settings.AI_IMAGE_API_KEY,
-        base_url=settings.AI_IMAGE_BASE_URL,
-    )
+# 生图请求的对冲引擎：单张图片过慢时再发一份请求（优先发往备用服务），缩短最慢那张图的尾延迟
+image_hedging = HedgingEngine(
+    name="image",
+    quantile=settings.IMAGE_HEDGE_QUANTILE,
+    default_delay=settings.IMAGE_HEDGE_DEFAULT_DELAY,
+    min_delay=settings.IMAGE_HEDGE_MIN_DELAY,
+    min_samples=settings.IMAGE_HEDGE_MIN_SAMPLES,
+    window=settings.IMAGE_HEDGE_WINDOW,
+    budget_ratio=settings.IMAGE_HEDGE_BUDGET_RATIO,
+    max_hedges=settings.IMAGE_HEDGE_MAX_PER_IMAGE if settings.IMAGE_HEDGE_ENABLED else 0,
+)
 
-    print(f"准备根据 {len(image_prompts)} 个描述生成图片...")
+def _image_targets(prompt: str) -> list[HedgeTarget[str]]:
+    """主生图服务在前；配置了备用服务时，对冲请求发往备用服务。每个请求都经过各自服务商的重试与熔断保护。"""
+    providers = [(settings.AI_IMAGE_BASE_URL, ai_clients.image(), settings.AI_IMAGE_MODEL)]
+    secondary = ai_clients.image_secondary()
+    if secondary is not None:
+        providers.append((
+            settings.AI_IMAGE_SECONDARY_BASE_URL,
+            secondary,
+            settings.AI_IMAGE_SECONDARY_MODEL or settings.AI_IMAGE_MODEL,
+        ))
 
-    async def generate_single_image(p: str) -> str:
-        print(f"向 AI 发送生图 prompt: {p}")
-        try:
-            response = await client.images.generate(
-                model=settings.AI_IMAGE_MODEL,
-                prompt=p,
-            )
+    def make_call(provider: str, client, model: str):
+        async def generate() -> str:
+            response = await client.images.generate(model=model, prompt=prompt)
             return response.data[0].url
-        except Exception as e:
-            print(f"生成单张图片时出错: {e}")
-            return "" 
 
-    tasks = [generate_single_image(p) for p in image_prompts]
-    image_urls = await asyncio.gather(*tasks)
-    
+        async def call() -> str:
+            return await resilience.call(provider, "image", generate, timeout=stage_timeout("image"))
+        return call
+
+    return [
+        HedgeTarget(provider_name(base_url), make_call(provider_name(base_url), client, model))
+        for base_url, client, model in providers
+    ]
+
+async def _generate_single_image(i: int, p: str) -> str:
+    """生成一张图片，失败时返回空字符串（准入拒绝、服务熔断与截止时间耗尽除外）。"""
+    print(f"向 AI 发送生图 prompt: {p}")
+    try:
+        # 对冲请求与原请求共用一个阶段并发名额，额外请求的数量由对冲预算控制
+        async with admission.stage("image"):
+            with span("image", index=i):
+                url = await image_hedging.run(_image_targets(p))
+        # 不等其他图片，立即开始下载这一张，渲染前再按海报尺寸缩小
+        image_ingest.prefetch(url)
+        return url
+    except (AdmissionRejected, CircuitOpen, DeadlineExceeded):
+        # 需要返回给客户端（503 / 504），不能当作单张图片失败生成错误海报
+        raise
+    except Exception as e:
+        print(f"生成单张图片时出错: {e}")
+        return ""
+
+def _successful(image_urls: list[str]) -> list[str]:
     successful_urls = [url for url in image_urls if url]
     if not successful_urls:
         raise Exception("所有图片生成均失败。")
-    return successful_urls
\ No newline at end of file
+    return successful_urls
+
+async def generate_images_from_ai(image_prompts: list[str]) -> list[str]:
+    """
+    根据规划好的图片描述列表，并行调用文生图模型生成图片。
+    """
+    print(f"准备根据 {len(image_prompts)} 个描述生成图片...")
+    tasks = [_generate_single_image(i, p) for i, p in enumerate(image_prompts)]
+    return _successful(await asyncio.gather(*tasks))
+
+async def generate_images_from_stream(image_prompts: AsyncIterator[str]) -> list[str]:
+    """
+    边规划边生图：流式规划每产出一个描述就立即开始生成这张图片。
+    """
+    tasks: list[asyncio.Task] = []
+    try:
+        async for p in image_prompts:
+            tasks.append(asyncio.create_task(_generate_single_image(len(tasks), p)))
+        return _successful(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -1,42 +1,218 @@
-from openai import AsyncOpenAI
 from app.core.config import settings
-from app.core.prompts import PLAN_PROMPT
+from app.services.ai_clients import ai_clients, provider_name, stage_timeout
+from app.services.admission import admission, AdmissionRejected
+from app.services.resilience import CircuitOpen, DeadlineExceeded, resilience
+from app.services.generator.prompt_cache import PROMPTS, prompt_cache
+from app.core.telemetry import record
+from typing import AsyncIterator, Callable
+import asyncio
 import json
 import re
+import time
+
+def _plan_options() -> dict:
+    """JSON 模式：要求服务商只输出合法 JSON（AI_PLAN_JSON_MODE=false 时不指定）。"""
+    if settings.AI_PLAN_JSON_MODE:
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+def parse_plan(text: str) -> dict:
+    """从模型输出中解析第一个完整的 JSON 对象（前后可能带有说明文字或代码块标记）。"""
+    start = text.find("{")
+    if start == -1:
+        raise json.JSONDecodeError("在 AI 返回的内容中未找到有效的 JSON 对象。", text, 0)
+    plan, _ = json.JSONDecoder().raw_decode(text, start)
+    if not isinstance(plan, dict):
+        raise json.JSONDecodeError("AI 返回的计划不是 JSON 对象。", text, start)
+    return plan
+
+class ImagePromptParser:
+    """
+    增量解析流式返回的计划 JSON：每收到一段文本调用一次 feed，
+    image_prompts 数组中的字符串一完整就返回，不必等整个 JSON 结束。
+    计划在 image_prompts 之前给出 image_count 时，数字一完整就记录到 image_count（否则保持 None）。
+    """
+
+    KEY = '"image_prompts"'
+    COUNT = re.compile(r'"image_count"\s*:\s*(\d+)\s*[,}]')
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._state = "key"  # key -> array -> items -> done
+        self.prompts: list[str] = []
+        self.image_count: int | None = None
+
+    def feed(self, text: str) -> list[str]:
+        self._buf += text
+        found = []
+        while self._state != "done":
+            if self._state == "key":
+                index = self._buf.find(self.KEY, self._pos)
+                if self.image_count is None:
+                    # 只在 image_prompts 之前查找：之后才给出的数量已经没有提前量
+                    match = self.COUNT.search(self._buf, 0, len(self._buf) if index == -1 else index)
+                    if match and (count := int(match.group(1))) > 0:
+                        self.image_count = count
+                if index == -1:
+                    # 键可能被截断在两段文本之间，保留末尾重新查找
+                    self._pos = max(self._pos, len(self._buf) - len(self.KEY))
+                    break
+                self._pos = index + len(self.KEY)
+                self._state = "array"
+            elif self._state == "array":
+                index = self._buf.find("[", self._pos)
+                if index == -1:
+                    break
+                self._pos = index + 1
+                self._state = "items"
+            else:
+                while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n,":
+                    self._pos += 1
+                if self._pos >= len(self._buf):
+                    break
+                if self._buf[self._pos] != '"':
+                    # "]" 或其他内容：数组结束
+                    self._state = "done"
+                    break
+                end = self._string_end(self._pos + 1)
+                if end == -1:
+                    break
+                value = json.loads(self._buf[self._pos:end + 1])
+                self._pos = end + 1
+                if isinstance(value, str) and value.strip():
+                    found.append(value)
+                    self.prompts.append(value)
+        return found
+
+    def _string_end(self, index: int) -> int:
+        """JSON 字符串结束引号的位置，字符串尚未完整时返回 -1。"""
+        while index < len(self._buf):
+            char = self._buf[index]
+            if char == "\\":
+                index += 2
+                continue
+            if char == '"':
+                return index
+            index += 1
+        return -1
 
 async def plan_image_generation(prompt: str) -> dict:
     """调用语言模型规划需要生成的图片数量和内容。"""
-    client = AsyncOpenAI(
-        api_key=settings.AI_CHAT_API_KEY,
-        base_url=settings.AI_CHAT_BASE_URL,
-    )
-    
+    client = ai_clients.chat("plan")
+
     print("开始规划图片生成...")
     try:
-        response = await client.chat.completions.create(
-            model=settings.AI_CHAT_MODEL,
-            messages=[
-                {"role": "system", "content": PLAN_PROMPT},
-                {"role": "user", "content": f"我的核心需求是: {prompt}"},
-            ],
-            extra_body={
-                "thinking": {"type": "disabled"}
-            },
-        )
+        async with admission.stage("chat"):
+            response = await resilience.call(
+                provider_name(settings.AI_CHAT_BASE_URL),
+                "plan",
+                lambda: prompt_cache.create(
+                    client,
+                    PROMPTS["plan"],
+                    PROMPTS["plan"].messages(prompt=prompt),
+                    extra_body={
+                        "thinking": {"type": "disabled"}
+                    },
+                    **_plan_options(),
+                ),
+                timeout=stage_timeout("plan"),
+            )
+        prompt_cache.record_usage(PROMPTS["plan"], response.usage)
         plan_str = response.choices[0].message.content
-        
+
         if not plan_str:
             print("AI 返回了空的图片生成计划，将使用默认计划。")
             return {"image_prompts": [prompt]}
-            
+
         print(f"获取到 AI 返回的原始计划内容: {plan_str}")
-        match = re.search(r'\{.*\}', plan_str, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            return json.loads(json_str)
-        else:
-            raise json.JSONDecodeError("在 AI 返回的内容中未找到有效的 JSON 对象。", plan_str, 0)
+        return parse_plan(plan_str)
+    except (AdmissionRejected, CircuitOpen, DeadlineExceeded):
+        # 准入拒绝、服务熔断与超过截止时间需要返回给客户端，不能降级为默认计划
+        raise
     except Exception as e:
         print(f"规划图片生成时出错: {e}")
         # 如果规划失败，默认生成一张图
-        return {"image_prompts": [prompt]}
\ No newline at end of file
+        return {"image_prompts": [prompt]}
+
+async def stream_image_prompts(
+    prompt: str, on_count: Callable[[int], None] | None = None
+) -> AsyncIterator[str]:
+    """
+    流式规划：以流式方式请求计划 JSON，image_prompts 中每一项一完整就产出，调用方可以立即开始生图。
+    计划开头给出 image_count 时调用一次 on_count(数量)，调用方可以在描述出来之前按数量开始生成 HTML；
+    模型给出的数量只是声明，实际产出的描述数可能不同。
+    规划失败且尚未产出任何描述时，与非流式规划一样退回为用原始 prompt 生成一张图。
+    声明数量与第一条描述的耗时分别记录为 plan_image_count 与 plan_first_prompt。
+
+    整个流（而不只是建立请求）在 resilience.call 中读取，受单次超时、截止时间、熔断与重试预算约束；
+    读取在单独的任务中进行，描述放入队列后继续读取，chat 阶段名额不会因为调用方处理得慢而被占住。
+    """
+    client = ai_clients.chat("plan")
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+    emitted: list[str] = []
+    counted = False
+    start = time.perf_counter()
+
+    async def consume():
+        nonlocal counted
+        # 每次尝试（含重试）重新解析；重试时已经产出过的描述与数量不再重复产出
+        parser = ImagePromptParser()
+        stream = await prompt_cache.create(
+            client,
+            PROMPTS["plan"],
+            PROMPTS["plan"].messages(prompt=prompt),
+            stream=True,
+            extra_body={
+                "thinking": {"type": "disabled"}
+            },
+            **_plan_options(),
+        )
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                prompt_cache.record_usage(PROMPTS["plan"], chunk.usage)
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            found = parser.feed(chunk.choices[0].delta.content)
+            if parser.image_count is not None and not counted:
+                counted = True
+                record("plan_image_count", time.perf_counter() - start)
+                print(f"规划声明图片数量: {parser.image_count}")
+                if on_count:
+                    on_count(parser.image_count)
+            for image_prompt in found:
+                if len(parser.prompts) <= len(emitted):
+                    continue
+                emitted.append(image_prompt)
+                if len(emitted) == 1:
+                    record("plan_first_prompt", time.perf_counter() - start)
+                print(f"规划出第 {len(emitted)} 个图片描述: {image_prompt}")
+                queue.put_nowait(image_prompt)
+
+    async def produce():
+        try:
+            async with admission.stage("chat"):
+                await resilience.call(
+                    provider_name(settings.AI_CHAT_BASE_URL), "plan", consume, timeout=stage_timeout("plan")
+                )
+        finally:
+            queue.put_nowait(None)
+
+    print("开始流式规划图片生成...")
+    task = asyncio.create_task(produce())
+    try:
+        while (image_prompt := await queue.get()) is not None:
+            yield image_prompt
+        await task
+    except (AdmissionRejected, CircuitOpen, DeadlineExceeded):
+        raise
+    except Exception as e:
+        print(f"流式规划图片生成时出错: {e}")
+    finally:
+        if not task.done():
+            # 调用方提前停止（如被取消）时不再继续读取
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    if not emitted:
+        print("流式规划没有得到图片描述，将使用默认计划。")
+        yield prompt
@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import re
+import time
+from dataclasses import dataclass, field
+from string import Formatter
+
+import httpx
+import openai
+
+from app.core import prompts
+from app.core.config import settings
+from app.core.telemetry import metrics
+
+prompt_tokens = metrics.counter(
+    "poster_prompt_tokens_total", "聊天模型的 token 用量，按提示词与类型分类（prompt / cached / completion）", ("prompt", "kind")
+)
+context_events = metrics.counter(
+    "poster_prompt_context_events_total", "服务端上下文缓存事件（created / failed / expired / fallback）", ("prompt", "event")
+)
+
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（本地没有服务商的分词器）：中文约 1 字 1 token，其余约 4 个字符 1 token。"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class CompiledTemplate:
+    """启动时解析一次的 str.format 模板，渲染时只做字符串拼接；字段缺失时抛出 KeyError。"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._parts = [(literal, name) for literal, name, _, _ in Formatter().parse(text)]
+        self.fields = {name for _, name in self._parts if name}
+
+    def render(self, **values) -> str:
+        out = []
+        for literal, name in self._parts:
+            out.append(literal)
+            if name:
+                out.append(str(values[name]))
+        return "".join(out)
+
+
+@dataclass
+class CompiledPrompt:
+    """
+    一类请求的提示词：静态的系统提示词作为前缀（每次请求逐字节相同，服务端前缀缓存才能命中），
+    加上预编译的用户输入模板。version 为前缀的哈希，前缀一变，服务端上下文随之重建。
+    """
+
+    name: str
+    system: str
+    user: CompiledTemplate
+    version: str = field(init=False)
+    prefix_tokens: int = field(init=False)
+
+    def __post_init__(self):
+        self.version = hashlib.sha256(self.system.encode()).hexdigest()[:12]
+        self.prefix_tokens = estimate_tokens(self.system)
+        self.system_message = {"role": "system", "content": self.system}
+
+    def messages(self, **values) -> list[dict]:
+        return [self.system_message, {"role": "user", "content": self.user.render(**values)}]
+
+
+PROMPTS = {
+    "plan": CompiledPrompt("plan", prompts.PLAN_PROMPT, CompiledTemplate(prompts.PLAN_USER_PROMPT)),
+    "html": CompiledPrompt("html", prompts.SYSTEM_PROMPT, CompiledTemplate(prompts.HTML_USER_PROMPT)),
+    "template": CompiledPrompt("template", prompts.TEMPLATE_SYSTEM_PROMPT, CompiledTemplate(prompts.TEMPLATE_USER_PROMPT)),
+    "edit_slots": CompiledPrompt("edit_slots", prompts.EDIT_SLOTS_SYSTEM_PROMPT, CompiledTemplate(prompts.EDIT_SLOTS_USER_PROMPT)),
+    "edit_html": CompiledPrompt("edit_html", prompts.EDIT_HTML_SYSTEM_PROMPT, CompiledTemplate(prompts.EDIT_HTML_USER_PROMPT)),
+}
+
+
+@dataclass
+class _Context:
+    id: str | None = None
+    created_at: float = 0.0
+    failed_at: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class PromptCache:
+    """
+    让规划 / HTML / 模板 / 修改请求复用服务端缓存的提示词前缀。
+
+    - mode="auto"：依赖服务商的自动前缀缓存（OpenAI、DeepSeek 等），只保证前缀逐字节不变并统计命中的 token；
+    - mode="ark_context"：使用火山方舟的上下文缓存（common_prefix 模式），为每个系统提示词创建一次上下文，
+      之后的请求只发送用户输入；创建失败或上下文失效时回退为普通请求，ttl 秒后再尝试；
+    - mode="off"：不做任何处理，也不统计用量。
+    """
+
+    def __init__(self, mode: str, ttl: int):
+        self.mode = mode
+        self.ttl = ttl
+        self._contexts = {name: _Context() for name in PROMPTS}
+
+    def _stale(self, context: _Context) -> bool:
+        # 提前一点重建，避免请求发出时上下文刚好过期
+        return context.id is None or time.monotonic() - context.created_at > self.ttl * 0.9
+
+    async def _context_id(self, client: openai.AsyncOpenAI, prompt: CompiledPrompt) -> str | None:
+        context = self._contexts[prompt.name]
+        if not self._stale(context):
+            return context.id
+        if context.failed_at and time.monotonic() - context.failed_at < self.ttl:
+            return None
+        async with context.lock:
+            if not self._stale(context):
+                return context.id
+            if context.id is not None:
+                context_events.inc(prompt=prompt.name, event="expired")
+            try:
+                response = await client.post(
+                    "/context/create",
+                    cast_to=httpx.Response,
+                    body={
+                        "model": settings.AI_CHAT_MODEL,
+                        "mode": "common_prefix",
+                        "messages": [prompt.system_message],
+                        "ttl": self.ttl,
+                    },
+                )
+                context.id = response.json()["id"]
+            except Exception as e:
+                context.id = None
+                context.failed_at = time.monotonic()
+                context_events.inc(prompt=prompt.name, event="failed")
+                print(f"创建 {prompt.name} 提示词的上下文缓存失败，改为普通请求: {e}")
+                return None
+            context.created_at = time.monotonic()
+            context.failed_at = 0.0
+            context_events.inc(prompt=prompt.name, event="created")
+            print(f"已创建 {prompt.name} 提示词的上下文缓存: {context.id} (版本 {prompt.version})")
+            return context.id
+
+    async def create(self, client: openai.AsyncOpenAI, prompt: CompiledPrompt, messages: list[dict], **kwargs):
+        """
+        代替 client.chat.completions.create 发起请求，messages 为 prompt.messages(...) 的结果。
+        流式请求会要求服务商在最后一个分片中返回用量。
+        """
+        if kwargs.get("stream") and self.mode != "off":
+            kwargs["stream_options"] = {"include_usage": True}
+        if self.mode == "ark_context":
+            context_id = await self._context_id(client, prompt)
+            if context_id:
+                # 上下文中已经包含系统提示词，只发送之后的消息
+                context_client = client.with_options(base_url=f"{str(client.base_url).rstrip('/')}/context")
+                extra_body = {**kwargs.pop("extra_body", {}), "context_id": context_id}
+                try:
+                    return await context_client.chat.completions.create(
+                        model=settings.AI_CHAT_MODEL, messages=messages[1:], extra_body=extra_body, **kwargs
+                    )
+                except (openai.NotFoundError, openai.BadRequestError) as e:
+                    # 上下文已失效（过期或被删除），下次重新创建，本次按普通请求发送
+                    self._contexts[prompt.name].id = None
+                    context_events.inc(prompt=prompt.name, event="fallback")
+                    print(f"{prompt.name} 提示词的上下文缓存不可用，改为普通请求: {e}")
+                    kwargs["extra_body"] = {k: v for k, v in extra_body.items() if k != "context_id"}
+        return await client.chat.completions.create(model=settings.AI_CHAT_MODEL, messages=messages, **kwargs)
+
+    def record_usage(self, prompt: CompiledPrompt, usage) -> None:
+        """记录一次请求的 token 用量，其中 cached 为命中服务端缓存的输入 token。"""
+        if usage is None or self.mode == "off":
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        prompt_tokens.inc(usage.prompt_tokens or 0, prompt=prompt.name, kind="prompt")
+        prompt_tokens.inc(cached, prompt=prompt.name, kind="cached")
+        prompt_tokens.inc(usage.completion_tokens or 0, prompt=prompt.name, kind="completion")
+
+    async def start(self, client: openai.AsyncOpenAI):
+        """应用启动时调用：打印各提示词的版本与前缀大小，ark_context 模式下预先创建上下文。"""
+        for prompt in PROMPTS.values():
+            print(f"提示词 {prompt.name}: 版本 {prompt.version}，前缀约 {prompt.prefix_tokens} tokens")
+        if self.mode == "ark_context":
+            await asyncio.gather(*(self._context_id(client, prompt) for prompt in PROMPTS.values()))
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "prompts": {
+                name: {
+                    "version": prompt.version,
+                    "prefix_tokens": prompt.prefix_tokens,
+                    "context_id": self._contexts[name].id,
+                }
+                for name, prompt in PROMPTS.items()
+            },
+        }
+
+
+# 全局提示词缓存（规划、HTML 与模板请求共用）
+prompt_cache = PromptCache(mode=settings.AI_PROMPT_CACHE, ttl=settings.AI_PROMPT_CACHE_TTL)
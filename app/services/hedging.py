@@ -0,0 +1,185 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from app.core.telemetry import metrics
+
+T = TypeVar("T")
+
+hedge_requests = metrics.counter(
+    "poster_hedge_requests_total", "对冲引擎处理的逻辑请求数，按结果分类（primary / hedge / error）", ("engine", "outcome")
+)
+hedges_fired = metrics.counter(
+    "poster_hedges_fired_total", "发出的对冲请求数（原请求过慢或失败后额外发出的请求）", ("engine", "provider")
+)
+hedges_denied = metrics.counter(
+    "poster_hedges_denied_total", "因预算不足而没有发出的对冲请求数", ("engine",)
+)
+
+
+class LatencyTracker:
+    """最近 window 次调用的耗时，用于估算分位数。"""
+
+    def __init__(self, window: int):
+        self._samples: deque[float] = deque(maxlen=max(1, window))
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class HedgeTarget(Generic[T]):
+    """可以接收请求的服务商：name 用于统计，call 执行一次完整请求。"""
+    name: str
+    call: Callable[[], Awaitable[T]]
+
+
+class HedgingEngine:
+    """
+    对冲请求：主请求超过该服务商滚动分位数耗时（默认 p95）仍未完成时，向下一个服务商（未配置时为同一个）
+    再发一份相同的请求，取最先成功的结果并取消其余请求；请求失败时也会立即对冲。
+
+    额外请求受预算限制：每个逻辑请求积累 budget_ratio 个令牌，每次对冲消耗 1 个，
+    因此长期来看额外请求不超过 budget_ratio 的比例，服务商整体变慢时不会把流量翻倍。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        quantile: float,
+        default_delay: float,
+        min_delay: float,
+        min_samples: int,
+        window: int,
+        budget_ratio: float,
+        max_hedges: int,
+    ):
+        self.name = name
+        self.quantile = quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget_ratio = budget_ratio
+        self.max_hedges = max_hedges
+        # 令牌上限，避免长时间空闲后积累过多预算，突发时一次性放出大量对冲
+        self.max_tokens = max(1.0, budget_ratio * 100)
+        self._tokens = 1.0
+        self._latency: dict[str, LatencyTracker] = {}
+        self.requests = 0
+        self.fired = 0
+        self.denied = 0
+        self.wins = 0  # 对冲请求先于原请求成功的次数
+        self.errors = 0
+
+    def _tracker(self, provider: str) -> LatencyTracker:
+        if provider not in self._latency:
+            self._latency[provider] = LatencyTracker(self.window)
+        return self._latency[provider]
+
+    def delay(self, provider: str) -> float:
+        """发出对冲前等待的秒数：样本足够时取该服务商的滚动分位数耗时，否则取默认值。"""
+        tracker = self._tracker(provider)
+        if len(tracker) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, tracker.quantile(self.quantile))
+
+    def _take_token(self) -> bool:
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        self.denied += 1
+        hedges_denied.inc(engine=self.name)
+        return False
+
+    async def run(self, targets: list[HedgeTarget[T]]) -> T:
+        """
+        依次向 targets 发出请求（第一个为主请求，之后循环使用），返回最先成功的结果。
+        所有已发出的请求都失败、且不能再对冲时抛出最后一个异常。
+        """
+        self.requests += 1
+        self._tokens = min(self.max_tokens, self._tokens + self.budget_ratio)
+        # 在途请求 -> (第几次请求, 服务商, 开始时间)
+        attempts: dict[asyncio.Task, tuple[int, str, float]] = {}
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            target = targets[launched % len(targets)]
+            attempts[asyncio.create_task(target.call())] = (launched, target.name, time.monotonic())
+            launched += 1
+            return target.name
+
+        launch()
+        last_error: BaseException | None = None
+        budget_denied = False
+        try:
+            while attempts:
+                can_hedge = launched <= self.max_hedges and not budget_denied
+                # 按最近一次请求所用服务商的耗时分布决定何时对冲
+                timeout = self.delay(targets[(launched - 1) % len(targets)].name) if can_hedge else None
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index, provider, started = attempts.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    self._tracker(provider).add(time.monotonic() - started)
+                    outcome = "hedge" if index > 0 else "primary"
+                    if index > 0:
+                        self.wins += 1
+                    hedge_requests.inc(engine=self.name, outcome=outcome)
+                    return task.result()
+                # 等待超过阈值，或在途请求全部失败：预算允许时发出对冲
+                if can_hedge and (not done or not attempts):
+                    if self._take_token():
+                        self.fired += 1
+                        hedges_fired.inc(engine=self.name, provider=launch())
+                    else:
+                        # 预算不足时本次请求不再对冲，只等待已发出的请求
+                        budget_denied = True
+            self.errors += 1
+            hedge_requests.inc(engine=self.name, outcome="error")
+            raise last_error
+        finally:
+            now = time.monotonic()
+            for task, (_, provider, started) in attempts.items():
+                if task.done():
+                    if not task.cancelled():
+                        task.exception()
+                    continue
+                task.cancel()
+                # 被取消的慢请求至少要这么久，计入样本，避免分位数只统计赢家而被低估
+                self._tracker(provider).add(now - started)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges_fired": self.fired,
+            "hedges_denied": self.denied,
+            "hedge_wins": self.wins,
+            "hedge_win_rate": round(self.wins / self.fired, 3) if self.fired else 0.0,
+            "hedge_ratio": round(self.fired / self.requests, 3) if self.requests else 0.0,
+            "errors": self.errors,
+            "budget_tokens": round(self._tokens, 2),
+            "providers": {
+                provider: {
+                    "samples": len(tracker),
+                    "p50": tracker.quantile(0.5),
+                    "p95": tracker.quantile(0.95),
+                    "hedge_delay": round(self.delay(provider), 3),
+                }
+                for provider, tracker in self._latency.items()
+            },
+        }
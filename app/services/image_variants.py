@@ -0,0 +1,186 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image, features
+
+from app.core.config import settings
+from app.core.telemetry import span
+from app.services.storage.store import artifact_store, variant_key
+
+# 输出格式 -> (扩展名, Content-Type)
+FORMATS = {
+    "jpeg": (".jpg", "image/jpeg"),
+    "png": (".png", "image/png"),
+    "webp": (".webp", "image/webp"),
+    "avif": (".avif", "image/avif"),
+}
+# 按 Accept 协商时的优先顺序（体积从小到大）
+NEGOTIATION_ORDER = ("avif", "webp", "jpeg")
+MIN_WIDTH = 16
+MAX_WIDTH = 4096
+
+
+def supported_formats() -> set[str]:
+    """当前 Pillow 构建支持编码的格式（AVIF 依赖 libavif）。"""
+    formats = {"jpeg", "png"}
+    if features.check("webp"):
+        formats.add("webp")
+    if features.check("avif"):
+        formats.add("avif")
+    return formats
+
+
+SUPPORTED_FORMATS = supported_formats()
+
+
+def negotiate_format(accept: str | None) -> str:
+    """根据 Accept 头选择客户端支持的最小格式，默认 JPEG。"""
+    accept = (accept or "").lower()
+    for name in NEGOTIATION_ORDER:
+        if name in SUPPORTED_FORMATS and FORMATS[name][1] in accept:
+            return name
+    return "jpeg"
+
+
+@dataclass
+class VariantSpec:
+    format: str = "jpeg"
+    width: int | None = None  # None 表示保持原图宽度
+    quality: int = 85
+
+
+def variant_specs(format: str, quality: int, widths: list[int] | None = None) -> list[VariantSpec]:
+    """按请求的格式 / 质量 / 宽度生成派生规格；格式不受支持时抛出 ValueError。"""
+    if format not in SUPPORTED_FORMATS:
+        raise ValueError(f"当前环境不支持输出 {format} 格式")
+    if format == "png":
+        # PNG 无损，质量参数没有意义，统一取 100 以免产生重复的派生图
+        quality = 100
+    return [VariantSpec(format, width, quality) for width in dict.fromkeys(widths or [None])]
+
+
+@dataclass
+class ImageVariant:
+    format: str
+    width: int
+    height: int
+    quality: int
+    data: bytes
+    key: str = ""
+
+    @property
+    def content_type(self) -> str:
+        return FORMATS[self.format][1]
+
+    def describe(self, poster_id: str | None = None) -> dict:
+        """不含图片内容的描述，用于 JSON 响应；存储不能直接访问时，url 指向海报图片接口。"""
+        url = artifact_store.url(self.key) if self.key else None
+        if url is None and poster_id:
+            url = f"/api/posters/{poster_id}/image?format={self.format}&width={self.width}&quality={self.quality}"
+        return {
+            "format": self.format,
+            "width": self.width,
+            "height": self.height,
+            "quality": self.quality,
+            "bytes": len(self.data),
+            "key": self.key,
+            "url": url,
+        }
+
+
+def _encode_variants(image_bytes: bytes, specs: list[VariantSpec]) -> list[ImageVariant]:
+    """在线程中执行：原图只解码一次，依次缩放并编码成各个规格。"""
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    # JPEG 解码时直接按需要的最大尺寸做 DCT 缩放，缩略图场景可以少解码大部分像素
+    target = max(min(spec.width or width, width) for spec in specs)
+    image.draft("RGB", (target, round(height * target / width)))
+    image.load()
+    decoded_width = image.size[0]
+
+    variants = []
+    resized_cache: dict[int, Image.Image] = {}
+    for spec in specs:
+        out_width = min(spec.width or width, width)
+        out_height = max(1, round(height * out_width / width))
+        frame = resized_cache.get(out_width)
+        if frame is None:
+            frame = image if out_width == decoded_width else image.resize((out_width, out_height), Image.LANCZOS)
+            if frame.mode not in ("RGB", "L"):
+                frame = frame.convert("RGB")
+            resized_cache[out_width] = frame
+        buffer = io.BytesIO()
+        if spec.format == "jpeg":
+            frame.save(buffer, "JPEG", quality=spec.quality, progressive=True)
+        elif spec.format == "png":
+            frame.save(buffer, "PNG", compress_level=6)
+        elif spec.format == "webp":
+            frame.save(buffer, "WEBP", quality=spec.quality, method=4)
+        elif spec.format == "avif":
+            frame.save(buffer, "AVIF", quality=spec.quality)
+        variants.append(ImageVariant(spec.format, out_width, frame.size[1], spec.quality, buffer.getvalue()))
+    return variants
+
+
+class ImageVariantService:
+    """
+    由一张截图派生多种格式与尺寸的图片：
+    解码与编码在独立线程池中执行，不阻塞事件循环；派生结果与原图一起保存在存储中，之后直接复用。
+    """
+
+    def __init__(self, workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-variant")
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def derive(self, image_bytes: bytes, specs: list[VariantSpec]) -> list[ImageVariant]:
+        loop = asyncio.get_running_loop()
+        with span("variants", count=len(specs)):
+            return await loop.run_in_executor(self._executor, _encode_variants, image_bytes, specs)
+
+    async def get_or_create(self, original_key: str, original_bytes: bytes | None, specs: list[VariantSpec]) -> list[ImageVariant]:
+        """
+        获取原图（original_key）的派生图：已保存的直接读取，其余一次性派生并保存。
+        original_bytes 为 None 时按需从存储中读取原图。
+        """
+        async def load_original() -> bytes:
+            nonlocal original_bytes
+            if original_bytes is None:
+                original_bytes = await artifact_store.get(original_key)
+                if original_bytes is None:
+                    raise FileNotFoundError(original_key)
+            return original_bytes
+
+        original_width = None
+        if any(spec.width is None for spec in specs):
+            # 保持原图宽度时需要先知道原图宽度才能算出键；只解析文件头，不解码像素
+            with Image.open(io.BytesIO(await load_original())) as probe:
+                original_width = probe.size[0]
+
+        results: list[ImageVariant | None] = []
+        missing: list[tuple[int, VariantSpec]] = []
+        for spec in specs:
+            key = variant_key(original_key, spec.width or original_width, spec.quality, FORMATS[spec.format][0])
+            data = await artifact_store.get(key)
+            if data is not None:
+                with Image.open(io.BytesIO(data)) as probe:
+                    results.append(ImageVariant(spec.format, probe.size[0], probe.size[1], spec.quality, data, key))
+                continue
+            results.append(None)
+            missing.append((len(results) - 1, spec))
+
+        if missing:
+            derived = await self.derive(await load_original(), [spec for _, spec in missing])
+            for (index, spec), variant in zip(missing, derived):
+                # 以实际输出宽度作为键，超过原图宽度的请求会落到同一份派生图上
+                variant.key = variant_key(original_key, variant.width, variant.quality, FORMATS[variant.format][0])
+                await artifact_store.put_as(variant.key, variant.data, variant.content_type)
+                results[index] = variant
+        return results
+
+
+# 全局图片派生服务
+image_variants = ImageVariantService(workers=settings.IMAGE_VARIANT_WORKERS)
@@ -0,0 +1,204 @@
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator
+
+from app.core.config import settings
+from app.services.jobs.store import JobStore, TERMINAL_STATUSES, create_job_store
+from app.services.poster_pipeline import run_poster_pipeline
+from app.services.image_variants import variant_specs
+from app.services.admission import admission
+from app.services.scheduler import FairQueue, normalize_tier, priority, tier_weights
+from app.core.telemetry import metrics
+
+
+class JobQueueFull(Exception):
+    """任务队列已满，需要客户端稍后重试。"""
+
+
+class JobManager:
+    """
+    海报生成任务管理器：提交即返回任务 ID，后台 worker 以固定并发从有界队列中取任务执行，
+    各阶段进度写入任务存储并推送给订阅者（SSE）。
+    队列按用户等级加权公平出队（与各阶段的并发闸门相同），任务执行时也按该等级排队。
+    """
+
+    def __init__(self, store: JobStore, concurrency: int, queue_size: int):
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self._queue: FairQueue[str] = FairQueue("jobs", tier_weights(), settings.PRIORITY_AGING_SECONDS)
+        # 队列中的任务数，worker 据此等待新任务
+        self._queued = asyncio.Semaphore(0)
+        self._workers: list[asyncio.Task] = []
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._running = 0
+
+    async def start(self):
+        await self.store.start()
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        print(f"任务 worker 已启动: 并发 {self.concurrency}，队列容量 {self.queue_size}")
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.store.close()
+
+    async def submit(
+        self,
+        prompt: str,
+        use_cache: bool = True,
+        user_id: str | None = None,
+        output: dict | None = None,
+        tier: str | None = None,
+    ) -> dict:
+        """
+        提交任务；队列已满时抛出 JobQueueFull，用户未完成的任务过多时抛出 AdmissionRejected。
+        output 为输出规格 {format, quality, widths}，为空时只输出原尺寸 JPEG；tier 为用户等级，决定调度优先级。
+        """
+        if len(self._queue) >= self.queue_size:
+            raise JobQueueFull(f"任务队列已满 ({self.queue_size})")
+        if user_id:
+            # 用户配额在任务结束时归还
+            admission.acquire_user(user_id)
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "prompt": prompt,
+            "use_cache": use_cache,
+            "output": output,
+            "user_id": user_id,
+            "tier": normalize_tier(tier),
+            "status": "queued",
+            "stage": None,
+            "stages": {},
+            "error": None,
+            "result": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        try:
+            await self.store.create(job)
+            self._queue.put(job["tier"], job["id"])
+            self._queued.release()
+        except BaseException:
+            if user_id:
+                admission.release_user(user_id)
+            raise
+        return job
+
+    async def get(self, job_id: str) -> dict | None:
+        return await self.store.get(job_id)
+
+    async def _publish(self, job: dict):
+        for queue in self._subscribers.get(job["id"], ()):
+            queue.put_nowait(job)
+
+    async def _update(self, job_id: str, **fields) -> dict | None:
+        job = await self.store.update(job_id, **fields)
+        if job:
+            await self._publish(job)
+        return job
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[dict]:
+        """订阅任务进度：先返回当前状态，之后每次变化推送一次，到达终态后结束。"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            job = await self.store.get(job_id)
+            while job is not None:
+                yield job
+                if job["status"] in TERMINAL_STATUSES:
+                    break
+                job = await queue.get()
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    async def _worker(self, index: int):
+        while True:
+            await self._queued.acquire()
+            _, job_id = self._queue.pop()
+            self._running += 1
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"任务 worker-{index} 处理 {job_id} 时出错: {e}")
+            finally:
+                self._running -= 1
+
+    async def _run(self, job_id: str):
+        job = await self._update(job_id, status="running", started_at=time.time())
+        if job is None:
+            return
+        try:
+            with priority(job.get("tier")):
+                await self._execute(job)
+        finally:
+            # 按用户感受到的耗时统计（含排队）
+            admission.record_latency(normalize_tier(job.get("tier")), time.time() - job["created_at"])
+            if job.get("user_id"):
+                admission.release_user(job["user_id"])
+
+    async def _execute(self, job: dict):
+        job_id = job["id"]
+        stages = {}
+        start = time.time()
+
+        async def on_stage(stage: str):
+            stages[stage] = round(time.time() - start, 3)
+            await self._update(job_id, stage=stage, stages=dict(stages))
+
+        try:
+            output = job.get("output")
+            result = await run_poster_pipeline(
+                job["prompt"],
+                on_stage=on_stage,
+                use_cache=job.get("use_cache", True),
+                variants=variant_specs(output["format"], output["quality"], output["widths"]) if output else None,
+            )
+        except Exception as e:
+            print(f"任务 {job_id} 失败: {e}")
+            await self._update(job_id, status="failed", error=str(e))
+            return
+        await self._update(
+            job_id,
+            status="succeeded",
+            result={
+                "width": result.width,
+                "height": result.height,
+                "image_urls": result.image_urls,
+                "poster_id": result.poster_id,
+                "image_key": result.image_key,
+                "cached": result.cached,
+                # 存储不能直接访问时，通过任务结果接口下载
+                "url": result.image_url or f"/api/jobs/{job_id}/result",
+                "variants": [variant.describe(result.poster_id) for variant in result.variants],
+                "timeline": result.timeline,
+            },
+        )
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._queue),
+            "queue_size": self.queue_size,
+            "tiers": self._queue.stats(),
+            "running": self._running,
+            "concurrency": self.concurrency,
+        }
+
+
+# 全局任务管理器
+job_manager = JobManager(
+    store=create_job_store(settings.JOB_STORE_BACKEND, settings.JOB_STORE_PATH),
+    concurrency=settings.JOB_WORKER_CONCURRENCY,
+    queue_size=settings.JOB_QUEUE_SIZE,
+)
+
+metrics.gauge("poster_job_queue_depth", "排队中的异步任务数", callback=lambda: len(job_manager._queue))
+metrics.gauge("poster_jobs_running", "执行中的异步任务数", callback=lambda: job_manager._running)
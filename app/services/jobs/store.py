@@ -0,0 +1,127 @@
+import asyncio
+import copy
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+
+# 任务的终态，到达后不再变化
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobStore(ABC):
+    """任务状态存储接口。任务以 dict 表示，至少包含 id / status / stage / created_at / updated_at。"""
+
+    @abstractmethod
+    async def create(self, job: dict): ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> dict | None: ...
+
+    @abstractmethod
+    async def update(self, job_id: str, **fields) -> dict | None: ...
+
+    async def start(self):
+        """在应用启动时调用。"""
+
+    async def close(self):
+        """在应用关闭时调用。"""
+
+
+class MemoryJobStore(JobStore):
+    """进程内存中的任务存储（默认），进程重启后任务丢失。"""
+
+    def __init__(self, max_jobs: int = 10000):
+        self.max_jobs = max_jobs
+        self._jobs: dict[str, dict] = {}
+
+    async def create(self, job: dict):
+        self._jobs[job["id"]] = job
+        # 超出上限时淘汰最早的已结束任务
+        if len(self._jobs) > self.max_jobs:
+            for job_id, old in list(self._jobs.items()):
+                if old["status"] in TERMINAL_STATUSES:
+                    del self._jobs[job_id]
+                    break
+
+    async def get(self, job_id: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        return copy.deepcopy(job) if job else None
+
+    async def update(self, job_id: str, **fields) -> dict | None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.update(fields, updated_at=time.time())
+        return copy.deepcopy(job)
+
+
+class SqliteJobStore(JobStore):
+    """SQLite 任务存储，任务状态在进程重启后仍可查询。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = asyncio.Lock()
+
+    async def _run(self, fn, *args):
+        # sqlite3 是阻塞 API，放到线程中执行；连接只允许串行使用
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    async def start(self):
+        def _open():
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)")
+            # 上次进程退出时尚未完成的任务已无法继续，标记为失败
+            rows = conn.execute("SELECT id, data FROM jobs").fetchall()
+            for job_id, data in rows:
+                job = json.loads(data)
+                if job["status"] not in TERMINAL_STATUSES:
+                    job.update(status="failed", error="服务重启，任务中断", updated_at=time.time())
+                    conn.execute("UPDATE jobs SET data = ?, updated_at = ? WHERE id = ?", (json.dumps(job, ensure_ascii=False), job["updated_at"], job_id))
+            conn.commit()
+            return conn
+        self._conn = await self._run(_open)
+
+    async def close(self):
+        if self._conn:
+            await self._run(self._conn.close)
+            self._conn = None
+
+    def _write(self, job: dict):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, data, updated_at) VALUES (?, ?, ?)",
+            (job["id"], json.dumps(job, ensure_ascii=False), job["updated_at"]),
+        )
+        self._conn.commit()
+
+    def _read(self, job_id: str) -> dict | None:
+        row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def create(self, job: dict):
+        await self._run(self._write, job)
+
+    async def get(self, job_id: str) -> dict | None:
+        return await self._run(self._read, job_id)
+
+    async def update(self, job_id: str, **fields) -> dict | None:
+        def _update():
+            job = self._read(job_id)
+            if job is None:
+                return None
+            job.update(fields, updated_at=time.time())
+            self._write(job)
+            return job
+        return await self._run(_update)
+
+
+def create_job_store(backend: str, path: str) -> JobStore:
+    """根据配置创建任务存储："memory" 或 "sqlite"。"""
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "sqlite":
+        return SqliteJobStore(path)
+    raise ValueError(f"未知的任务存储后端: {backend}")
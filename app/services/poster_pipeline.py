@@ -0,0 +1,341 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from app.core.config import settings
+from app.services.ai_service import SharedGeneration, generate_html_from_ai
+from app.services.generator.editor import EditError, edit_html
+from app.services.renderer.image_ingest import image_ingest
+from app.services.renderer_service import render_html_to_image, SpeculativePage
+from app.services.storage_service import save_artifacts, poster_manifest_key
+from app.services.storage.store import artifact_store
+from app.services.image_variants import ImageVariant, VariantSpec, image_variants
+from app.services.result_cache import result_cache, result_cache_key
+from app.services.resilience import deadline, within_deadline
+from app.utils.singleflight import SingleFlight
+from app.core.telemetry import metrics, span, start_trace, finish_trace
+
+# 流水线各阶段完成时上报的事件名，按正常完成顺序排列
+PIPELINE_STAGES = ("planned", "images_ready", "html_ready", "rendered", "stored")
+
+# 生成阶段的请求合并：相同缓存键的并发请求只调用一次 AI
+generation_flight = SingleFlight("generation")
+
+
+
+@dataclass
+class _Listener:
+    on_stage: Callable[[str], Awaitable[None]] | None
+    speculative: SpeculativePage | None
+    delivered: int = 0  # 已经转发给该调用方的阶段数
+
+
+class GenerationProgress:
+    """
+    一次（可能被多个请求合并的）生成的进度：共享的生成只向它报告阶段事件与 <head>，
+    由它转发给当前加入的每个调用方（各自的 on_stage 与预渲染页面），后加入的调用方先补发已经发生的事件。
+    共享的生成不持有任何调用方的回调或页面，某个调用方被取消、释放页面不会影响其他调用方。
+    """
+
+    def __init__(self):
+        self.stages: list[str] = []
+        self.head: tuple[str, int, int] | None = None
+        self._listeners: list[_Listener] = []
+
+    async def _deliver(self, listener: _Listener):
+        while listener.delivered < len(self.stages):
+            stage = self.stages[listener.delivered]
+            listener.delivered += 1
+            if listener.on_stage:
+                try:
+                    await listener.on_stage(stage)
+                except Exception as e:
+                    # 某个调用方上报失败不影响共享的生成
+                    print(f"上报阶段 {stage} 时出错: {e}")
+
+    async def on_stage(self, stage: str):
+        self.stages.append(stage)
+        for listener in list(self._listeners):
+            await self._deliver(listener)
+
+    def on_head(self, head: str, width: int, height: int):
+        self.head = (head, width, height)
+        for listener in list(self._listeners):
+            if listener.speculative:
+                listener.speculative.start(head, width, height)
+
+    @asynccontextmanager
+    async def attach(self, on_stage: Callable[[str], Awaitable[None]] | None, speculative: SpeculativePage | None):
+        """在 with 块内接收进度；加入时补发已经发生的阶段事件，<head> 已生成时立即开始预渲染。"""
+        listener = _Listener(on_stage, speculative)
+        self._listeners.append(listener)
+        try:
+            if speculative and self.head:
+                speculative.start(*self.head)
+            await self._deliver(listener)
+            yield
+        finally:
+            self._listeners.remove(listener)
+
+
+# 进行中的生成的进度，键与 generation_flight 相同
+_generation_progress: dict[str, GenerationProgress] = {}
+
+
+async def _generate(cache_key: str, progress: GenerationProgress, prompt: str, shared_generation: SharedGeneration | None):
+    try:
+        result = await generate_html_from_ai(
+            prompt,
+            on_head=progress.on_head,
+            on_stage=progress.on_stage,
+            shared=shared_generation,
+        )
+        return result, progress
+    finally:
+        if _generation_progress.get(cache_key) is progress:
+            del _generation_progress[cache_key]
+
+
+pipeline_requests = metrics.counter(
+    "poster_pipeline_requests_total", "流水线执行次数，按结果分类（generated / cached / edited / error）", ("outcome",)
+)
+
+
+@dataclass
+class PosterResult:
+    """一次海报生成的全部产物。"""
+    html_content: str
+    width: int
+    height: int
+    image_urls: list[str]
+    image_bytes: bytes
+    poster_id: str  # 海报清单 id，对应存储中的 posters/<id>.json
+    image_key: str  # 最终海报在存储中的对象键
+    image_url: str | None  # 最终海报的访问地址（存储不可直接访问时为 None）
+    image_keys: list[str | None] = field(default_factory=list)  # 生成图片在存储中的对象键，与 image_urls 对应
+    metrics: dict = field(default_factory=dict)  # 各阶段耗时（秒），来自本次请求的 Trace
+    timeline: list[dict] = field(default_factory=list)  # 各阶段的开始 / 结束时间（毫秒），来自本次请求的 Trace
+    variants: list[ImageVariant] = field(default_factory=list)  # 按请求的输出规格派生的图片，顺序与规格一致
+    cached: bool = False  # 是否命中结果缓存
+    edit_mode: str | None = None  # 增量修改的方式（slots / html），新生成的海报为 None
+
+
+async def run_poster_pipeline(
+    prompt: str,
+    on_stage: Callable[[str], Awaitable[None]] | None = None,
+    use_cache: bool = True,
+    variants: list[VariantSpec] | None = None,
+    shared_generation: SharedGeneration | None = None,
+) -> PosterResult:
+    """
+    完整的海报生成流水线：查结果缓存 -> AI 生成 HTML -> 渲染 -> 保存产物。
+    同步接口和异步任务共用这一流程；on_stage 在每个阶段完成时被调用。
+    产物只放入后台写入队列，截图完成即可返回；传入 on_stage 时会等到落盘后再上报 "stored"。
+    use_cache=False 时跳过缓存查询（生成结果仍会写入缓存）。
+    variants 为需要额外输出的格式 / 尺寸，在截图完成后由同一张图片派生，并与原图一起保存。
+    shared_generation 为批量生成时共用的规划与生图（见 batch_service）。
+    各阶段耗时记录在本次请求的 Trace 中，结果的 metrics 为 {阶段: 秒}。
+    整个流程受 REQUEST_DEADLINE 截止时间约束，超时抛出 DeadlineExceeded。
+    """
+    trace = start_trace("poster")
+    try:
+        with span("total"), deadline(settings.REQUEST_DEADLINE):
+            result = await _run_pipeline(prompt, on_stage, use_cache, variants or [], shared_generation)
+    except BaseException:
+        pipeline_requests.inc(outcome="error")
+        raise
+    finally:
+        finish_trace(trace)
+    pipeline_requests.inc(outcome="cached" if result.cached else "generated")
+    if trace is not None:
+        result.metrics = trace.timings()
+        result.timeline = trace.timeline()
+    return result
+
+
+async def _run_pipeline(
+    prompt: str,
+    on_stage: Callable[[str], Awaitable[None]] | None,
+    use_cache: bool,
+    variants: list[VariantSpec],
+    shared_generation: SharedGeneration | None,
+) -> PosterResult:
+    cache_key = result_cache_key(prompt)
+    if settings.RESULT_CACHE_ENABLED and use_cache:
+        with span("cache") as s:
+            cached = await result_cache.get(cache_key)
+            s.set(hit=bool(cached))
+        if cached:
+            print(f"命中结果缓存 {cache_key[:12]}")
+            # 内容与之前的生成相同，存储中只新增一份清单
+            # 生成图片此时通常已不在预取内存中，沿用缓存条目记录的对象键
+            return await _store(
+                prompt, cached["html_content"], cached["width"], cached["height"],
+                cached["image_urls"], cached["image_bytes"], variants, on_stage, cached=True,
+                image_keys=cached["image_keys"],
+            )
+
+    async def report(stage: str):
+        if on_stage:
+            await on_stage(stage)
+
+    def start_generation():
+        # 只有发起生成的请求会调用（generation_flight 中没有进行中的相同生成时）
+        _generation_progress[cache_key] = progress
+        return _generate(cache_key, progress, prompt, shared_generation)
+
+    # 流式生成 HTML 时，<head> 一到就在本请求自己的预渲染页面中加载字体
+    speculative = SpeculativePage(prompt) if settings.HTML_STREAMING and settings.HTML_SPECULATIVE_RENDER else None
+    progress = _generation_progress.get(cache_key) or GenerationProgress()
+    try:
+        # 1. 调用 AI 生成 HTML、尺寸和图片 URL
+        with span("generate") as s:
+            async with progress.attach(on_stage, speculative):
+                ((html_content, width, height, image_urls), used), shared = await generation_flight.do(
+                    cache_key, start_generation
+                )
+            if used is not progress:
+                # 加入时生成刚好结束、进度已经移除：从实际的生成补发阶段事件
+                async with used.attach(on_stage, speculative):
+                    pass
+            s.set(shared=shared)
+        if shared:
+            print(f"合并到进行中的相同生成请求 {cache_key[:12]}")
+
+        # 2. 渲染 HTML 为图片
+        with span("render"):
+            image_bytes = await within_deadline(
+                render_html_to_image(html_content, width, height, speculative=speculative), "render"
+            )
+        await report("rendered")
+    finally:
+        if speculative:
+            await speculative.release()
+
+    # 3. 保存所有产物
+    result = await _store(prompt, html_content, width, height, image_urls, image_bytes, variants, on_stage)
+
+    # 只缓存成功的生成结果（失败时 image_urls 为空，HTML 是错误页）；缓存写入同样不阻塞响应
+    if settings.RESULT_CACHE_ENABLED and image_urls:
+        _in_background(
+            result_cache.put(cache_key, image_bytes, html_content, width, height, image_urls, result.image_keys)
+        )
+    return result
+
+
+async def run_edit_pipeline(
+    poster: dict,
+    instruction: str,
+    variants: list[VariantSpec] | None = None,
+) -> PosterResult:
+    """
+    增量修改已有海报：读取保存的 HTML -> 模型给出补丁（版式数据或 HTML 片段替换）-> 只重新渲染这一页 -> 保存为新海报。
+    不重新规划、不重新生图，图片沿用原海报的图片（仍在预取内存中时直接使用，否则从存储恢复）；新海报清单记录 edited_from。
+    原海报的图片无法获取时在调用模型之前抛出 EditError。
+    整个流程受 EDIT_DEADLINE 截止时间约束，原海报的 HTML 不存在时抛出 FileNotFoundError。
+    """
+    trace = start_trace("edit")
+    try:
+        with span("total"), deadline(settings.EDIT_DEADLINE):
+            result = await _run_edit(poster, instruction, variants or [])
+    except BaseException:
+        pipeline_requests.inc(outcome="error")
+        raise
+    finally:
+        finish_trace(trace)
+    pipeline_requests.inc(outcome="edited")
+    if trace is not None:
+        result.metrics = trace.timings()
+        result.timeline = trace.timeline()
+    return result
+
+
+async def _run_edit(poster: dict, instruction: str, variants: list[VariantSpec]) -> PosterResult:
+    html_bytes = await artifact_store.get(poster["html"])
+    if html_bytes is None:
+        raise FileNotFoundError(poster["html"])
+    width, height, image_urls = poster["width"], poster["height"], poster["image_urls"]
+
+    # 先确认原海报的图片可用，再发起付费的补丁请求：图片取不到时修改必然失败，不为此调用模型。
+    # 预取通常是内存命中；已被淘汰时从存储恢复生成时保存的图片，旧海报没有保存图片时才重新下载（服务商 URL 可能已过期）
+    with span("ingest"):
+        await image_ingest.restore(image_urls, poster.get("image_keys") or [])
+        await image_ingest.prepare(image_urls, width, height)
+    if image_ingest.missing(image_urls):
+        raise EditError("原海报的图片已无法获取（服务商链接可能已过期），请重新生成海报")
+    with span("edit") as s:
+        html_content, mode = await edit_html(html_bytes.decode("utf-8"), image_urls, width, height, instruction)
+        s.set(mode=mode)
+    with span("render"):
+        image_bytes = await within_deadline(render_html_to_image(html_content, width, height), "render")
+
+    result = await _store(
+        poster.get("prompt", ""), html_content, width, height, image_urls, image_bytes, variants, None,
+        edited_from=poster["id"],
+    )
+    result.edit_mode = mode
+    return result
+
+
+async def _store(
+    prompt: str,
+    html_content: str,
+    width: int,
+    height: int,
+    image_urls: list[str],
+    image_bytes: bytes,
+    variants: list[VariantSpec],
+    on_stage: Callable[[str], Awaitable[None]] | None,
+    cached: bool = False,
+    edited_from: str | None = None,
+    image_keys: list[str | None] | None = None,
+) -> PosterResult:
+    with span("store"):
+        # 预取的图片随海报一起保存（按内容寻址，修改后的海报复用原海报的对象），之后修改时不依赖会过期的服务商 URL；
+        # 调用方已有对象键（命中结果缓存）时直接沿用
+        if image_keys is None:
+            image_keys = await image_ingest.persist(image_urls)
+        poster = await save_artifacts(
+            html_content, image_urls, image_bytes, width, height, prompt, edited_from, image_keys
+        )
+    derived = []
+    if variants:
+        # 派生图已保存过时直接复用（如命中结果缓存），否则在线程池中一次解码、多次编码
+        derived = await image_variants.get_or_create(poster["image"], image_bytes, variants)
+    if on_stage:
+        # 异步任务需要保证 "stored" 之后结果可以下载
+        with span("store.flush"):
+            await artifact_store.wait(
+                [poster["image"], poster["html"], poster_manifest_key(poster["id"])] + [v.key for v in derived]
+            )
+        await on_stage("stored")
+    return PosterResult(
+        html_content=html_content,
+        width=width,
+        height=height,
+        image_urls=image_urls,
+        image_bytes=image_bytes,
+        poster_id=poster["id"],
+        image_key=poster["image"],
+        image_url=poster["url"],
+        image_keys=image_keys,
+        variants=derived,
+        cached=cached,
+    )
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _in_background(coro):
+    """在后台执行不影响响应的写入，保留引用直到完成。"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+
+def _background_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"后台写入结果缓存失败: {task.exception()}")
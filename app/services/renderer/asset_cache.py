@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
+
+import aiofiles
+import aiohttp
+from playwright.async_api import Route
+
+from app.core.config import settings
+from app.core.prompts import SYSTEM_PROMPT
+
+# 字体 CSS 所在的域名（CSS 只缓存这些域名下的，字体和图片不限域名）
+FONT_CSS_HOSTS = {"fonts.loli.net", "fonts.googleapis.com"}
+# 预热字体 CSS 时使用的 UA：字体服务会根据 UA 返回不同格式，这里与 Chromium 保持一致以拿到 woff2
+PREFILL_USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/131.0.0.0 Safari/537.36"
+)
+
+
+def prompt_font_css_urls() -> list[str]:
+    """提取 SYSTEM_PROMPT 中允许模型引入的字体 CSS 地址。"""
+    return re.findall(r"@import url\('([^']+)'\)", SYSTEM_PROMPT)
+
+
+class AssetCache:
+    """
+    渲染资源（字体、字体 CSS、图片）的本地缓存，通过 Playwright 请求拦截提供给页面。
+
+    - 条目以 URL 为键，内容以 SHA-256 存储在磁盘上（相同内容只存一份）；
+    - 热点内容同时保存在内存 LRU 中；
+    - 超出磁盘容量上限时按最近最少使用淘汰；
+    - 离线模式下未命中的请求直接中止，不访问外网。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, memory_max_bytes: int, offline: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self.offline = offline
+        # url -> {"sha256", "size", "content_type"}，顺序即 LRU 顺序（末尾为最近使用）
+        self._index: OrderedDict[str, dict] = OrderedDict()
+        # sha256 -> 引用该内容的 URL 数；同一内容可能被多个 URL 引用，引用数归零时才删除文件
+        self._refs: dict[str, int] = {}
+        self._disk_bytes = 0
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = asyncio.Lock()
+        self._dirty = False
+        self._save_task: asyncio.Task | None = None
+        self._writes: set[asyncio.Task] = set()  # 回源后在后台写入缓存的任务
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", sha256[:2], sha256)
+
+    @property
+    def disk_bytes(self) -> int:
+        return self._disk_bytes
+
+    def _set_entry(self, url: str, entry: dict):
+        """写入（或替换）URL 对应的条目并放到 LRU 末尾；先增加新内容的引用，再释放旧内容。"""
+        previous = self._index.pop(url, None)
+        self._index[url] = entry
+        sha256 = entry["sha256"]
+        if sha256 not in self._refs:
+            self._disk_bytes += entry["size"]
+        self._refs[sha256] = self._refs.get(sha256, 0) + 1
+        if previous is not None:
+            self._release(previous)
+
+    def _release(self, entry: dict):
+        """释放一个已从索引中移除的条目对内容的引用，最后一个引用释放时删除文件。"""
+        sha256 = entry["sha256"]
+        remaining = self._refs[sha256] - 1
+        if remaining > 0:
+            self._refs[sha256] = remaining
+            return
+        del self._refs[sha256]
+        self._disk_bytes -= entry["size"]
+        if sha256 in self._memory:
+            self._memory_bytes -= len(self._memory.pop(sha256))
+        try:
+            os.remove(self._blob_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    async def load(self):
+        """从磁盘加载索引，丢弃已不存在的条目。"""
+        os.makedirs(os.path.join(self.cache_dir, "blobs"), exist_ok=True)
+        if not os.path.exists(self._index_path):
+            return
+        try:
+            async with aiofiles.open(self._index_path, "r", encoding="utf-8") as f:
+                entries = json.loads(await f.read())
+        except Exception as e:
+            print(f"读取资源缓存索引失败，将重建: {e}")
+            return
+        for url, entry in entries:
+            if os.path.exists(self._blob_path(entry["sha256"])):
+                self._set_entry(url, entry)
+        print(f"资源缓存已加载: {len(self._index)} 个条目，{self.disk_bytes / 1024 / 1024:.1f}MB")
+
+    async def close(self):
+        """在应用关闭时调用：等待后台写入完成，再把索引写回磁盘。"""
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+        await self.save()
+
+    async def save(self):
+        """将索引写回磁盘（仅在有变更时）。"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        payload = json.dumps(list(self._index.items()), ensure_ascii=False)
+        tmp_path = self._index_path + ".tmp"
+        async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+            await f.write(payload)
+        os.replace(tmp_path, self._index_path)
+
+    def _remember(self, sha256: str, body: bytes):
+        if len(body) > self.memory_max_bytes:
+            return
+        if sha256 in self._memory:
+            self._memory.move_to_end(sha256)
+            return
+        self._memory[sha256] = body
+        self._memory_bytes += len(body)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    async def get(self, url: str) -> tuple[bytes, str] | None:
+        """
+        按 URL 读取缓存，返回 (内容, Content-Type)。
+        不加锁：索引只在两次 await 之间同步修改，与 put / 淘汰不会交错；
+        读取文件期间条目可能已被淘汰或替换，只移除仍是本次读取的那个条目。
+        """
+        entry = self._index.get(url)
+        if entry is None:
+            return None
+        self._index.move_to_end(url)
+        sha256 = entry["sha256"]
+        body = self._memory.get(sha256)
+        if body is None:
+            try:
+                async with aiofiles.open(self._blob_path(sha256), "rb") as f:
+                    body = await f.read()
+            except FileNotFoundError:
+                body = None
+            if body is None or hashlib.sha256(body).hexdigest() != sha256:
+                # 文件丢失（被淘汰）或内容损坏，视为未命中
+                if self._index.get(url) is entry:
+                    del self._index[url]
+                    self._release(entry)
+                    self._dirty = True
+                return None
+        self._remember(sha256, body)
+        return body, entry["content_type"]
+
+    async def put(self, url: str, body: bytes, content_type: str):
+        """写入缓存，并在超出容量时淘汰最久未使用的条目。"""
+        if len(body) > self.max_bytes:
+            return
+        sha256 = hashlib.sha256(body).hexdigest()
+        blob_path = self._blob_path(sha256)
+        async with self._lock:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                tmp_path = f"{blob_path}.{os.getpid()}.tmp"
+                async with aiofiles.open(tmp_path, "wb") as f:
+                    await f.write(body)
+                os.replace(tmp_path, blob_path)
+            self._set_entry(url, {"sha256": sha256, "size": len(body), "content_type": content_type})
+            self._dirty = True
+            self._remember(sha256, body)
+            await self._evict()
+        self._schedule_save()
+
+    def _schedule_save(self, delay: float = 5.0):
+        """合并短时间内的多次写入，延迟落盘索引。"""
+        if self._save_task and not self._save_task.done():
+            return
+
+        async def _delayed_save():
+            await asyncio.sleep(delay)
+            try:
+                await self.save()
+            except Exception as e:
+                print(f"保存资源缓存索引失败: {e}")
+
+        self._save_task = asyncio.create_task(_delayed_save())
+
+    async def _evict(self):
+        while self._disk_bytes > self.max_bytes and self._index:
+            _, entry = self._index.popitem(last=False)
+            self.evictions += 1
+            self._release(entry)
+
+    def is_cacheable(self, method: str, url: str, resource_type: str) -> bool:
+        if method != "GET" or not url.startswith(("http://", "https://")):
+            return False
+        if resource_type in ("font", "image"):
+            return True
+        return resource_type == "stylesheet" and urlsplit(url).hostname in FONT_CSS_HOSTS
+
+    async def handle_route(self, route: Route):
+        """Playwright 路由处理函数：命中缓存直接返回，未命中则回源并写入缓存。"""
+        request = route.request
+        if not self.is_cacheable(request.method, request.url, request.resource_type):
+            await route.fallback()
+            return
+
+        cached = await self.get(request.url)
+        if cached is not None:
+            self.hits += 1
+            body, content_type = cached
+            await route.fulfill(
+                status=200,
+                body=body,
+                headers={"content-type": content_type, "access-control-allow-origin": "*"},
+            )
+            return
+
+        self.misses += 1
+        if self.offline:
+            await route.abort()
+            return
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception as e:
+            print(f"资源回源失败 {request.url}: {e}")
+            await route.abort()
+            return
+        # 先把回源结果交给页面，写入磁盘在后台完成，不占用渲染时间
+        await route.fulfill(response=response, body=body)
+        if response.ok:
+            self._put_in_background(request.url, body, response.headers.get("content-type", "application/octet-stream"))
+
+    def _put_in_background(self, url: str, body: bytes, content_type: str):
+        """在后台写入缓存，保留引用直到完成；关闭时 close() 会等待这些写入。"""
+        task = asyncio.create_task(self.put(url, body, content_type))
+        self._writes.add(task)
+        task.add_done_callback(self._write_done)
+
+    def _write_done(self, task: asyncio.Task):
+        self._writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"写入资源缓存失败: {task.exception()}")
+
+    async def prefill(self, css_urls: list[str], concurrency: int = 8):
+        """预热字体：下载字体 CSS 及其引用的全部字体文件（已缓存的跳过）。"""
+        if self.offline:
+            return
+        print(f"开始预热字体缓存: {len(css_urls)} 个字体 CSS")
+        semaphore = asyncio.Semaphore(concurrency)
+        headers = {"User-Agent": PREFILL_USER_AGENT}
+
+        async with aiohttp.ClientSession(headers=headers) as session:
+            async def fetch(url: str, default_type: str) -> bytes | None:
+                cached = await self.get(url)
+                if cached is not None:
+                    return cached[0]
+                async with semaphore:
+                    try:
+                        async with session.get(url) as response:
+                            response.raise_for_status()
+                            body = await response.read()
+                            await self.put(url, body, response.headers.get("Content-Type", default_type))
+                            return body
+                    except Exception as e:
+                        print(f"预热资源 {url} 失败: {e}")
+                        return None
+
+            font_urls = []
+            for css_url in css_urls:
+                css = await fetch(css_url, "text/css")
+                if css:
+                    for font_url in re.findall(r"url\(([^)]+)\)", css.decode("utf-8", "ignore")):
+                        font_urls.append(urljoin(css_url, font_url.strip("'\"")))
+            await asyncio.gather(*(fetch(u, "font/woff2") for u in dict.fromkeys(font_urls)))
+        await self.save()
+        print(f"字体缓存预热完成: {len(font_urls)} 个字体文件，缓存占用 {self.disk_bytes / 1024 / 1024:.1f}MB")
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._index),
+            "disk_bytes": self.disk_bytes,
+            "memory_bytes": self._memory_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# 全局资源缓存实例
+asset_cache = AssetCache(
+    cache_dir=settings.ASSET_CACHE_DIR,
+    max_bytes=settings.ASSET_CACHE_MAX_MB * 1024 * 1024,
+    memory_max_bytes=settings.ASSET_CACHE_MEMORY_MB * 1024 * 1024,
+    offline=settings.ASSET_CACHE_OFFLINE,
+)
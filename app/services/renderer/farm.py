@@ -0,0 +1,82 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable
+
+
+class RenderFarm:
+    """
+    渲染集群：同时运行 N 个浏览器实例（每个实例各自拥有 Playwright 驱动进程和页面池）。
+
+    - 调度：按负载最低优先分配渲染任务；
+    - 自愈：浏览器意外断开时自动重启；
+    - 防泄漏：单个浏览器达到最大渲染次数后排空并重启。
+    """
+
+    def __init__(self, manager_factory: Callable, size: int, max_renders_per_browser: int):
+        self.managers = [manager_factory(f"browser-{i}") for i in range(max(1, size))]
+        self.max_renders_per_browser = max_renders_per_browser
+        self.restarts = 0
+        self._restart_tasks: dict[str, asyncio.Task] = {}
+        for manager in self.managers:
+            manager.on_crash = lambda m: self._schedule_restart(m, "浏览器崩溃")
+
+    async def start(self):
+        """在应用启动时调用，启动全部浏览器。"""
+        await asyncio.gather(*(m.start_browser() for m in self.managers))
+
+    async def close(self):
+        """在应用关闭时调用，停止重启任务并关闭全部浏览器。"""
+        for task in self._restart_tasks.values():
+            task.cancel()
+        self._restart_tasks.clear()
+        await asyncio.gather(*(m.close_browser() for m in self.managers), return_exceptions=True)
+
+    def _pick(self):
+        """选出负载最低的可用浏览器；全部不可用时退回到全体中挑选（等待其重启完成）。"""
+        available = [
+            m for m in self.managers
+            if not m.crashed and m.name not in self._restart_tasks
+        ]
+        return min(available or self.managers, key=lambda m: m.load())
+
+    @asynccontextmanager
+    async def lease_page(self):
+        """从负载最低的浏览器借用一个页面。"""
+        manager = self._pick()
+        async with manager.lease_page() as page:
+            yield page
+        manager.renders += 1
+        if self.max_renders_per_browser and manager.renders >= self.max_renders_per_browser:
+            self._schedule_restart(manager, f"已渲染 {manager.renders} 次，定期回收")
+
+    def _schedule_restart(self, manager, reason: str):
+        if manager.name in self._restart_tasks:
+            return
+        print(f"计划重启浏览器实例 {manager.name}: {reason}")
+        self._restart_tasks[manager.name] = asyncio.create_task(self._restart(manager))
+
+    async def _restart(self, manager):
+        try:
+            await manager.restart_browser()
+            self.restarts += 1
+            print(f"浏览器实例 {manager.name} 已重启。")
+        except Exception as e:
+            print(f"重启浏览器实例 {manager.name} 失败: {e}")
+        finally:
+            self._restart_tasks.pop(manager.name, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.managers),
+            "restarts": self.restarts,
+            "browsers": [
+                {
+                    "name": m.name,
+                    "renders": m.renders,
+                    "crashed": m.crashed,
+                    "restarting": m.name in self._restart_tasks,
+                    "pool": m.pool.stats(),
+                }
+                for m in self.managers
+            ],
+        }
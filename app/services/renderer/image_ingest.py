@@ -0,0 +1,243 @@
+import asyncio
+import io
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from PIL import Image
+from playwright.async_api import Route
+
+from app.core.config import settings
+from app.core.telemetry import metrics
+from app.services.storage.store import artifact_store
+
+ingest_total = metrics.counter(
+    "poster_image_ingest_total", "生成图片的预取结果（resized / original / failed）", ("outcome",)
+)
+ingest_bytes = metrics.counter(
+    "poster_image_ingest_bytes_total", "预取图片的字节数（downloaded：下载的原图，served：提供给页面的图片）", ("kind",)
+)
+
+
+def _fit_cover(data: bytes, width: int, height: int, quality: int) -> tuple[bytes, str, int, int] | None:
+    """
+    在线程中执行：把图片缩小到刚好能铺满 width x height（背景图 cover 所需的最小尺寸）。
+    原图不大于该尺寸时返回 None，直接使用原图。
+    """
+    image = Image.open(io.BytesIO(data))
+    src_width, src_height = image.size
+    scale = max(width / src_width, height / src_height)
+    if scale >= 1:
+        return None
+    out_size = (max(1, round(src_width * scale)), max(1, round(src_height * scale)))
+    # JPEG 解码时直接做 DCT 缩放，只解码需要的像素
+    image.draft("RGB", out_size)
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    image = image.resize(out_size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    if image.mode in ("RGBA", "LA"):
+        # 保留透明通道（抠图主体等）
+        image.save(buffer, "PNG", compress_level=1)
+        return buffer.getvalue(), "image/png", out_size[0], out_size[1]
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue(), "image/jpeg", out_size[0], out_size[1]
+
+
+class ImageIngestor:
+    """
+    生成图片的预取与缩放：生图服务返回 URL 后立即用共享的连接池下载，按海报尺寸在线程池中缩小，
+    渲染时通过请求拦截从内存返回。Chromium 不再访问服务商 CDN，也只需解码缩小后的像素。
+    HTML 中保留原始 URL（存储的 HTML 不依赖本地状态）；预取失败的图片按原方式由页面自行加载。
+    """
+
+    def __init__(self, workers: int, memory_max_bytes: int, timeout: float, max_bytes: int, quality: int):
+        self.memory_max_bytes = memory_max_bytes
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-ingest")
+        self._session: aiohttp.ClientSession | None = None
+        self._downloads: dict[str, asyncio.Task] = {}
+        # url -> (图片内容, Content-Type, 宽, 高, 是否为原图)，顺序即 LRU 顺序（末尾为最近使用）
+        self._images: OrderedDict[str, tuple[bytes, str, int, int, bool]] = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.failures = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=settings.AI_HTTP_MAX_CONNECTIONS, ttl_dns_cache=300),
+            )
+        return self._session
+
+    async def close(self):
+        """在应用关闭时调用：取消未完成的下载并关闭连接池。"""
+        for task in self._downloads.values():
+            task.cancel()
+        await asyncio.gather(*self._downloads.values(), return_exceptions=True)
+        self._downloads.clear()
+        if self._session is not None:
+            await self._session.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _download(self, url: str) -> bytes:
+        async with self._get_session().get(url) as response:
+            response.raise_for_status()
+            if response.content_length and response.content_length > self.max_bytes:
+                raise ValueError(f"图片过大 ({response.content_length} bytes)")
+            data = await response.content.read(self.max_bytes + 1)
+            if len(data) > self.max_bytes:
+                raise ValueError("图片过大")
+        ingest_bytes.inc(len(data), kind="downloaded")
+        return data
+
+    def prefetch(self, url: str):
+        """生图服务返回 URL 后立即开始下载（不等待），同一 URL 只下载一次。"""
+        if not settings.IMAGE_INGEST_ENABLED or not url.startswith(("http://", "https://")):
+            return
+        if url not in self._images:
+            self._start_download(url)
+
+    def _start_download(self, url: str) -> asyncio.Task:
+        if url not in self._downloads:
+            task = asyncio.create_task(self._download(url))
+            task.add_done_callback(lambda task: self._download_done(url, task))
+            self._downloads[url] = task
+        return self._downloads[url]
+
+    def _download_done(self, url: str, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            # 失败的下载不保留，prepare 时会重新尝试一次
+            self._forget(url, task)
+        else:
+            # 生成中途失败、没有走到 prepare 的下载，一段时间后释放
+            asyncio.get_running_loop().call_later(self.timeout, self._forget, url, task)
+
+    def _forget(self, url: str, task: asyncio.Task):
+        if self._downloads.get(url) is task:
+            del self._downloads[url]
+
+    async def prepare(self, urls: list[str], width: int, height: int):
+        """等待下载完成，把图片缩小到海报尺寸后放入内存，供渲染时拦截返回。失败时只记录，不影响生成。"""
+        if not settings.IMAGE_INGEST_ENABLED:
+            return
+        await asyncio.gather(*(self._prepare_one(url, width, height) for url in urls))
+
+    async def _prepare_one(self, url: str, width: int, height: int):
+        if not url.startswith(("http://", "https://")):
+            return
+        stored = self._images.get(url)
+        if stored is not None and (stored[4] or (stored[2] >= width and stored[3] >= height)):
+            # 已按相同或更大的海报准备过（批量生成中多张海报共用一张图）
+            self._images.move_to_end(url)
+            return
+        task = self._start_download(url)
+        try:
+            data = await task
+            loop = asyncio.get_running_loop()
+            fitted = await loop.run_in_executor(self._executor, _fit_cover, data, width, height, self.quality)
+        except Exception as e:
+            self.failures += 1
+            ingest_total.inc(outcome="failed")
+            print(f"预取图片 {url} 失败，渲染时由页面直接加载: {e}")
+            return
+        finally:
+            self._forget(url, task)
+        if fitted is None:
+            with Image.open(io.BytesIO(data)) as image:
+                entry = (data, Image.MIME.get(image.format, "application/octet-stream"), *image.size, True)
+            ingest_total.inc(outcome="original")
+        else:
+            entry = (*fitted, False)
+            ingest_total.inc(outcome="resized")
+        self._remember(url, entry)
+
+    def missing(self, urls: list[str]) -> list[str]:
+        """需要预取但不在内存中的图片 URL（预取未启用时为空）。"""
+        if not settings.IMAGE_INGEST_ENABLED:
+            return []
+        return [url for url in urls if url.startswith(("http://", "https://")) and url not in self._images]
+
+    async def persist(self, urls: list[str]) -> list[str | None]:
+        """
+        把已预取的图片按内容寻址保存到产物存储，返回与 urls 对应的对象键（未预取的为 None）。
+        服务商返回的 URL 会过期，增量修改时从存储恢复图片，不依赖原 URL。
+        """
+        keys = []
+        for url in urls:
+            entry = self._images.get(url)
+            if entry is None:
+                keys.append(None)
+                continue
+            extension = ".png" if entry[1] == "image/png" else ".jpg" if entry[1] == "image/jpeg" else ".img"
+            keys.append(await artifact_store.put(entry[0], extension, entry[1]))
+        return keys
+
+    async def restore(self, urls: list[str], keys: list[str | None]):
+        """
+        从产物存储恢复不在内存中的图片（由 persist 保存），读取失败的跳过。
+        保存的已是为该海报准备好的尺寸，按原图记录，prepare 时不再重新下载。
+        """
+        for url, key in zip(urls, keys):
+            if not key or url in self._images:
+                continue
+            data = await artifact_store.get(key)
+            if data is None:
+                continue
+            try:
+                with Image.open(io.BytesIO(data)) as image:
+                    entry = (data, Image.MIME.get(image.format, "application/octet-stream"), *image.size, True)
+            except Exception as e:
+                print(f"恢复图片 {url} 失败: {e}")
+                continue
+            self._remember(url, entry)
+
+    def _remember(self, url: str, entry: tuple[bytes, str, int, int, bool]):
+        previous = self._images.pop(url, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous[0])
+        self._images[url] = entry
+        self._memory_bytes += len(entry[0])
+        while self._memory_bytes > self.memory_max_bytes and len(self._images) > 1:
+            _, (data, *_) = self._images.popitem(last=False)
+            self._memory_bytes -= len(data)
+
+    async def handle_route(self, route: Route) -> bool:
+        """Playwright 路由处理：已预取的图片直接从内存返回，返回是否已处理。"""
+        request = route.request
+        entry = self._images.get(request.url) if request.method == "GET" else None
+        if entry is None:
+            return False
+        self._images.move_to_end(request.url)
+        self.hits += 1
+        ingest_bytes.inc(len(entry[0]), kind="served")
+        await route.fulfill(
+            status=200,
+            body=entry[0],
+            headers={"content-type": entry[1], "access-control-allow-origin": "*"},
+        )
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._images),
+            "memory_bytes": self._memory_bytes,
+            "downloading": len(self._downloads),
+            "hits": self.hits,
+            "failures": self.failures,
+        }
+
+
+# 全局图片预取器
+image_ingest = ImageIngestor(
+    workers=settings.IMAGE_INGEST_WORKERS,
+    memory_max_bytes=settings.IMAGE_INGEST_MEMORY_MB * 1024 * 1024,
+    timeout=settings.IMAGE_INGEST_TIMEOUT,
+    max_bytes=settings.IMAGE_INGEST_MAX_MB * 1024 * 1024,
+    quality=settings.IMAGE_INGEST_QUALITY,
+)
@@ -0,0 +1,207 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+from playwright.async_api import Browser, BrowserContext, Page, Route
+
+from app.core.telemetry import span
+
+
+class RenderPoolExhausted(Exception):
+    """页面池在等待超时内没有空闲页面可用。"""
+
+
+class PooledPage:
+    """池中的一个槽位：独立的 BrowserContext + Page，以及使用次数。"""
+
+    def __init__(self, context: BrowserContext, page: Page):
+        self.context = context
+        self.page = page
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+
+class PagePool:
+    """
+    预热的有界页面池。
+
+    每个槽位拥有独立的 BrowserContext，使用后重置为 about:blank 并清理存储；
+    达到最大使用次数或健康检查失败的槽位会被回收重建。
+    池满时调用方排队等待（背压），而不是无限制地新开页面。
+    """
+
+    def __init__(
+        self,
+        size: int,
+        max_uses: int,
+        acquire_timeout: float,
+        health_check_interval: float,
+        route_handler: Callable[[Route], Awaitable[None]] | None = None,
+    ):
+        self.size = max(1, size)
+        self.route_handler = route_handler  # 安装到每个 BrowserContext 上的请求拦截处理函数
+        self.max_uses = max(1, max_uses)
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self._browser: Browser | None = None
+        self._idle: list[PooledPage] = []
+        self._capacity = asyncio.Semaphore(self.size)
+        self._in_use = 0
+        self._waiting = 0
+        self._recycled = 0
+        self._health_task: asyncio.Task | None = None
+
+    async def start(self, browser: Browser):
+        """绑定浏览器并预创建全部槽位（浏览器重启后再次调用会丢弃旧槽位）。"""
+        await self.close()
+        self._browser = browser
+        slots = await asyncio.gather(*(self._create_slot() for _ in range(self.size)), return_exceptions=True)
+        for slot in slots:
+            if isinstance(slot, PooledPage):
+                self._idle.append(slot)
+            else:
+                print(f"预热页面失败: {slot}")
+        print(f"页面池已预热: {len(self._idle)}/{self.size} 个页面。")
+        if self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        """关闭健康检查与所有空闲槽位（使用中的槽位随浏览器一起关闭）。"""
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._destroy_slot(slot) for slot in idle), return_exceptions=True)
+        self._browser = None
+
+    async def _create_slot(self) -> PooledPage:
+        if not self._browser:
+            raise Exception("浏览器实例尚未启动。")
+        context = await self._browser.new_context()
+        if self.route_handler:
+            await context.route("**/*", self.route_handler)
+        page = await context.new_page()
+        return PooledPage(context, page)
+
+    async def _destroy_slot(self, slot: PooledPage):
+        try:
+            await slot.context.close()
+        except Exception:
+            pass
+
+    def _is_alive(self, slot: PooledPage) -> bool:
+        return (
+            self._browser is not None
+            and self._browser.is_connected()
+            and not slot.page.is_closed()
+        )
+
+    async def acquire(self) -> PooledPage:
+        """获取一个空闲槽位；池耗尽时最多等待 acquire_timeout 秒。"""
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._capacity.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise RenderPoolExhausted(f"等待渲染页面超时 ({self.acquire_timeout}s)，当前池大小 {self.size}。")
+        finally:
+            self._waiting -= 1
+
+        try:
+            slot = None
+            while self._idle:
+                candidate = self._idle.pop()
+                if self._is_alive(candidate):
+                    slot = candidate
+                    break
+                await self._destroy_slot(candidate)
+                self._recycled += 1
+            if slot is None:
+                slot = await self._create_slot()
+        except BaseException:
+            self._capacity.release()
+            raise
+
+        slot.uses += 1
+        self._in_use += 1
+        return slot
+
+    async def release(self, slot: PooledPage, discard: bool = False):
+        """归还槽位：重置后放回池中，或在需要时回收。"""
+        try:
+            if discard or slot.uses >= self.max_uses or not self._is_alive(slot):
+                await self._destroy_slot(slot)
+                self._recycled += 1
+            elif await self._reset_slot(slot):
+                self._idle.append(slot)
+            else:
+                await self._destroy_slot(slot)
+                self._recycled += 1
+        finally:
+            self._in_use -= 1
+            self._capacity.release()
+
+    async def _reset_slot(self, slot: PooledPage) -> bool:
+        """清理页面状态，使下一个请求拿到干净的页面。"""
+        try:
+            await slot.page.evaluate("() => { try { localStorage.clear(); sessionStorage.clear(); } catch (e) {} }")
+            await slot.page.goto("about:blank")
+            await slot.context.clear_cookies()
+            return True
+        except Exception as e:
+            print(f"重置页面失败，将回收该页面: {e}")
+            return False
+
+    @asynccontextmanager
+    async def lease(self):
+        """以上下文管理器的方式借用页面；出现异常时丢弃该槽位。"""
+        with span("render.acquire"):
+            slot = await self.acquire()
+        try:
+            yield slot.page
+        except BaseException:
+            await self.release(slot, discard=True)
+            raise
+        else:
+            await self.release(slot)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"页面池健康检查出错: {e}")
+
+    async def check_health(self):
+        """对空闲槽位做一次探活，剔除无响应的页面并补足预热数量。"""
+        for slot in list(self._idle):
+            try:
+                if not self._is_alive(slot):
+                    raise Exception("页面已关闭或浏览器已断开")
+                await asyncio.wait_for(slot.page.evaluate("1"), timeout=5.0)
+            except Exception as e:
+                # 探活期间槽位可能已被借出，此时交给 release 处理
+                if slot in self._idle:
+                    print(f"健康检查剔除页面: {e}")
+                    self._idle.remove(slot)
+                    await self._destroy_slot(slot)
+                    self._recycled += 1
+
+        missing = self.size - self._in_use - len(self._idle)
+        for _ in range(max(0, missing)):
+            if not (self._browser and self._browser.is_connected()):
+                break
+            try:
+                self._idle.append(await self._create_slot())
+            except Exception as e:
+                print(f"补充预热页面失败: {e}")
+                break
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "recycled": self._recycled,
+        }
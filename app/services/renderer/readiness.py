@@ -0,0 +1,82 @@
+from playwright.async_api import Page
+
+# 一次 evaluate 往返内完成全部就绪检查：
+# load 事件 -> document.fonts.ready -> 图片 decode() -> 两帧 requestAnimationFrame，
+# 整体受 deadlineMs 限制；随后按内容高度修正 html/body 的高度并返回实际内容高度。
+READINESS_SCRIPT = """
+async ({ viewportHeight, deadlineMs }) => {
+    const start = performance.now();
+    const waited = [];
+    const nextFrame = () => new Promise(resolve => requestAnimationFrame(() => resolve()));
+
+    const ready = (async () => {
+        if (document.readyState !== "complete") {
+            await new Promise(resolve => window.addEventListener("load", resolve, { once: true }));
+            waited.push("load");
+        }
+        await document.fonts.ready;
+        waited.push("fonts");
+        const images = Array.from(document.images);
+        if (images.length) {
+            await Promise.all(images.map(img => img.decode().catch(() => {})));
+            waited.push("images");
+        }
+        await nextFrame();
+        await nextFrame();
+        waited.push("raf");
+        return "ready";
+    })();
+    const deadline = new Promise(resolve => setTimeout(() => resolve("deadline"), deadlineMs));
+    const signal = await Promise.race([ready, deadline]);
+
+    // 只有当内容高度明显超过预设高度时 (给予 5px 误差)，才解除 height 限制以支持长图；
+    // 否则强制使用视口高度，避免 height: auto 导致 height: 100% 失效产生留白
+    if (document.body.scrollHeight > viewportHeight + 5) {
+        document.documentElement.style.height = "auto";
+        document.body.style.height = "auto";
+        document.documentElement.style.overflow = "visible";
+        document.body.style.overflow = "visible";
+        document.body.style.minHeight = "100vh";
+    } else {
+        document.body.style.height = viewportHeight + "px";
+    }
+
+    return {
+        signal,
+        waited,
+        contentHeight: document.body.scrollHeight,
+        elapsedMs: Math.round(performance.now() - start),
+    };
+}
+"""
+
+
+async def wait_until_ready(page: Page, viewport_height: int, deadline_ms: int) -> dict:
+    """
+    等待页面达到可截图状态，并修正页面高度。
+    返回就绪报告: {"signal": "ready" | "deadline", "waited": [...], "contentHeight": int, "elapsedMs": int}
+    """
+    return await page.evaluate(
+        READINESS_SCRIPT,
+        {"viewportHeight": viewport_height, "deadlineMs": deadline_ms},
+    )
+
+
+# 按 @font-face 声明预加载字体：只加载覆盖 text 所需的 unicode-range 分片，受 deadlineMs 限制
+PRELOAD_FONTS_SCRIPT = """
+async ({ text, deadlineMs }) => {
+    const specs = new Set();
+    document.fonts.forEach(face => {
+        specs.add(`${face.style} ${face.weight} 16px "${face.family.replace(/["']/g, "")}"`);
+    });
+    const loads = Promise.all(Array.from(specs).map(spec => document.fonts.load(spec, text).catch(() => [])));
+    const deadline = new Promise(resolve => setTimeout(() => resolve(null), deadlineMs));
+    const loaded = await Promise.race([loads, deadline]);
+    return { faces: specs.size, timedOut: loaded === null };
+}
+"""
+
+
+async def preload_fonts(page: Page, text: str, deadline_ms: int) -> dict:
+    """在正文尚未生成时，提前加载页面声明的字体中 text 会用到的字形。"""
+    return await page.evaluate(PRELOAD_FONTS_SCRIPT, {"text": text, "deadlineMs": deadline_ms})
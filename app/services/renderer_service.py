@@ -1,7 +1,18 @@
 import sys
 import os
 import asyncio
+import hashlib
+from contextlib import AsyncExitStack, asynccontextmanager
 from playwright.async_api import async_playwright, Browser, Page, Playwright
+from app.core.config import settings
+from app.services.renderer.page_pool import PagePool
+from app.services.renderer.asset_cache import asset_cache
+from app.services.renderer.image_ingest import image_ingest
+from app.services.renderer.farm import RenderFarm
+from app.services.renderer.readiness import preload_fonts, wait_until_ready
+from app.utils.singleflight import SingleFlight
+from app.services.admission import admission
+from app.core.telemetry import metrics, span
 
 # Windows 上设置环境变量，尝试影响 Playwright 的子进程创建
 if sys.platform == "win32":
@@ -10,20 +21,43 @@ if sys.platform == "win32":
     # 尝试设置其他可能影响 subprocess 的环境变量
     os.environ.setdefault("PYTHONUNBUFFERED", "1")
 
+async def _handle_route(route):
+    """页面请求拦截：已预取的生成图片从内存返回，其余交给资源缓存（未启用时正常发出）。"""
+    if await image_ingest.handle_route(route):
+        return
+    if settings.ASSET_CACHE_ENABLED:
+        await asset_cache.handle_route(route)
+    else:
+        await route.fallback()
+
 class BrowserManager:
     """
-    一个管理 Playwright 浏览器实例的单例类，以在请求之间复用浏览器。
+    管理单个 Playwright 浏览器实例，以在请求之间复用浏览器。
+    渲染集群 (RenderFarm) 中的每个节点都是一个 BrowserManager。
     """
-    def __init__(self):
+    def __init__(self, name: str = "browser-0"):
+        self.name = name
+        self.renders = 0  # 自本次启动以来完成的渲染次数
+        self.crashed = False
+        self.on_crash = None  # 浏览器意外断开时的回调，由渲染集群设置
+        self._restarting = False
+        self._closing = False
         self.playwright: Playwright | None = None
         self.browser: Browser | None = None
         self._started = False
         self._lock = asyncio.Lock()
         self._playwright_loop = None  # 存储 Playwright 线程中的事件循环（Windows）
+        self.pool = PagePool(
+            size=settings.RENDER_POOL_SIZE,
+            max_uses=settings.RENDER_PAGE_MAX_USES,
+            acquire_timeout=settings.RENDER_POOL_ACQUIRE_TIMEOUT,
+            health_check_interval=settings.RENDER_POOL_HEALTH_CHECK_INTERVAL,
+            route_handler=_handle_route if settings.ASSET_CACHE_ENABLED or settings.IMAGE_INGEST_ENABLED else None,
+        )
 
     async def _ensure_browser_started(self):
         """确保浏览器已启动（延迟启动）"""
-        if self._started and self.browser:
+        if self._started and self.browser and not self._restarting:
             return
         
         async with self._lock:
@@ -57,6 +91,8 @@ class BrowserManager:
                 try:
                     self.playwright = await async_playwright().start()
                     self.browser = await self.playwright.chromium.launch()
+                    self._on_launched()
+                    await self.pool.start(self.browser)
                     self._started = True
                     print("全局浏览器实例已启动。")
                 except NotImplementedError as e:
@@ -85,6 +121,8 @@ class BrowserManager:
                         self.playwright = playwright
                         self.browser = browser
                         self._playwright_loop = loop  # 保存循环引用，用于清理
+                        self._on_launched()
+                        await self.pool.start(self.browser)
                         self._started = True
                         print("全局浏览器实例已启动（使用线程方案）。")
                     else:
@@ -124,8 +162,15 @@ class BrowserManager:
         if not self._started:
             return
         
+        self._closing = True
         # 设置超时，避免关闭操作无限阻塞
         try:
+            # 先释放页面池中的空闲页面
+            try:
+                await asyncio.wait_for(self.pool.close(), timeout=5.0)
+            except Exception as e:
+                print(f"关闭页面池时出错: {e}")
+
             # 关闭浏览器（最多等待 5 秒）
             if self.browser:
                 try:
@@ -163,85 +208,197 @@ class BrowserManager:
                 print(f"清理事件循环时出错: {e}")
         
         self._started = False
+        self._closing = False
         self.browser = None
         self.playwright = None
-        print("全局浏览器实例已关闭。")
+        print(f"浏览器实例 {self.name} 已关闭。")
+
+    def _on_launched(self):
+        """浏览器启动成功后重置计数并监听意外断开。"""
+        self.renders = 0
+        self.crashed = False
+        self.browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, browser: Browser):
+        if self._closing or browser is not self.browser:
+            return
+        print(f"⚠️ 浏览器实例 {self.name} 意外断开，准备重启。")
+        self.crashed = True
+        if self.on_crash:
+            self.on_crash(self)
+
+    async def restart_browser(self, drain_timeout: float = 30.0):
+        """重启浏览器（崩溃恢复或定期回收）。重启期间新的请求会等待重启完成。"""
+        self._restarting = True
+        try:
+            async with self._lock:
+                # 等待在途渲染结束（崩溃时它们会很快失败返回）
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + drain_timeout
+                while self.pool.stats()["in_use"] and loop.time() < deadline:
+                    await asyncio.sleep(0.1)
+                await self.close_browser()
+        finally:
+            self._restarting = False
+        await self._ensure_browser_started()
 
-    async def get_page(self) -> Page:
-        """为每个请求获取一个新的页面。"""
+    def load(self) -> float:
+        """当前负载：在途 + 排队的渲染数占页面池大小的比例。"""
+        stats = self.pool.stats()
+        return (stats["in_use"] + stats["waiting"]) / stats["size"]
+
+    @asynccontextmanager
+    async def lease_page(self):
+        """从页面池中借用一个预热好的页面，用完自动重置归还。"""
         # 确保浏览器已启动（延迟启动）
         await self._ensure_browser_started()
         if not self.browser:
             raise Exception("浏览器实例尚未启动。")
-        return await self.browser.new_page()
+        async with self.pool.lease() as page:
+            yield page
+
+# 创建全局的渲染集群；RENDER_FARM_SIZE=1 时等价于单个全局浏览器
+render_farm = RenderFarm(
+    BrowserManager,
+    size=settings.RENDER_FARM_SIZE,
+    max_renders_per_browser=settings.RENDER_BROWSER_MAX_RENDERS,
+)
+
+def _page_counts() -> dict:
+    counts = {}
+    for m in render_farm.managers:
+        pool = m.pool.stats()
+        counts[(m.name, "idle")] = pool["idle"]
+        counts[(m.name, "in_use")] = pool["in_use"]
+        counts[(m.name, "waiting")] = pool["waiting"]
+    return counts
+
+metrics.gauge(
+    "poster_render_pages", "渲染页面池中的页面数（idle / in_use）及等待页面的渲染数（waiting）",
+    ("browser", "state"), callback=_page_counts,
+)
+
+class SpeculativePage:
+    """
+    预渲染页面：HTML 仍在流式生成时，先借出一个页面加载 <head>（CSS 与字体），
+    最终渲染复用这个页面，省去字体加载等待。
+    """
+    def __init__(self, preload_text: str = ""):
+        self.preload_text = preload_text  # 用于预加载字形的文本（通常是用户 prompt）
+        self.page: Page | None = None
+        self._stack = AsyncExitStack()
+        self._task: asyncio.Task | None = None
+        self._users = 0  # 正在使用该页面的渲染数
+        self._released = False
+
+    def start(self, head_html: str, width: int, height: int):
+        """收到 <head> 后调用，在后台开始预渲染（只生效一次，释放后不再生效）。"""
+        if self._task is None and not self._released:
+            self._task = asyncio.create_task(self._warm(head_html, width, height))
+
+    async def _warm(self, head_html: str, width: int, height: int):
+        with span("render.warm") as s:
+            page = await self._stack.enter_async_context(render_farm.lease_page())
+            await page.set_viewport_size({"width": width, "height": height})
+            await page.set_content(head_html + "<body></body></html>", wait_until="load")
+            result = await preload_fonts(page, self.preload_text, settings.RENDER_READY_TIMEOUT_MS)
+            s.set(faces=result["faces"])
+        self.page = page
+
+    async def acquire(self) -> Page | None:
+        """等待预渲染完成并返回页面；未启动或失败时返回 None。"""
+        if self._task is None:
+            return None
+        try:
+            await self._task
+        except Exception as e:
+            print(f"预渲染失败，改用新页面渲染: {e}")
+        return self.page
+
+    @asynccontextmanager
+    async def use(self):
+        """在渲染期间占用预渲染页面；期间调用 release 会推迟到渲染结束后再归还。"""
+        page = await self.acquire()
+        if page is None or self._released:
+            yield None
+            return
+        self._users += 1
+        try:
+            yield page
+        finally:
+            self._users -= 1
+            if self._released and not self._users:
+                await self._close()
 
-# 创建一个全局的浏览器管理器实例
-browser_manager = BrowserManager()
+    async def release(self):
+        """归还预渲染占用的页面（调用方结束时调用，例如请求被取消）。"""
+        self._released = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if not self._users:
+            await self._close()
 
-async def render_html_to_image(html_content: str, width: int, height: int) -> bytes:
+    async def _close(self):
+        self.page = None
+        await self._stack.aclose()
+
+# 渲染阶段的请求合并
+render_flight = SingleFlight("render")
+
+async def render_html_to_image(
+    html_content: str, width: int, height: int, speculative: SpeculativePage | None = None
+) -> bytes:
     """
     使用 Playwright 将给定的 HTML 字符串渲染成图片。
     """
-    page = await browser_manager.get_page()
-    try:
-        # 1. 初始设置为标准高度，确保 CSS 布局计算正确
+    screenshot_bytes, _ = await render_html_with_report(html_content, width, height, speculative)
+    return screenshot_bytes
+
+async def render_html_with_report(
+    html_content: str, width: int, height: int, speculative: SpeculativePage | None = None
+) -> tuple[bytes, dict]:
+    """
+    渲染 HTML 为图片，同时返回就绪报告（等待了哪些信号、是否触发截止时间等）。
+    传入 speculative 时优先复用已预加载字体的页面。
+    并发的相同渲染（HTML 与尺寸都相同）会合并为一次。
+    """
+    key = hashlib.sha256(f"{width}x{height}\n{html_content}".encode("utf-8")).hexdigest()
+    result, shared = await render_flight.do(key, lambda: _render(html_content, width, height, speculative))
+    if shared:
+        print(f"合并到进行中的相同渲染 {key[:12]}")
+    return result
+
+async def _render(html_content: str, width: int, height: int, speculative: SpeculativePage | None) -> tuple[bytes, dict]:
+    async with admission.stage("render"):
+        if speculative:
+            async with speculative.use() as page:
+                if page is not None:
+                    return await _render_on_page(page, html_content, width, height)
+        async with render_farm.lease_page() as page:
+            return await _render_on_page(page, html_content, width, height)
+
+async def _render_on_page(page: Page, html_content: str, width: int, height: int) -> tuple[bytes, dict]:
+    # 1. 初始设置为标准高度，确保 CSS 布局计算正确
+    with span("render.set_content"):
         await page.set_viewport_size({"width": width, "height": height})
-        await page.set_content(html_content)
-        
-        # 2. 等待网络空闲，确保资源加载完毕
-        await page.wait_for_load_state("networkidle")
-        
-        # 核心修复：显式等待所有图片加载完成
-        # 即使 set_content 默认等待 load 事件，但在某些动态渲染或网络波动下，
-        # 显式检查 img.complete 属性是最稳妥的方案。
-        await page.evaluate("""
-            async () => {
-                const selectors = Array.from(document.querySelectorAll("img"));
-                await Promise.all(selectors.map(img => {
-                    if (img.complete) return;
-                    return new Promise((resolve, reject) => {
-                        img.onload = resolve;
-                        img.onerror = resolve;
-                    });
-                }));
-            }
-        """)
-        
-        # 核心修复：智能解除 CSS 高度限制
-        # 只有当内容实际高度超过视口高度时，才解除 height: fixed 限制
-        # 这样既能支持长图，又能避免短图时因 height: auto 导致 height: 100% 失效产生的留白
-        await page.evaluate(f"""
-            () => {{
-                const viewportHeight = {height};
-                // 检查 body 的 scrollHeight
-                const contentHeight = document.body.scrollHeight;
-                
-                // 只有当内容高度明显超过预设高度时 (给予 5px 误差)，才切换为 auto 模式
-                if (contentHeight > viewportHeight + 5) {{
-                    document.documentElement.style.height = 'auto';
-                    document.body.style.height = 'auto';
-                    document.documentElement.style.overflow = 'visible';
-                    document.body.style.overflow = 'visible';
-                    document.body.style.minHeight = '100vh';
-                }} else {{
-                    // 内容未溢出：强制使用视口高度，确保背景铺满
-                    document.body.style.height = viewportHeight + 'px';
-                }}
-            }}
-        """)
-
-        # 3. 智能调整：检测内容实际高度
-        # 如果内容超出了预设高度，自动拉长 Viewport 以适应内容
-        content_height = await page.evaluate("() => document.body.scrollHeight")
-        if content_height > height:
-            print(f"检测到内容高度 ({content_height}px) 超过预设高度 ({height}px)，正在调整视口...")
-            await page.set_viewport_size({"width": width, "height": content_height})
-        
-        # 4. 额外缓冲时间，防止渲染未完成
-        await asyncio.sleep(0.5)
-        
-        # 5. 开启 full_page=True 截取完整页面，并提高图片质量
+        # 只等到 DOM 解析完成，其余资源由就绪检测统一等待
+        await page.set_content(html_content, wait_until="domcontentloaded")
+
+    # 2. 事件驱动的就绪检测：load -> 字体 -> 图片解码 -> 两帧 rAF（一次往返完成，并修正页面高度）
+    with span("render.ready") as s:
+        report = await wait_until_ready(page, height, settings.RENDER_READY_TIMEOUT_MS)
+        s.set(signal=report["signal"], waited=report["waited"])
+    if report["signal"] == "deadline":
+        print(f"⚠️ [警告] 页面在 {settings.RENDER_READY_TIMEOUT_MS}ms 内未完全就绪，已完成: {report['waited']}")
+
+    # 3. 智能调整：如果内容超出了预设高度，自动拉长 Viewport 以适应内容
+    content_height = report["contentHeight"]
+    if content_height > height:
+        print(f"检测到内容高度 ({content_height}px) 超过预设高度 ({height}px)，正在调整视口...")
+        await page.set_viewport_size({"width": width, "height": content_height})
+
+    # 4. 开启 full_page=True 截取完整页面，并提高图片质量
+    with span("render.screenshot"):
         screenshot_bytes = await page.screenshot(type="jpeg", quality=85, full_page=True)
-        return screenshot_bytes
-    finally:
-        await page.close() # 每次请求后关闭页面，而不是整个浏览器
+    return screenshot_bytes, report
@@ -0,0 +1,327 @@
+import asyncio
+import contextvars
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+import openai
+
+from app.core.config import settings
+from app.core.telemetry import metrics
+
+T = TypeVar("T")
+
+# 本次请求的截止时间（time.monotonic()），None 表示不限；通过 contextvar 传递到所有子任务
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+breaker_transitions = metrics.counter(
+    "poster_circuit_transitions_total", "熔断器状态切换次数", ("provider", "state")
+)
+breaker_rejections = metrics.counter(
+    "poster_circuit_rejections_total", "熔断器打开期间被直接拒绝的调用数", ("provider",)
+)
+retries_total = metrics.counter(
+    "poster_call_retries_total", "AI 调用的重试次数，按结果分类（retried / budget_exhausted / deadline）", ("provider", "outcome")
+)
+deadline_exceeded = metrics.counter(
+    "poster_deadline_exceeded_total", "因请求截止时间耗尽而放弃的调用数", ("operation",)
+)
+
+
+class DeadlineExceeded(Exception):
+    """请求的端到端截止时间已到，由全局异常处理转换为 504 响应。"""
+
+
+class CircuitOpen(Exception):
+    """服务商的熔断器处于打开状态，调用被直接拒绝，由全局异常处理转换为 503 响应。"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} 暂时不可用（熔断中），{retry_after:.0f} 秒后重试")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+# --- 截止时间 ---
+
+@contextmanager
+def deadline(seconds: float | None):
+    """
+    在当前上下文中设置截止时间（秒后）；已有更早的截止时间时保持不变。
+    seconds 为 None 或 <= 0 时不设限制。
+    """
+    current = _deadline.get()
+    if seconds and seconds > 0:
+        target = time.monotonic() + seconds
+        current = target if current is None else min(current, target)
+    token = _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """距截止时间的剩余秒数，没有截止时间时返回 None。"""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def call_timeout(timeout: float | None, operation: str) -> float | None:
+    """单次调用的超时：不超过剩余时间；截止时间已过时抛出 DeadlineExceeded。"""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        deadline_exceeded.inc(operation=operation)
+        raise DeadlineExceeded(f"{operation}: 请求已超过截止时间")
+    return left if timeout is None else min(timeout, left)
+
+
+async def within_deadline(awaitable: Awaitable[T], operation: str, timeout: float | None = None) -> T:
+    """在截止时间（以及可选的 timeout）内等待 awaitable，超时抛出 DeadlineExceeded。"""
+    limit = call_timeout(timeout, operation)
+    try:
+        return await asyncio.wait_for(awaitable, timeout=limit)
+    except asyncio.TimeoutError:
+        left = remaining()
+        if left is not None and left <= 0:
+            deadline_exceeded.inc(operation=operation)
+            raise DeadlineExceeded(f"{operation}: 请求已超过截止时间")
+        raise
+
+
+# --- 熔断器 ---
+
+class CircuitBreaker:
+    """
+    按服务商统计的熔断器：最近 window 次调用中失败比例达到 failure_ratio（且至少 min_calls 次）时打开，
+    打开期间直接拒绝调用；open_seconds 后进入半开状态，只放行一个探测调用，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, provider: str, failure_ratio: float, min_calls: int, window: int, open_seconds: float):
+        self.provider = provider
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._outcomes: deque[bool] = deque(maxlen=max(1, window))
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def _transition(self, state: str):
+        if state != self.state:
+            self.state = state
+            breaker_transitions.inc(provider=self.provider, state=state)
+            print(f"熔断器 {self.provider}: -> {state}")
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        """允许调用时返回是否为半开状态下的探测调用，否则抛出 CircuitOpen。"""
+        if self.state == "open":
+            if self.retry_after() > 0:
+                self.rejected += 1
+                breaker_rejections.inc(provider=self.provider)
+                raise CircuitOpen(self.provider, self.retry_after())
+            self._transition("half_open")
+        if self.state == "half_open":
+            if self._probing:
+                self.rejected += 1
+                breaker_rejections.inc(provider=self.provider)
+                raise CircuitOpen(self.provider, 1.0)
+            self._probing = True
+            return True
+        return False
+
+    def cancel_probe(self):
+        """探测调用被取消（结果未知）时，允许下一个调用继续探测。"""
+        self._probing = False
+
+    def record(self, success: bool):
+        if self.state == "half_open":
+            self._probing = False
+            if success:
+                self._outcomes.clear()
+                self._transition("closed")
+            else:
+                self._open()
+            return
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_ratio:
+            self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        self._outcomes.clear()
+        self._transition("open")
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._outcomes.count(False),
+            "retry_after": round(self.retry_after(), 1) if self.state == "open" else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+# --- 重试预算 ---
+
+class RetryBudget:
+    """每次调用积累 ratio 个令牌，每次重试消耗 1 个：服务商整体故障时重试流量不超过 ratio 的比例。"""
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max(1.0, max_tokens)
+        self._tokens = self.max_tokens
+
+    def deposit(self):
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+
+def is_retryable(error: BaseException) -> bool:
+    """超时、网络错误、限流和服务端错误可以重试；参数错误等 4xx 重试也不会成功。"""
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+class Resilience:
+    """
+    规划 / 生图 / HTML 生成共用的调用保护：截止时间内的单次超时、指数退避重试（受重试预算限制）、
+    按服务商的熔断器。服务商的 4xx 错误说明服务本身正常，不计入熔断统计。
+    """
+
+    def __init__(
+        self,
+        max_attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+        budget_ratio: float,
+        failure_ratio: float,
+        min_calls: int,
+        window: int,
+        open_seconds: float,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.budget_ratio = budget_ratio
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.budgets: dict[str, RetryBudget] = {}
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self.breakers:
+            self.breakers[provider] = CircuitBreaker(
+                provider, self.failure_ratio, self.min_calls, self.window, self.open_seconds
+            )
+            self.budgets[provider] = RetryBudget(self.budget_ratio)
+        return self.breakers[provider]
+
+    def _backoff(self, attempt: int) -> float:
+        # 全抖动（full jitter），避免大量请求同时重试
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def call(
+        self,
+        provider: str,
+        operation: str,
+        fn: Callable[[], Awaitable[T]],
+        timeout: float | None,
+        max_attempts: int | None = None,
+        retryable: Callable[[BaseException], bool] = is_retryable,
+    ) -> T:
+        """
+        调用 fn（每次重试都重新调用），单次耗时不超过 timeout 与剩余截止时间。
+        熔断器打开时抛出 CircuitOpen，截止时间耗尽时抛出 DeadlineExceeded，其余情况抛出最后一次的异常。
+        """
+        breaker = self.breaker(provider)
+        budget = self.budgets[provider]
+        budget.deposit()
+        attempts = max_attempts or self.max_attempts
+        for attempt in range(attempts):
+            limit = call_timeout(timeout, operation)
+            # 单次超时被截止时间截短时，超时说明的是整个请求时间不够，而不是服务商变慢
+            limited_by_deadline = limit is not None and (timeout is None or limit < timeout)
+            probe = breaker.allow()
+            try:
+                result = await asyncio.wait_for(fn(), timeout=limit)
+            except asyncio.CancelledError:
+                # 被取消（如对冲请求落败）不代表服务商有问题
+                if probe:
+                    breaker.cancel_probe()
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and limited_by_deadline:
+                    if probe:
+                        breaker.cancel_probe()
+                    deadline_exceeded.inc(operation=operation)
+                    raise DeadlineExceeded(f"{operation}: 请求已超过截止时间") from e
+                retry = retryable(e)
+                # 4xx 等不可重试的错误说明服务商本身可用
+                breaker.record(not retry)
+                if not retry or attempt + 1 >= attempts:
+                    raise
+                delay = self._backoff(attempt)
+                left = remaining()
+                if left is not None and left <= delay:
+                    retries_total.inc(provider=provider, outcome="deadline")
+                    raise
+                if not budget.withdraw():
+                    retries_total.inc(provider=provider, outcome="budget_exhausted")
+                    raise
+                retries_total.inc(provider=provider, outcome="retried")
+                print(f"{operation} 调用失败，{delay:.1f} 秒后重试 ({attempt + 1}/{attempts - 1}): {e}")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record(True)
+            return result
+
+    def stats(self) -> dict:
+        return {
+            provider: {**breaker.stats(), "retry_tokens": round(self.budgets[provider]._tokens, 2)}
+            for provider, breaker in self.breakers.items()
+        }
+
+
+# 全局调用保护（规划 / 生图 / HTML 生成共用，按服务商区分熔断器与重试预算）
+resilience = Resilience(
+    max_attempts=settings.AI_MAX_ATTEMPTS,
+    backoff_base=settings.AI_RETRY_BACKOFF_BASE,
+    backoff_max=settings.AI_RETRY_BACKOFF_MAX,
+    budget_ratio=settings.AI_RETRY_BUDGET_RATIO,
+    failure_ratio=settings.BREAKER_FAILURE_RATIO,
+    min_calls=settings.BREAKER_MIN_CALLS,
+    window=settings.BREAKER_WINDOW,
+    open_seconds=settings.BREAKER_OPEN_SECONDS,
+)
+
+metrics.gauge(
+    "poster_circuit_state", "各服务商熔断器状态（0 关闭 / 1 半开 / 2 打开）", ("provider",),
+    callback=lambda: {(provider,): BREAKER_STATES[b.state] for provider, b in resilience.breakers.items()},
+)
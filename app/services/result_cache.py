@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+import aiofiles
+
+from app.core import prompts
+from app.core.config import settings
+from app.services.generator.layouts import LAYOUTS_VERSION
+from app.utils.extract_dimensions import extract_dimensions
+
+
+def prompt_template_version() -> str:
+    """提示词模板的版本哈希：任何一个模板改动都会让旧缓存失效。"""
+    digest = hashlib.sha256()
+    for name in sorted(dir(prompts)):
+        value = getattr(prompts, name)
+        if name.isupper() and isinstance(value, str):
+            digest.update(name.encode())
+            digest.update(value.encode())
+    return digest.hexdigest()[:16]
+
+
+def normalize_prompt(prompt: str) -> str:
+    """归一化 prompt：统一大小写、全角空格与连续空白，去掉首尾标点。"""
+    text = prompt.replace("　", " ").lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" \t\n。.!！")
+
+
+def result_cache_key(prompt: str) -> str:
+    """由归一化 prompt、尺寸、模型名与模板版本计算缓存键。"""
+    width, height = extract_dimensions(prompt)
+    material = json.dumps(
+        {
+            "prompt": normalize_prompt(prompt),
+            "size": [width, height],
+            "chat_model": settings.AI_CHAT_MODEL,
+            "image_model": settings.AI_IMAGE_MODEL,
+            "template": TEMPLATE_VERSION,
+            "html_mode": settings.HTML_MODE,
+            "layouts": LAYOUTS_VERSION if settings.HTML_MODE == "template" else None,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    海报结果缓存：以内容键保存最终 JPEG 与 HTML。
+
+    内存中保存条目元数据与 LRU 顺序，图片与 HTML 落盘；
+    条目超过 TTL 视为失效，总大小超过上限时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, ttl: float):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> {"size", "created_at", "width", "height", "image_urls", "image_keys"}
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+
+    def image_path(self, key: str) -> str:
+        return self._path(key, ".jpg")
+
+    async def load(self):
+        """启动时扫描缓存目录的元数据文件，重建索引。"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        def _scan():
+            entries = []
+            for shard in os.listdir(self.cache_dir):
+                shard_dir = os.path.join(self.cache_dir, shard)
+                if not os.path.isdir(shard_dir):
+                    continue
+                for name in os.listdir(shard_dir):
+                    if name.endswith(".json"):
+                        try:
+                            with open(os.path.join(shard_dir, name), encoding="utf-8") as f:
+                                entries.append((name[:-5], json.load(f)))
+                        except Exception:
+                            pass
+            return entries
+
+        entries = await asyncio.to_thread(_scan)
+        for key, meta in sorted(entries, key=lambda item: item[1]["created_at"]):
+            self._entries[key] = meta
+            self._total_bytes += meta["size"]
+        await self._evict()
+        print(f"结果缓存已加载: {len(self._entries)} 个条目，{self._total_bytes / 1024 / 1024:.1f}MB")
+
+    def _expired(self, meta: dict) -> bool:
+        return self.ttl > 0 and time.time() - meta["created_at"] > self.ttl
+
+    async def get(self, key: str) -> dict | None:
+        """
+        命中时返回 {"image_bytes", "html_content", "width", "height", "image_urls", "image_keys"}。
+        image_keys 是生成图片在产物存储中的对象键，旧条目没有记录时为 None。
+        """
+        meta = self._entries.get(key)
+        if meta is None or self._expired(meta):
+            if meta is not None:
+                await self._remove(key)
+            self.misses += 1
+            return None
+        try:
+            async with aiofiles.open(self._path(key, ".jpg"), "rb") as f:
+                image_bytes = await f.read()
+            async with aiofiles.open(self._path(key, ".html"), "r", encoding="utf-8") as f:
+                html_content = await f.read()
+        except FileNotFoundError:
+            await self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return {
+            "image_bytes": image_bytes,
+            "html_content": html_content,
+            "width": meta["width"],
+            "height": meta["height"],
+            "image_urls": meta["image_urls"],
+            "image_keys": meta.get("image_keys"),
+        }
+
+    async def put(
+        self,
+        key: str,
+        image_bytes: bytes,
+        html_content: str,
+        width: int,
+        height: int,
+        image_urls: list[str],
+        image_keys: list[str | None],
+    ):
+        html_bytes = html_content.encode("utf-8")
+        size = len(image_bytes) + len(html_bytes)
+        if size > self.max_bytes:
+            return
+        meta = {
+            "size": size,
+            "created_at": time.time(),
+            "width": width,
+            "height": height,
+            "image_urls": image_urls,
+            "image_keys": image_keys,
+        }
+        async with self._lock:
+            os.makedirs(os.path.dirname(self._path(key, "")), exist_ok=True)
+            for suffix, data in ((".jpg", image_bytes), (".html", html_bytes), (".json", json.dumps(meta).encode())):
+                async with aiofiles.open(self._path(key, suffix), "wb") as f:
+                    await f.write(data)
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)["size"]
+            self._entries[key] = meta
+            self._total_bytes += size
+            await self._evict()
+
+    async def _remove(self, key: str):
+        meta = self._entries.pop(key, None)
+        if meta is None:
+            return
+        self._total_bytes -= meta["size"]
+        for suffix in (".jpg", ".html", ".json"):
+            try:
+                os.remove(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    async def _evict(self):
+        # 先清理过期条目，再按 LRU 淘汰到容量以内
+        for key in [k for k, meta in self._entries.items() if self._expired(meta)]:
+            await self._remove(key)
+            self.evictions += 1
+        while self._total_bytes > self.max_bytes and self._entries:
+            await self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "template_version": TEMPLATE_VERSION,
+        }
+
+
+TEMPLATE_VERSION = prompt_template_version()
+
+# 全局结果缓存实例
+result_cache = ResultCache(
+    cache_dir=settings.RESULT_CACHE_DIR,
+    max_bytes=settings.RESULT_CACHE_MAX_MB * 1024 * 1024,
+    ttl=settings.RESULT_CACHE_TTL_SECONDS,
+)
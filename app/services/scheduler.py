@@ -0,0 +1,121 @@
+import contextvars
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Generic, TypeVar
+
+from app.core.config import settings
+from app.core.telemetry import metrics
+
+T = TypeVar("T")
+
+# 用户等级，按优先级从高到低；来自 JWT 中的 tier 声明
+TIERS = ("paid", "free")
+
+_tier: contextvars.ContextVar[str | None] = contextvars.ContextVar("priority_tier", default=None)
+
+aged_total = metrics.counter(
+    "poster_scheduler_aged_total", "排队超过 PRIORITY_AGING_SECONDS 而被优先放行的次数（防饿死）", ("queue", "tier")
+)
+
+
+def default_tier() -> str:
+    """配置的默认等级；PRIORITY_DEFAULT_TIER 不是已知等级时按 free 处理。"""
+    tier = settings.PRIORITY_DEFAULT_TIER
+    return tier if tier in TIERS else "free"
+
+
+if settings.PRIORITY_DEFAULT_TIER not in TIERS:
+    print(f"PRIORITY_DEFAULT_TIER={settings.PRIORITY_DEFAULT_TIER!r} 不是已知等级 {TIERS}，按 free 处理")
+
+
+def normalize_tier(tier: str | None) -> str:
+    """未知或缺失的等级按默认等级处理。"""
+    return tier if tier in TIERS else default_tier()
+
+
+def tier_weights() -> dict[str, int]:
+    return {"paid": max(1, settings.PRIORITY_PAID_WEIGHT), "free": max(1, settings.PRIORITY_FREE_WEIGHT)}
+
+
+@contextmanager
+def priority(tier: str | None):
+    """在当前上下文中设置请求的等级，之后各阶段的排队都按该等级调度（子任务继承）。"""
+    token = _tier.set(normalize_tier(tier))
+    try:
+        yield
+    finally:
+        _tier.reset(token)
+
+
+def current_tier() -> str:
+    return _tier.get() or default_tier()
+
+
+class FairQueue(Generic[T]):
+    """
+    按等级分队列的加权公平队列（stride 调度）：每个等级一个 FIFO 队列，
+    每次取出时选择虚拟时间最小的非空等级，取出后该等级的虚拟时间增加 1/权重，
+    因此各等级都有积压时，放行次数之比等于权重之比（默认付费 : 免费 = 4 : 1）。
+
+    防饿死：任一等级队首等待超过 aging 秒时，不论权重先放行等待最久的一项。
+    空闲后重新排队的等级从当前虚拟时间开始计算，不会因为之前空闲而积攒额度。
+    """
+
+    def __init__(self, name: str, weights: dict[str, int], aging: float):
+        self.name = name
+        self.weights = weights
+        self.aging = aging
+        self._queues: dict[str, deque[tuple[float, T]]] = {tier: deque() for tier in weights}
+        self._pass: dict[str, float] = {tier: 0.0 for tier in weights}
+        self._virtual_time = 0.0
+        self.aged = 0
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def depth(self, tier: str) -> int:
+        return len(self._queues[tier])
+
+    def put(self, tier: str, item: T):
+        queue = self._queues[tier]
+        if not queue:
+            self._pass[tier] = max(self._pass[tier], self._virtual_time)
+        queue.append((time.monotonic(), item))
+
+    def remove(self, tier: str, item: T) -> bool:
+        """移除尚未取出的一项（等待方超时或取消），返回是否找到。"""
+        queue = self._queues[tier]
+        for entry in queue:
+            if entry[1] is item:
+                queue.remove(entry)
+                return True
+        return False
+
+    def pop(self) -> tuple[str, T]:
+        """取出下一项，返回 (等级, 项)；队列为空时抛出 IndexError。"""
+        now = time.monotonic()
+        heads = [(queue[0][0], tier) for tier, queue in self._queues.items() if queue]
+        if not heads:
+            raise IndexError("队列为空")
+        oldest_at, oldest_tier = min(heads)
+        if now - oldest_at >= self.aging:
+            tier = oldest_tier
+            self.aged += 1
+            aged_total.inc(queue=self.name, tier=tier)
+        else:
+            # 虚拟时间相同时高等级优先
+            tier = min((name for _, name in heads), key=lambda name: (self._pass[name], TIERS.index(name)))
+        self._virtual_time = self._pass[tier]
+        self._pass[tier] += 1 / self.weights[tier]
+        return tier, self._queues[tier].popleft()[1]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            tier: {
+                "waiting": len(queue),
+                "oldest_wait_ms": round((now - queue[0][0]) * 1000, 1) if queue else 0.0,
+            }
+            for tier, queue in self._queues.items()
+        }
@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+import aiohttp
+
+
+class StorageBackend(ABC):
+    """产物存储后端。键是以 "/" 分隔的相对路径；写入的对象都不可变，重复写入同一键可以直接跳过。"""
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def put_many(self, items: list[tuple[str, bytes, str]]):
+        """批量写入 [(键, 内容, Content-Type)]。"""
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        """读取对象，不存在时返回 None。"""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """删除对象，不存在时忽略。"""
+
+    def url(self, key: str) -> str | None:
+        """对象的对外访问地址，无法直接访问时返回 None。"""
+        return None
+
+
+class LocalStorageBackend(StorageBackend):
+    """本地文件系统：先写临时文件再原子重命名，已存在的对象直接跳过。"""
+
+    def __init__(self, root: str, public_base_url: str = "", static_root: str = "generated_content"):
+        self.root = root
+        self.public_base_url = public_base_url.rstrip("/")
+        self.static_root = static_root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def _write_batch(self, items: list[tuple[str, bytes, str]]):
+        for key, data, _ in items:
+            path = self.path(key)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    async def put_many(self, items: list[tuple[str, bytes, str]]):
+        # 整批在一个线程中完成，避免每个文件一次线程切换
+        await asyncio.to_thread(self._write_batch, items)
+
+    async def get(self, key: str) -> bytes | None:
+        def _read():
+            try:
+                with open(self.path(key), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+        return await asyncio.to_thread(_read)
+
+    async def delete(self, key: str):
+        try:
+            await asyncio.to_thread(os.remove, self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key: str) -> str | None:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{key}"
+        # 位于 /static 挂载目录下时，直接通过静态文件服务访问
+        relpath = os.path.relpath(self.path(key), self.static_root)
+        if relpath.startswith(".."):
+            return None
+        return "/static/" + relpath.replace(os.sep, "/")
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def sigv4_headers(
+    method: str,
+    url: str,
+    region: str,
+    access_key: str,
+    secret_key: str,
+    payload: bytes = b"",
+    headers: dict | None = None,
+    service: str = "s3",
+    now: datetime | None = None,
+) -> dict:
+    """
+    AWS Signature Version 4 请求签名，返回需要附加到请求上的全部头（含 Authorization）。
+    只支持不带查询参数的请求，足够覆盖对象的 PUT / GET / HEAD / DELETE。
+    """
+    now = now or datetime.now(timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date_stamp = now.strftime("%Y%m%d")
+    parts = urlsplit(url)
+    payload_hash = hashlib.sha256(payload).hexdigest()
+
+    signed = {k.lower(): str(v).strip() for k, v in (headers or {}).items()}
+    signed["host"] = parts.netloc
+    signed["x-amz-content-sha256"] = payload_hash
+    signed["x-amz-date"] = amz_date
+    signed_names = ";".join(sorted(signed))
+    canonical_headers = "".join(f"{name}:{signed[name]}\n" for name in sorted(signed))
+    canonical_request = "\n".join([
+        method,
+        quote(parts.path or "/", safe="/-_.~"),
+        "",
+        canonical_headers,
+        signed_names,
+        payload_hash,
+    ])
+
+    scope = f"{date_stamp}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    signing_key = _hmac(_hmac(_hmac(_hmac(f"AWS4{secret_key}".encode("utf-8"), date_stamp), region), service), "aws4_request")
+    signature = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    result = {k: v for k, v in (headers or {}).items()}
+    result["x-amz-content-sha256"] = payload_hash
+    result["x-amz-date"] = amz_date
+    result["Authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_names}, Signature={signature}"
+    )
+    return result
+
+
+class S3StorageBackend(StorageBackend):
+    """兼容 S3 的对象存储（AWS S3 / MinIO / 各云厂商），使用路径风格地址与 SigV4 签名。"""
+
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        region: str,
+        access_key: str,
+        secret_key: str,
+        prefix: str = "",
+        public_base_url: str = "",
+        concurrency: int = 8,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.public_base_url = public_base_url.rstrip("/")
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session: aiohttp.ClientSession | None = None
+
+    async def start(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def _object_url(self, key: str) -> str:
+        return f"{self.endpoint}/{self.bucket}/{self.prefix}{key}"
+
+    async def _request(self, method: str, key: str, payload: bytes = b"", headers: dict | None = None) -> tuple[int, bytes]:
+        await self.start()
+        url = self._object_url(key)
+        signed = sigv4_headers(method, url, self.region, self.access_key, self.secret_key, payload, headers)
+        async with self._semaphore:
+            async with self._session.request(method, url, data=payload or None, headers=signed) as response:
+                body = await response.read()
+                if response.status >= 400 and response.status != 404:
+                    raise IOError(f"S3 {method} {key} 失败: HTTP {response.status} {body[:200]!r}")
+                return response.status, body
+
+    async def put_many(self, items: list[tuple[str, bytes, str]]):
+        await asyncio.gather(*(
+            self._request("PUT", key, data, {"Content-Type": content_type})
+            for key, data, content_type in items
+        ))
+
+    async def get(self, key: str) -> bytes | None:
+        status, body = await self._request("GET", key)
+        return None if status == 404 else body
+
+    async def delete(self, key: str):
+        await self._request("DELETE", key)
+
+    def url(self, key: str) -> str | None:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{self.prefix}{key}"
+        return None
+
+
+def create_storage_backend(settings) -> StorageBackend:
+    if settings.STORAGE_BACKEND == "s3":
+        return S3StorageBackend(
+            endpoint=settings.STORAGE_S3_ENDPOINT,
+            bucket=settings.STORAGE_S3_BUCKET,
+            region=settings.STORAGE_S3_REGION,
+            access_key=settings.STORAGE_S3_ACCESS_KEY,
+            secret_key=settings.STORAGE_S3_SECRET_KEY,
+            prefix=settings.STORAGE_S3_PREFIX,
+            public_base_url=settings.STORAGE_PUBLIC_BASE_URL,
+        )
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorageBackend(settings.STORAGE_LOCAL_DIR, public_base_url=settings.STORAGE_PUBLIC_BASE_URL)
+    raise ValueError(f"未知的存储后端: {settings.STORAGE_BACKEND}")
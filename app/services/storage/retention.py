@@ -0,0 +1,402 @@
+import asyncio
+import fnmatch
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+from starlette.staticfiles import StaticFiles
+
+from app.core.config import settings
+from app.core.telemetry import metrics, span
+from app.services.storage.backends import LocalStorageBackend
+from app.services.storage.store import ArtifactStore, artifact_store, variant_parent
+
+# 旧版本按请求创建的目录名，如 20250101_120000_ab12cd
+LEGACY_DIR_PATTERN = "????????_??????_*"
+
+
+class ArtifactIndex:
+    """
+    产物索引（SQLite）：记录每个对象的大小与访问时间、每份海报清单引用的对象，
+    保留策略只查询索引，不需要遍历存储目录。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = asyncio.Lock()
+
+    async def _run(self, fn, *args):
+        # sqlite3 是阻塞 API，放到线程中执行；连接只允许串行使用
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    async def start(self) -> bool:
+        """打开索引，返回索引是否为新建（新建时需要从存储中重建）。"""
+        def _open():
+            created = not os.path.exists(self.path)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS objects (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    parent TEXT  -- 派生图对应的原图键，原图被回收后派生图一并回收
+                );
+                CREATE TABLE IF NOT EXISTS posters (
+                    id TEXT PRIMARY KEY,
+                    manifest TEXT NOT NULL,
+                    image TEXT NOT NULL,
+                    html TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS poster_images (  -- 海报引用的生成图片（增量修改时使用）
+                    poster_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    PRIMARY KEY (poster_id, key)
+                );
+                CREATE INDEX IF NOT EXISTS poster_images_key ON poster_images (key);
+                CREATE INDEX IF NOT EXISTS posters_accessed ON posters (accessed_at);
+                CREATE INDEX IF NOT EXISTS posters_image ON posters (image);
+                CREATE INDEX IF NOT EXISTS posters_html ON posters (html);
+                CREATE INDEX IF NOT EXISTS posters_manifest ON posters (manifest);
+                CREATE INDEX IF NOT EXISTS objects_accessed ON objects (accessed_at);
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(objects)")]
+            if "parent" not in columns:
+                conn.execute("ALTER TABLE objects ADD COLUMN parent TEXT")
+            conn.commit()
+            return conn, created
+        self._conn, created = await self._run(_open)
+        return created
+
+    async def close(self):
+        if self._conn:
+            await self._run(self._conn.close)
+            self._conn = None
+
+    async def add(self, objects: list[tuple[str, int]], posters: list[dict]):
+        """登记新写入的对象与海报清单。"""
+        def _add():
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO objects (key, size, created_at, accessed_at, parent) VALUES (?, ?, ?, ?, ?)",
+                [(key, size, now, now, variant_parent(key)) for key, size in objects],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO posters (id, manifest, image, html, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(p["id"], p["manifest"], p["image"], p["html"], p["created_at"], p["created_at"]) for p in posters],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO poster_images (poster_id, key) VALUES (?, ?)",
+                [(p["id"], key) for p in posters for key in p.get("image_keys") or [] if key],
+            )
+            self._conn.commit()
+        await self._run(_add)
+
+    async def touch(self, accessed: dict[str, float]):
+        """批量更新访问时间：对象本身，以及引用它的海报（海报清单按 id 更新）。"""
+        def _touch():
+            rows = list(accessed.items())
+            self._conn.executemany("UPDATE objects SET accessed_at = max(accessed_at, ?) WHERE key = ?", [(t, k) for k, t in rows])
+            self._conn.executemany(
+                "UPDATE posters SET accessed_at = max(accessed_at, ?) WHERE image = ? OR html = ? OR manifest = ?",
+                [(t, k, k, k) for k, t in rows],
+            )
+            self._conn.commit()
+        await self._run(_touch)
+
+    async def expired_posters(self, before: float, limit: int) -> list[tuple[str, str]]:
+        def _query():
+            return self._conn.execute(
+                "SELECT id, manifest FROM posters WHERE accessed_at < ? ORDER BY accessed_at LIMIT ?", (before, limit)
+            ).fetchall()
+        return await self._run(_query)
+
+    async def lru_posters(self, limit: int) -> list[tuple[str, str]]:
+        def _query():
+            return self._conn.execute("SELECT id, manifest FROM posters ORDER BY accessed_at LIMIT ?", (limit,)).fetchall()
+        return await self._run(_query)
+
+    # 孤儿对象：不再被任何海报引用；派生图则是原图已不存在（清单本身不算孤儿）
+    _ORPHAN_CONDITION = """
+        key LIKE 'objects/%'
+        AND NOT EXISTS (SELECT 1 FROM posters p WHERE p.image = o.key OR p.html = o.key)
+        AND NOT EXISTS (SELECT 1 FROM poster_images pi WHERE pi.key = o.key)
+        AND (o.parent IS NULL OR NOT EXISTS (SELECT 1 FROM objects po WHERE po.key = o.parent))
+    """
+
+    async def orphan_objects(self, before: float, limit: int) -> list[tuple[str, int]]:
+        """在 before 之后没有被访问过的孤儿对象。"""
+        def _query():
+            return self._conn.execute(
+                f"SELECT key, size FROM objects o WHERE accessed_at < ? AND {self._ORPHAN_CONDITION} LIMIT ?",
+                (before, limit),
+            ).fetchall()
+        return await self._run(_query)
+
+    async def unreferenced_bytes(self) -> int:
+        """等待回收的孤儿对象总大小。"""
+        def _query():
+            return self._conn.execute(
+                f"SELECT coalesce(sum(size), 0) FROM objects o WHERE {self._ORPHAN_CONDITION}"
+            ).fetchone()[0]
+        return await self._run(_query)
+
+    async def remove_posters(self, poster_ids: list[str]):
+        def _remove():
+            self._conn.executemany("DELETE FROM posters WHERE id = ?", [(i,) for i in poster_ids])
+            self._conn.executemany("DELETE FROM poster_images WHERE poster_id = ?", [(i,) for i in poster_ids])
+            self._conn.commit()
+        await self._run(_remove)
+
+    async def remove_objects(self, keys: list[str]) -> int:
+        """删除对象记录，返回释放的字节数。"""
+        def _remove():
+            size = 0
+            for key in keys:
+                row = self._conn.execute("SELECT size FROM objects WHERE key = ?", (key,)).fetchone()
+                if row:
+                    size += row[0]
+                    self._conn.execute("DELETE FROM objects WHERE key = ?", (key,))
+            self._conn.commit()
+            return size
+        return await self._run(_remove)
+
+    async def totals(self) -> dict:
+        def _query():
+            objects, size = self._conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM objects").fetchone()
+            posters = self._conn.execute("SELECT count(*) FROM posters").fetchone()[0]
+            return {"objects": objects, "bytes": size, "posters": posters}
+        return await self._run(_query)
+
+
+class RetentionManager:
+    """
+    产物保留策略：按年龄与总大小预算回收海报，按最近访问时间（LRU）淘汰。
+
+    - 产物写入存储后登记到索引，读取（静态文件、任务结果、编辑）时记录访问时间；
+    - 后台清理器每轮只处理有限数量的条目（增量），先删过期/超预算的海报清单，
+      再删除已没有海报引用的对象；
+    - 统计累计回收的空间。
+    """
+
+    def __init__(
+        self,
+        store: ArtifactStore,
+        index: ArtifactIndex,
+        max_age: float,
+        max_bytes: int,
+        sweep_interval: float,
+        sweep_batch: int,
+        orphan_grace: float,
+        legacy_root: str | None = None,
+    ):
+        self.store = store
+        self.index = index
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = max(1, sweep_batch)
+        self.orphan_grace = orphan_grace
+        self.legacy_root = legacy_root
+        self._accessed: dict[str, float] = {}  # 尚未写入索引的访问记录
+        self._task: asyncio.Task | None = None
+        self._totals = {"objects": 0, "bytes": 0, "posters": 0}
+        self.sweeps = 0
+        self.reclaimed_bytes = 0
+        self.deleted_posters = 0
+        self.deleted_objects = 0
+        self.deleted_legacy_dirs = 0
+        self.last_sweep_ms = 0.0
+
+    async def start(self):
+        created = await self.index.start()
+        if created:
+            await self._rebuild()
+        self.store.on_written.append(self._on_written)
+        self.store.on_read.append(self.touch)
+        self._totals = await self.index.totals()
+        if self.sweep_interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._flush_access()
+        await self.index.close()
+
+    def touch(self, key: str):
+        """记录一次访问；只写入内存，由清理器批量更新到索引。访问派生图同时算作访问原图。"""
+        now = time.time()
+        self._accessed[key] = now
+        parent = variant_parent(key)
+        if parent:
+            self._accessed[parent] = now
+
+    async def _on_written(self, items: list[tuple[str, bytes, str]]):
+        objects = [(key, len(data)) for key, data, _ in items]
+        posters = []
+        for key, data, _ in items:
+            if key.startswith("posters/"):
+                manifest = json.loads(data)
+                posters.append({**manifest, "manifest": key})
+        await self.index.add(objects, posters)
+
+    async def _rebuild(self):
+        """索引新建时（首次启用或索引丢失）从本地存储重建，只会执行一次。"""
+        backend = self.store.backend
+        if not isinstance(backend, LocalStorageBackend) or not os.path.isdir(backend.root):
+            return
+
+        def _scan():
+            objects, posters = [], []
+            for dirpath, _, filenames in os.walk(backend.root):
+                for name in filenames:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    key = os.path.relpath(path, backend.root).replace(os.sep, "/")
+                    objects.append((key, os.path.getsize(path)))
+                    if key.startswith("posters/"):
+                        try:
+                            with open(path, encoding="utf-8") as f:
+                                posters.append({**json.load(f), "manifest": key})
+                        except (OSError, ValueError):
+                            pass
+            return objects, posters
+
+        objects, posters = await asyncio.to_thread(_scan)
+        await self.index.add(objects, posters)
+        print(f"产物索引已重建: {len(objects)} 个对象，{len(posters)} 份海报清单")
+
+    async def _flush_access(self):
+        if self._accessed:
+            accessed, self._accessed = self._accessed, {}
+            await self.index.touch(accessed)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"产物清理出错: {e}")
+
+    async def sweep(self) -> dict:
+        """执行一轮增量清理，返回本轮回收情况。"""
+        start = time.monotonic()
+        with span("retention.sweep"):
+            await self._flush_access()
+            now = time.time()
+
+            victims = []
+            if self.max_age > 0:
+                victims = await self.index.expired_posters(now - self.max_age, self.sweep_batch)
+            self._totals = await self.index.totals()
+            if not victims and self.max_bytes > 0 and self._totals["bytes"] > self.max_bytes:
+                # 已淘汰海报的对象会在宽限期后回收，计入后仍超预算才继续淘汰
+                if self._totals["bytes"] - await self.index.unreferenced_bytes() > self.max_bytes:
+                    victims = await self.index.lru_posters(self.sweep_batch)
+            for poster_id, manifest_key in victims:
+                await self.store.delete(manifest_key)
+            reclaimed = await self.index.remove_objects([manifest for _, manifest in victims])
+            await self.index.remove_posters([poster_id for poster_id, _ in victims])
+
+            orphans = await self.index.orphan_objects(now - self.orphan_grace, self.sweep_batch)
+            for key, _ in orphans:
+                await self.store.delete(key)
+            reclaimed += await self.index.remove_objects([key for key, _ in orphans])
+
+            legacy = await self._sweep_legacy(now)
+            self._totals = await self.index.totals()
+
+        self.sweeps += 1
+        self.deleted_posters += len(victims)
+        self.deleted_objects += len(orphans)
+        self.deleted_legacy_dirs += legacy["dirs"]
+        reclaimed += legacy["bytes"]
+        self.reclaimed_bytes += reclaimed
+        self.last_sweep_ms = round((time.monotonic() - start) * 1000, 1)
+        if reclaimed:
+            print(f"产物清理: 删除 {len(victims)} 份海报、{len(orphans)} 个对象、{legacy['dirs']} 个旧目录，回收 {reclaimed / 1024 / 1024:.1f}MB")
+        return {"posters": len(victims), "objects": len(orphans), "legacy_dirs": legacy["dirs"], "reclaimed_bytes": reclaimed}
+
+    async def _sweep_legacy(self, now: float) -> dict:
+        """
+        清理旧版本按请求创建的目录（generated_content/<时间戳>_<随机串>/）。
+        只列出顶层目录，按修改时间判断是否过期，每轮最多删除 sweep_batch 个。
+        """
+        if not self.legacy_root or self.max_age <= 0 or not os.path.isdir(self.legacy_root):
+            return {"dirs": 0, "bytes": 0}
+
+        def _sweep():
+            removed, size = 0, 0
+            for entry in os.scandir(self.legacy_root):
+                if removed >= self.sweep_batch:
+                    break
+                if not entry.is_dir() or not fnmatch.fnmatch(entry.name, LEGACY_DIR_PATTERN):
+                    continue
+                if entry.stat().st_mtime >= now - self.max_age:
+                    continue
+                for dirpath, _, filenames in os.walk(entry.path):
+                    size += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+            return {"dirs": removed, "bytes": size}
+
+        return await asyncio.to_thread(_sweep)
+
+    def stats(self) -> dict:
+        return {
+            **self._totals,
+            "max_bytes": self.max_bytes,
+            "max_age_days": round(self.max_age / 86400, 2),
+            "sweeps": self.sweeps,
+            "last_sweep_ms": self.last_sweep_ms,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "deleted_posters": self.deleted_posters,
+            "deleted_objects": self.deleted_objects,
+            "deleted_legacy_dirs": self.deleted_legacy_dirs,
+            "pending_access_updates": len(self._accessed),
+        }
+
+
+class TrackingStaticFiles(StaticFiles):
+    """静态文件服务：访问存储目录下的文件时记录访问时间，供保留策略按 LRU 淘汰。"""
+
+    def __init__(self, *args, retention: RetentionManager, store_prefix: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retention = retention
+        self.store_prefix = store_prefix.strip("/") + "/"
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304) and settings.RETENTION_ENABLED:
+            normalized = path.replace(os.sep, "/")
+            if normalized.startswith(self.store_prefix):
+                self.retention.touch(normalized[len(self.store_prefix):])
+        return response
+
+
+# 全局产物保留策略
+retention = RetentionManager(
+    store=artifact_store,
+    index=ArtifactIndex(settings.RETENTION_INDEX_PATH),
+    max_age=settings.RETENTION_MAX_AGE_DAYS * 86400,
+    max_bytes=int(settings.RETENTION_MAX_GB * 1024 * 1024 * 1024),
+    sweep_interval=settings.RETENTION_SWEEP_INTERVAL,
+    sweep_batch=settings.RETENTION_SWEEP_BATCH,
+    orphan_grace=settings.RETENTION_ORPHAN_GRACE,
+    legacy_root="generated_content",
+)
+
+metrics.gauge("poster_storage_bytes", "产物索引中记录的总字节数", callback=lambda: retention._totals["bytes"])
+metrics.gauge("poster_storage_reclaimed_bytes", "保留策略累计回收的字节数", callback=lambda: retention.reclaimed_bytes)
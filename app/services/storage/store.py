@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from app.core.config import settings
+from app.core.telemetry import metrics, span
+from app.services.storage.backends import StorageBackend, create_storage_backend
+
+# 记住最近写入的对象键，用于跳过重复内容（超过上限后淘汰最早的键）
+KNOWN_KEYS_LIMIT = 100_000
+WRITE_ATTEMPTS = 3
+
+
+def object_key(data: bytes, ext: str) -> str:
+    """内容寻址的对象键：objects/<sha[0:2]>/<sha[2:4]>/<sha><扩展名>，两级分片让每个目录的文件数保持在较小范围。"""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"objects/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def variant_key(original_key: str, width: int, quality: int, ext: str) -> str:
+    """派生图（缩略图 / 其他格式）的键，与原图放在同一目录：<原图键去掉扩展名>.w<宽>q<质量><扩展名>。"""
+    stem, _ = original_key.rsplit(".", 1)
+    return f"{stem}.w{width}q{quality}{ext}"
+
+
+def variant_parent(key: str) -> str | None:
+    """派生图对应的原图键（原图统一为 JPEG），不是派生图时返回 None。"""
+    match = re.fullmatch(r"(objects/.+/[0-9a-f]{64})\.w\d+q\d+\.\w+", key)
+    return f"{match.group(1)}.jpg" if match else None
+
+
+class ArtifactStore:
+    """
+    产物的后台持久化：请求路径只计算哈希并放入有界队列，由后台 worker 批量写入存储后端。
+
+    - 对象按 SHA-256 寻址，相同内容只写一次；
+    - 写入完成前的读取直接返回内存中的内容；
+    - 队列已满时 put 会等待（反压），关闭时把队列中的内容全部落盘。
+    """
+
+    def __init__(self, backend: StorageBackend, queue_size: int, batch_size: int, workers: int, flush_timeout: float):
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.worker_count = max(1, workers)
+        self.flush_timeout = flush_timeout
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        # 等待写入的对象：键 -> (内容, Content-Type, 写入完成的 Future)
+        self._pending: dict[str, tuple[bytes, str, asyncio.Future]] = {}
+        self._known: OrderedDict[str, None] = OrderedDict()
+        self._workers: list[asyncio.Task] = []
+        # 写入成功后的回调（如保留策略的索引），参数为 [(键, 内容, Content-Type)]
+        self.on_written: list[Callable[[list[tuple[str, bytes, str]]], Awaitable[None]]] = []
+        # 读取对象时的回调（如记录访问时间），参数为对象键
+        self.on_read: list[Callable[[str], None]] = []
+        self.written = 0
+        self.written_bytes = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.batches = 0
+
+    async def start(self):
+        await self.backend.start()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def close(self):
+        """等待队列写完（最多 flush_timeout 秒）后停止 worker。"""
+        try:
+            await asyncio.wait_for(self.flush(), timeout=self.flush_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ [警告] 关闭时仍有 {len(self._pending)} 个产物未写入存储")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.backend.close()
+
+    async def flush(self):
+        """等待当前队列中的所有对象写入完成。"""
+        await self._queue.join()
+
+    async def put(self, data: bytes, ext: str, content_type: str) -> str:
+        """按内容寻址写入，返回对象键；只入队不等待落盘。"""
+        return await self.put_as(object_key(data, ext), data, content_type)
+
+    async def put_as(self, key: str, data: bytes, content_type: str) -> str:
+        """以指定的键写入（用于清单等非内容寻址的对象）。"""
+        if key in self._pending or key in self._known:
+            self.deduplicated += 1
+            # 复用已有对象也算一次访问，避免它在被新清单引用之前被当作孤儿回收
+            for callback in self.on_read:
+                callback(key)
+            return key
+        self._pending[key] = (data, content_type, asyncio.get_running_loop().create_future())
+        try:
+            await self._queue.put(key)
+        except BaseException:
+            self._pending.pop(key, None)
+            raise
+        return key
+
+    async def wait(self, keys: list[str]):
+        """等待指定对象落盘；写入失败时抛出异常。"""
+        futures = [self._pending[key][2] for key in keys if key in self._pending]
+        if futures:
+            await asyncio.gather(*(asyncio.shield(f) for f in futures))
+
+    async def get(self, key: str) -> bytes | None:
+        for callback in self.on_read:
+            callback(key)
+        pending = self._pending.get(key)
+        if pending is not None:
+            return pending[0]
+        return await self.backend.get(key)
+
+    async def delete(self, key: str):
+        self._known.pop(key, None)
+        await self.backend.delete(key)
+
+    def url(self, key: str) -> str | None:
+        return self.backend.url(key)
+
+    def _remember(self, key: str):
+        self._known[key] = None
+        self._known.move_to_end(key)
+        if len(self._known) > KNOWN_KEYS_LIMIT:
+            self._known.popitem(last=False)
+
+    async def _worker(self):
+        while True:
+            keys = [await self._queue.get()]
+            while len(keys) < self.batch_size and not self._queue.empty():
+                keys.append(self._queue.get_nowait())
+            try:
+                await self._write_batch(keys)
+            finally:
+                for _ in keys:
+                    self._queue.task_done()
+
+    async def _write_batch(self, keys: list[str]):
+        items = [(key, self._pending[key][0], self._pending[key][1]) for key in keys]
+        error = None
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                with span("storage.batch", size=len(items)):
+                    await self.backend.put_many(items)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                # 最后一次失败后不再等待，立即通知等待方
+                if attempt < WRITE_ATTEMPTS - 1:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        self.batches += 1
+        for key, data, _ in items:
+            future = self._pending.pop(key)[2]
+            if error is None:
+                self.written += 1
+                self.written_bytes += len(data)
+                self._remember(key)
+                future.set_result(None)
+            else:
+                self.failed += 1
+                future.set_exception(error)
+                # 没有人等待时避免 "exception was never retrieved" 警告
+                future.exception()
+        if error is not None:
+            print(f"写入存储失败（{len(items)} 个对象）: {error}")
+            return
+        for callback in self.on_written:
+            try:
+                await callback(items)
+            except Exception as e:
+                print(f"处理存储写入回调时出错: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "queue_depth": self._queue.qsize(),
+            "pending": len(self._pending),
+            "pending_bytes": sum(len(data) for data, _, _ in self._pending.values()),
+            "written": self.written,
+            "written_bytes": self.written_bytes,
+            "deduplicated": self.deduplicated,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+# 全局产物存储
+artifact_store = ArtifactStore(
+    backend=create_storage_backend(settings),
+    queue_size=settings.STORAGE_WRITE_QUEUE_SIZE,
+    batch_size=settings.STORAGE_WRITE_BATCH_SIZE,
+    workers=settings.STORAGE_WRITE_WORKERS,
+    flush_timeout=settings.STORAGE_FLUSH_TIMEOUT,
+)
+
+metrics.gauge("poster_storage_queue_depth", "等待写入存储的对象数", callback=lambda: len(artifact_store._pending))
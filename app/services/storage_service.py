@@ -1,9 +1,13 @@
 import aiohttp
 import aiofiles
+import json
 import os
+import re
+import time
 import uuid
 from datetime import datetime
-import asyncio
+
+from app.services.storage.store import artifact_store
 
 
 async def download_and_save_image(session: aiohttp.ClientSession, url: str, base_path: str) -> str:
@@ -25,36 +29,55 @@ async def download_and_save_image(session: aiohttp.ClientSession, url: str, base
         print(f"下载图片 {url} 失败: {e}")
         return ""
 
-async def save_final_image(image_bytes: bytes, path: str):
-    """异步保存最终渲染出的海报图片。"""
-    try:
-        async with aiofiles.open(path, 'wb') as f:
-            await f.write(image_bytes)
-        print(f"最终渲染海报已保存到: {path}")
-    except Exception as e:
-        print(f"保存最终渲染海报时出错: {e}")
-
-
-async def save_artifacts(html_content: str, image_urls: list[str], final_image_bytes: bytes) -> str:
+async def save_artifacts(
+    html_content: str,
+    image_urls: list[str],
+    final_image_bytes: bytes,
+    width: int,
+    height: int,
+    prompt: str = "",
+    edited_from: str | None = None,
+    image_keys: list[str | None] | None = None,
+) -> dict:
     """
-    保存所有生成物：HTML、原始图片和最终渲染的海报。
-    返回最终海报的相对路径。
+    保存一次生成的全部产物：最终海报、HTML，以及记录它们的海报清单 posters/<id>.json。
+    图片与 HTML 按内容寻址（相同内容只存一份），只放入后台写入队列，不等待落盘。
+    返回海报清单（含 id、对象键与访问地址）。
+    edited_from 为增量修改时原海报的 id；image_keys 为与 image_urls 对应的已保存图片的对象键。
     """
-    # 创建一个基于日期的文件夹来存放本次生成的所有文件
-    base_dir = "generated_content"
-    session_dir = os.path.join(base_dir, datetime.now().strftime("%Y%m%d_%H%M%S") + f"_{uuid.uuid4().hex[:6]}")
-    os.makedirs(session_dir, exist_ok=True)
-
-    # 1. 保存 HTML 文件
-    html_file_path = os.path.join(session_dir, "poster.html")
-    async with aiofiles.open(html_file_path, 'w', encoding='utf-8') as f:
-        await f.write(html_content)
-    print(f"HTML 文件已保存到: {html_file_path}")
-
-    # 2. 保存最终渲染的海报图片
-    final_image_path = os.path.join(session_dir, "final_poster.jpg")
-    
-    # 3. 仅保存最终渲染的海报图片
-    await save_final_image(final_image_bytes, final_image_path)
-    
-    return final_image_path
\ No newline at end of file
+    # id 以日期开头，清单按日期分目录存放
+    poster_id = datetime.now().strftime("%Y%m%d") + uuid.uuid4().hex[:24]
+    image_key = await artifact_store.put(final_image_bytes, ".jpg", "image/jpeg")
+    html_key = await artifact_store.put(html_content.encode("utf-8"), ".html", "text/html; charset=utf-8")
+    manifest = {
+        "id": poster_id,
+        "created_at": time.time(),
+        "prompt": prompt,
+        "width": width,
+        "height": height,
+        "image_urls": image_urls,
+        "image_keys": image_keys or [None] * len(image_urls),
+        "image": image_key,
+        "html": html_key,
+    }
+    if edited_from:
+        manifest["edited_from"] = edited_from
+    await artifact_store.put_as(
+        poster_manifest_key(poster_id),
+        json.dumps(manifest, ensure_ascii=False).encode("utf-8"),
+        "application/json",
+    )
+    return {**manifest, "url": artifact_store.url(image_key)}
+
+
+def poster_manifest_key(poster_id: str) -> str:
+    """海报清单的键：posters/<年>/<月>/<日>/<id>.json。"""
+    return f"posters/{poster_id[:4]}/{poster_id[4:6]}/{poster_id[6:8]}/{poster_id}.json"
+
+
+async def load_poster(poster_id: str) -> dict | None:
+    """读取海报清单，不存在时返回 None。"""
+    if not re.fullmatch(r"[0-9a-f]{32}", poster_id):
+        return None
+    data = await artifact_store.get(poster_manifest_key(poster_id))
+    return json.loads(data) if data else None
@@ -0,0 +1,44 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求：同一个 key 同时只执行一次，其余调用方等待并共享结果。
+
+    - 异常会传播给所有等待者；
+    - 共享的计算运行在独立的 Task 中，某个等待者被取消不会影响其他等待者。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[str, asyncio.Task] = {}
+        self.executions = 0  # 实际执行次数
+        self.shared = 0  # 合并到已有计算上的调用次数
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """执行或加入 key 对应的计算，返回 (结果, 是否为共享结果)。"""
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            self.executions += 1
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有等待者都已取消时，避免 "Task exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "shared": self.shared,
+        }
@@ -0,0 +1,434 @@
+"""
+离线端到端压测：启动替身服务与应用，按指定并发调用 /api/generate，统计各阶段耗时与资源占用。
+
+示例:
+    python -m bench.run_bench --requests 50 --concurrency 8 --output bench/results/latest.json
+    python -m bench.run_bench --requests 50 --concurrency 8 --compare bench/results/baseline.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from bench.stub_servers import S3_ACCESS_KEY, S3_REGION, S3_SECRET_KEY, add_stub_arguments
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# 这些指标越大越好，其余（耗时、内存）越小越好
+HIGHER_IS_BETTER = {"rps"}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list[float], p: float) -> float:
+    """线性插值百分位数。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def parse_server_timing(header: str) -> dict[str, float]:
+    """解析 Server-Timing 头，返回 {阶段: 毫秒}。"""
+    timings = {}
+    for item in header.split(","):
+        match = re.match(r"\s*([\w.-]+)\s*;\s*dur=([\d.]+)", item)
+        if match:
+            timings[match.group(1)] = float(match.group(2))
+    return timings
+
+
+# --- 进程内存采样（读取 /proc，仅 Linux 可用） ---
+
+def _read_proc_table() -> dict[int, tuple[int, str, int]]:
+    """返回 {pid: (ppid, 进程名, RSS 字节数)}。"""
+    table = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 进程名可能包含空格，按最后一个右括号切分
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        fields = stat[stat.rindex(")") + 2:].split()
+        table[int(entry)] = (int(fields[1]), name, int(fields[21]) * PAGE_SIZE)
+    return table
+
+
+def peak_rss(pid: int) -> int:
+    """进程的峰值 RSS（VmHWM）。"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def chromium_rss(root_pid: int) -> int:
+    """root_pid 所有后代中 Chromium 相关进程的 RSS 之和。"""
+    table = _read_proc_table()
+    children = defaultdict(list)
+    for pid, (ppid, _, _) in table.items():
+        children[ppid].append(pid)
+    total = 0
+    stack = list(children[root_pid])
+    while stack:
+        pid = stack.pop()
+        _, name, rss = table[pid]
+        if "chrom" in name.lower() or "headless" in name.lower():
+            total += rss
+        stack.extend(children[pid])
+    return total
+
+
+class MemorySampler:
+    """后台定期采样 Chromium 内存，记录峰值。"""
+
+    def __init__(self, root_pid: int, interval: float = 0.5):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.chromium_peak = 0
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            self.chromium_peak = max(self.chromium_peak, await asyncio.to_thread(chromium_rss, self.root_pid))
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if os.path.isdir("/proc"):
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+# --- 子进程管理 ---
+
+def start_process(args: list[str], env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(args, cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_process(proc: subprocess.Popen, timeout: float = 15.0):
+    if proc.poll() is not None:
+        return
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+async def wait_until_up(url: str, proc: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"进程提前退出（退出码 {proc.returncode}）: {url}")
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"等待服务启动超时: {url}")
+
+
+def stub_command(args: argparse.Namespace, port: int) -> list[str]:
+    command = [sys.executable, "-m", "bench.stub_servers", "--port", str(port)]
+    for name in ("chat_latency", "token_rate", "html_tokens", "image_latency", "image_tail_ratio", "image_tail_latency", "image_size", "font_latency", "font_file"):
+        value = getattr(args, name)
+        if value is not None:
+            command += [f"--{name.replace('_', '-')}", str(value)]
+    return command
+
+
+def app_env(args: argparse.Namespace, stub_url: str, work_dir: str) -> dict:
+    """把应用的 Settings 指向替身服务；其余配置沿用当前环境，可用 --env 覆盖。"""
+    env = dict(os.environ)
+    env.update({
+        "AI_CHAT_API_KEY": "bench",
+        "AI_CHAT_BASE_URL": f"{stub_url}/v1",
+        "AI_CHAT_MODEL": "stub-chat",
+        "AI_IMAGE_API_KEY": "bench",
+        "AI_IMAGE_BASE_URL": f"{stub_url}/v1",
+        "AI_IMAGE_MODEL": "stub-image",
+        "WECHAT_APP_ID": "bench",
+        "WECHAT_APP_SECRET": "bench",
+        "JWT_SECRET_KEY": "bench",
+        "SKIP_PLANNING": "false",
+        "SKIP_IMAGE_GENERATION": "false",
+        "SKIP_HTML_GENERATION": "false",
+        # 每次请求都走完整流水线，且不在仓库目录留下缓存
+        "RESULT_CACHE_ENABLED": "false",
+        "ASSET_CACHE_PREFILL": "false",
+        "ASSET_CACHE_DIR": os.path.join(work_dir, "asset_cache"),
+        "JOB_STORE_BACKEND": "memory",
+        "HTML_MODE": args.html_mode,
+        # 各阶段耗时来自 Server-Timing
+        "TELEMETRY_ENABLED": "true",
+        # 所有请求都来自同一个 IP，放宽准入限制以免压测被 429 截断
+        "ADMISSION_MAX_IN_FLIGHT": str(max(1024, args.concurrency * 4)),
+        "ADMISSION_USER_MAX_CONCURRENT": str(max(1024, args.concurrency * 4)),
+        "ADMISSION_STAGE_MAX_WAITING": str(max(1024, args.concurrency * 4)),
+    })
+    if args.html_mode == "template":
+        # 版式模板引入的是真实字体 CSS，压测时不访问外网
+        env["ASSET_CACHE_OFFLINE"] = "true"
+    if args.storage == "s3":
+        env.update({
+            "STORAGE_BACKEND": "s3",
+            "STORAGE_S3_ENDPOINT": f"{stub_url}/s3",
+            "STORAGE_S3_BUCKET": "posters",
+            "STORAGE_S3_REGION": S3_REGION,
+            "STORAGE_S3_ACCESS_KEY": S3_ACCESS_KEY,
+            "STORAGE_S3_SECRET_KEY": S3_SECRET_KEY,
+        })
+    else:
+        env["STORAGE_LOCAL_DIR"] = os.path.join(work_dir, "store")
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+# --- 压测 ---
+
+async def drive(base_url: str, total: int, concurrency: int, prompt: str, timeout: float) -> dict:
+    """以固定并发发送 total 个请求，返回原始样本。"""
+    samples = []
+    errors = defaultdict(int)
+    counter = iter(range(total))
+
+    async def worker(client: httpx.AsyncClient):
+        for i in counter:
+            start = time.monotonic()
+            first_byte = None
+            try:
+                async with client.stream(
+                    "POST",
+                    f"{base_url}/api/generate",
+                    # 每个请求的 prompt 不同，避免被请求合并
+                    json={"prompt": f"{prompt} #{i}", "no_cache": True},
+                    timeout=timeout,
+                ) as response:
+                    async for _ in response.aiter_raw():
+                        if first_byte is None:
+                            first_byte = time.monotonic()
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] += 1
+                continue
+            elapsed = (time.monotonic() - start) * 1000
+            if response.status_code != 200:
+                errors[str(response.status_code)] += 1
+                continue
+            timings = parse_server_timing(response.headers.get("server-timing", ""))
+            timings["client"] = elapsed
+            # 收到图片第一个字节的时间
+            timings["client-ttfb"] = ((first_byte or time.monotonic()) - start) * 1000
+            samples.append(timings)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits) as client:
+        start = time.monotonic()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.monotonic() - start
+    return {"samples": samples, "errors": dict(errors), "wall": wall}
+
+
+def summarize(samples: list[dict[str, float]]) -> dict:
+    stages = defaultdict(list)
+    for sample in samples:
+        for name, ms in sample.items():
+            stages[name].append(ms)
+    return {
+        name: {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 1),
+            "p95": round(percentile(values, 95), 1),
+            "p99": round(percentile(values, 99), 1),
+            "max": round(max(values), 1),
+        }
+        for name, values in sorted(stages.items())
+    }
+
+
+def flatten(report: dict) -> dict[str, float]:
+    """把报告展开成 {指标名: 数值}，用于回归对比。"""
+    metrics = {"rps": report["rps"]}
+    for stage, values in report["stages"].items():
+        for p in ("p50", "p95", "p99"):
+            metrics[f"{stage}.{p}"] = values[p]
+    for name, value in report["memory"].items():
+        metrics[f"memory.{name}"] = value
+    return metrics
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """返回超出阈值的回归项。"""
+    regressions = []
+    base_metrics = flatten(baseline)
+    for name, value in flatten(current).items():
+        base = base_metrics.get(name)
+        if not base:
+            continue
+        change = (value - base) / base
+        if name in HIGHER_IS_BETTER:
+            change = -change
+        marker = "  <-- 回归" if change > threshold else ""
+        print(f"  {name:<28} {base:>10.1f} -> {value:>10.1f} ({change:+.1%}){marker}")
+        if marker:
+            regressions.append(name)
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"\n请求数: {report['requests']}  成功: {report['succeeded']}  失败: {report['errors']}")
+    print(f"并发: {report['concurrency']}  总耗时: {report['wall_seconds']:.1f}秒  吞吐: {report['rps']:.2f} req/s")
+    print(f"\n{'阶段':<14}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, values in report["stages"].items():
+        print(f"{name:<16}{values['count']:>8}{values['p50']:>10}{values['p95']:>10}{values['p99']:>10}{values['max']:>10}")
+    memory = report["memory"]
+    print(f"\n应用峰值 RSS: {memory['app_peak_mb']} MB  Chromium 峰值 RSS: {memory['chromium_peak_mb']} MB")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    stub_port = args.stub_port or free_port()
+    app_port = args.app_port or free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    with tempfile.TemporaryDirectory(prefix="poster-bench-") as work_dir:
+        stub = start_process(stub_command(args, stub_port), dict(os.environ), os.path.join(work_dir, "stub.log"))
+        app = None
+        try:
+            await wait_until_up(f"{stub_url}/stats", stub, timeout=30)
+            app_cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning"]
+            app = start_process(app_cmd, app_env(args, stub_url, work_dir), args.app_log or os.path.join(work_dir, "app.log"))
+            await wait_until_up(f"{app_url}/", app, timeout=args.startup_timeout)
+            print(f"替身服务: {stub_url}  应用: {app_url}")
+
+            if args.warmup:
+                print(f"预热 {args.warmup} 个请求...")
+                await drive(app_url, args.warmup, min(args.warmup, args.concurrency), args.prompt, args.timeout)
+
+            sampler = MemorySampler(app.pid)
+            sampler.start()
+            print(f"开始压测: {args.requests} 个请求，并发 {args.concurrency}")
+            result = await drive(app_url, args.requests, args.concurrency, args.prompt, args.timeout)
+            await sampler.stop()
+
+            async with httpx.AsyncClient() as client:
+                stub_stats = (await client.get(f"{stub_url}/stats")).json()
+                try:
+                    app_stats = (await client.get(f"{app_url}/api/ops/stats")).json()
+                except (httpx.HTTPError, ValueError):
+                    app_stats = None
+            app_peak = peak_rss(app.pid)
+        finally:
+            if app:
+                stop_process(app)
+            stop_process(stub)
+
+    succeeded = len(result["samples"])
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "html_mode": args.html_mode,
+        "succeeded": succeeded,
+        "errors": result["errors"],
+        "wall_seconds": round(result["wall"], 3),
+        "rps": round(succeeded / result["wall"], 3) if result["wall"] else 0.0,
+        "stages": summarize(result["samples"]),
+        "memory": {
+            "app_peak_mb": round(app_peak / 1024 / 1024, 1),
+            "chromium_peak_mb": round(sampler.chromium_peak / 1024 / 1024, 1),
+        },
+        "stub": {
+            "chat_latency": args.chat_latency,
+            "token_rate": args.token_rate,
+            "html_tokens": args.html_tokens,
+            "image_latency": args.image_latency,
+            "image_tail_ratio": args.image_tail_ratio,
+            "image_tail_latency": args.image_tail_latency,
+            "calls": stub_stats,
+        },
+        "app_stats": app_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="海报生成离线端到端压测")
+    parser.add_argument("--requests", type=int, default=20, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发数")
+    parser.add_argument("--warmup", type=int, default=2, help="正式统计前的预热请求数")
+    parser.add_argument("--prompt", default="压测海报：秋日咖啡节，温暖的色调", help="请求使用的 prompt（会追加序号）")
+    parser.add_argument("--timeout", type=float, default=300.0, help="单个请求超时（秒）")
+    parser.add_argument("--startup-timeout", type=float, default=60.0, help="等待应用启动的秒数")
+    parser.add_argument("--stub-port", type=int, default=0, help="替身服务端口，默认随机")
+    parser.add_argument("--app-port", type=int, default=0, help="应用端口，默认随机")
+    parser.add_argument("--app-log", default=None, help="应用日志输出文件，默认写入临时目录")
+    parser.add_argument("--html-mode", choices=("template", "llm"), default="template", help="HTML 生成方式（HTML_MODE）")
+    parser.add_argument("--storage", choices=("local", "s3"), default="local", help="产物存储后端，s3 使用替身服务中的内存 S3")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="覆盖应用的环境变量，可多次指定")
+    parser.add_argument("--output", default=None, help="报告 JSON 输出路径")
+    parser.add_argument("--compare", default=None, help="与基线报告对比")
+    parser.add_argument("--threshold", type=float, default=0.1, help="回归阈值（相对变化），默认 10%%")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已写入: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n与基线对比（阈值 {args.threshold:.0%}）: {args.compare}")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项回归: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n未发现回归。")
+
+
+if __name__ == "__main__":
+    main()
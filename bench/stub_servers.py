@@ -0,0 +1,330 @@
+"""
+离线压测用的替身服务：OpenAI 兼容的聊天 / 生图接口、生成的图片和静态字体，
+以及一个校验 SigV4 签名的内存 S3（用于测试 STORAGE_BACKEND=s3）。
+
+单独运行:
+    python -m bench.stub_servers --port 9100 --chat-latency 0.8 --token-rate 80
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import re
+import struct
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+from app.services.storage.backends import sigv4_headers
+
+# 伪造的 HTML 正文大约包含的 token 数（按 4 个字符一个 token 粗略切分流式分片）
+CHARS_PER_TOKEN = 4
+# 内存 S3 的凭证
+S3_ACCESS_KEY = "bench-access-key"
+S3_SECRET_KEY = "bench-secret-key"
+S3_REGION = "us-east-1"
+
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    """用纯 Python 生成一张渐变 PNG（不依赖图像库）。"""
+    rows = []
+    for y in range(height):
+        row = bytearray([0])  # 每行的过滤类型：None
+        for x in range(width):
+            row += bytes(((x * 255 // width + seed) % 256, (y * 255 // height) % 256, (seed * 37) % 256))
+        rows.append(bytes(row))
+    raw = zlib.compress(b"".join(rows), 6)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+def find_font_file() -> str | None:
+    """在系统中找一个可用的字体文件，用来模拟下载字体的开销。"""
+    for pattern in ("/usr/share/fonts/**/*.ttf", "/usr/share/fonts/**/*.otf", "C:/Windows/Fonts/*.ttf"):
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if matches:
+            return matches[0]
+    return None
+
+
+class StubConfig:
+    def __init__(
+        self,
+        chat_latency: float = 0.5,
+        token_rate: float = 200.0,
+        html_tokens: int = 1500,
+        image_latency: float = 2.0,
+        image_tail_ratio: float = 0.0,
+        image_tail_latency: float = 0.0,
+        image_size: int = 512,
+        font_latency: float = 0.1,
+        font_file: str | None = None,
+    ):
+        self.chat_latency = chat_latency  # 首 token 延迟（秒）
+        self.token_rate = token_rate  # 每秒输出 token 数
+        self.html_tokens = html_tokens  # HTML 补全的 token 数
+        self.image_latency = image_latency  # 生图接口延迟（秒）
+        self.image_tail_ratio = image_tail_ratio  # 按该比例随机出现的慢请求，用于模拟长尾
+        self.image_tail_latency = image_tail_latency  # 慢请求的延迟（秒）
+        self.image_size = image_size  # 生成图片的边长（像素）
+        self.font_latency = font_latency  # 字体文件响应延迟（秒）
+        self.font_file = font_file or find_font_file()
+
+
+def build_app(config: StubConfig) -> web.Application:
+    app = web.Application()
+    image_cache: dict[int, bytes] = {}
+    font_bytes = b""
+    if config.font_file and os.path.exists(config.font_file):
+        with open(config.font_file, "rb") as f:
+            font_bytes = f.read()
+    else:
+        # 找不到字体时返回同等量级的随机字节，只用来模拟下载开销
+        font_bytes = os.urandom(2 * 1024 * 1024)
+    stats = {"chat": 0, "images": 0, "image_downloads": 0, "font_css": 0, "fonts": 0, "s3_put": 0, "s3_get": 0}
+    s3_objects: dict[str, tuple[bytes, str]] = {}
+    # 模拟服务端前缀缓存：见过的系统提示词再次出现时计为命中；方舟上下文缓存 id -> 消息
+    seen_prefixes: set[str] = set()
+    contexts: dict[str, list[dict]] = {}
+
+    def base_url(request: web.Request) -> str:
+        return f"{request.scheme}://{request.host}"
+
+    def html_document(request: web.Request, user_content: str) -> str:
+        image_urls = re.findall(r"https?://\S+", user_content) or [f"{base_url(request)}/images/0.png"]
+        images = "\n".join(
+            f'<img src="{url}" style="position:absolute; inset:{i * 40}px; width:100%; height:100%; object-fit:cover;">'
+            for i, url in enumerate(image_urls)
+        )
+        filler = "".join(f"<p class='body'>压测正文段落 {i}，用于模拟模型输出的正文内容。</p>" for i in range(20))
+        head = (
+            "<!DOCTYPE html><html><head><meta charset='utf-8'><style>"
+            f"@import url('{base_url(request)}/fonts/css2?family=Stub+Sans');"
+            "* { box-sizing: border-box; } body { margin:0; width:800px; height:1200px; position:relative; }"
+            ".title { font-family: 'Stub Sans', sans-serif; font-size: 72px; position:absolute; top:80px; left:60px; color:#fff; }"
+            ".body { font-family: 'Stub Sans', sans-serif; font-size: 24px; }"
+            "</style></head>"
+        )
+        body = f"<body>{images}<h1 class='title'>压测海报标题</h1><div class='content'>{filler}</div></body></html>"
+        doc = head + body
+        # 按目标 token 数补齐长度，模拟真实的输出耗时
+        padding = max(0, config.html_tokens * CHARS_PER_TOKEN - len(doc))
+        return doc.replace("</body>", f"<!-- {'x' * padding} --></body>")
+
+    def completion_text(request: web.Request, messages: list[dict]) -> str:
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in messages if m["role"] == "user"), "")
+        if "修改助手" in system:
+            # 增量修改：版式数据补丁或 HTML 片段替换
+            if '"edits"' in system:
+                return json.dumps({"edits": [{"find": "压测海报标题", "replace": "修改后的标题"}]}, ensure_ascii=False)
+            return json.dumps({"title": "修改后的标题", "palette": {"accent": "#3388ff"}}, ensure_ascii=False)
+        if "image_prompts" in system:
+            return json.dumps({"image_prompts": ["A cinematic stub image, leave empty space at the top for text."]})
+        if '"layout"' in system:
+            # 模板模式：只返回版式数据
+            return json.dumps({
+                "layout": "immersive_diagonal",
+                "title": "压测海报标题",
+                "subtitle": "BENCHMARK",
+                "body": "压测正文，用于模拟模型输出的文案。\n第二行正文。",
+                "footer": "stub",
+                "title_font": "brush",
+                "body_font": "sans",
+                "title_effect": "glow",
+                "palette": {"background": "#1a1a1a", "text": "#ffffff", "accent": "#ffd700", "overlay": "rgba(0,0,0,0.55)"},
+            }, ensure_ascii=False)
+        return "```html\n" + html_document(request, user) + "\n```"
+
+    async def create_context(request: web.Request) -> web.Response:
+        payload = await request.json()
+        context_id = f"ctx-{uuid.uuid4().hex[:16]}"
+        contexts[context_id] = payload.get("messages", [])
+        return web.json_response({"id": context_id, "model": payload.get("model"), "mode": payload.get("mode"), "ttl": payload.get("ttl")})
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        stats["chat"] += 1
+        payload = await request.json()
+        messages = payload.get("messages", [])
+        if "context_id" in payload:
+            if payload["context_id"] not in contexts:
+                return web.json_response({"error": {"message": "context not found"}}, status=404)
+            messages = contexts[payload["context_id"]] + messages
+        text = completion_text(request, messages)
+        prefix = next((m["content"] for m in messages if m["role"] == "system"), "")
+        cached_tokens = len(prefix) // CHARS_PER_TOKEN if prefix in seen_prefixes else 0
+        seen_prefixes.add(prefix)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // CHARS_PER_TOKEN
+        created = int(time.time())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = payload.get("model", "stub")
+        await asyncio.sleep(config.chat_latency)
+
+        tokens = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        if not payload.get("stream"):
+            await asyncio.sleep(len(tokens) / config.token_rate)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        # 每次发送约 10 个 token，整体速率符合 token_rate
+        batch = 10
+        for i in range(0, len(tokens), batch):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": "".join(tokens[i:i + batch])}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            await asyncio.sleep(batch / config.token_rate)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+        await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        await response.write_eof()
+        return response
+
+    async def image_generations(request: web.Request) -> web.Response:
+        stats["images"] += 1
+        await request.json()
+        slow = config.image_tail_ratio > 0 and random.random() < config.image_tail_ratio
+        await asyncio.sleep(config.image_tail_latency if slow else config.image_latency)
+        seed = stats["images"] % 16
+        return web.json_response({
+            "created": int(time.time()),
+            "data": [{"url": f"{base_url(request)}/images/{seed}.png?id={uuid.uuid4().hex}"}],
+        })
+
+    async def image_file(request: web.Request) -> web.Response:
+        stats["image_downloads"] += 1
+        seed = int(request.match_info["seed"])
+        if seed not in image_cache:
+            image_cache[seed] = await asyncio.to_thread(make_png, config.image_size, config.image_size, seed)
+        return web.Response(body=image_cache[seed], content_type="image/png")
+
+    async def font_css(request: web.Request) -> web.Response:
+        stats["font_css"] += 1
+        css = (
+            "@font-face { font-family: 'Stub Sans'; font-style: normal; font-weight: 400; "
+            f"src: url({base_url(request)}/fonts/files/stub-sans.ttf) format('truetype'); }}"
+        )
+        return web.Response(text=css, content_type="text/css")
+
+    async def font_file(request: web.Request) -> web.Response:
+        stats["fonts"] += 1
+        await asyncio.sleep(config.font_latency)
+        return web.Response(body=font_bytes, content_type="font/ttf")
+
+    def s3_signature_valid(request: web.Request, body: bytes) -> bool:
+        auth = request.headers.get("Authorization", "")
+        match = re.match(r"AWS4-HMAC-SHA256 Credential=[^,]+, SignedHeaders=([^,]+), Signature=\w+$", auth)
+        if not match or "x-amz-date" not in request.headers:
+            return False
+        extra = {
+            name: request.headers.get(name, "")
+            for name in match.group(1).split(";")
+            if name not in ("host", "x-amz-content-sha256", "x-amz-date")
+        }
+        now = datetime.strptime(request.headers["x-amz-date"], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        expected = sigv4_headers(request.method, str(request.url), S3_REGION, S3_ACCESS_KEY, S3_SECRET_KEY, body, extra, now=now)
+        return expected["Authorization"] == auth
+
+    async def s3_object(request: web.Request) -> web.Response:
+        body = await request.read()
+        if not s3_signature_valid(request, body):
+            return web.Response(status=403, text="SignatureDoesNotMatch")
+        key = f"{request.match_info['bucket']}/{request.match_info['key']}"
+        if request.method == "PUT":
+            stats["s3_put"] += 1
+            s3_objects[key] = (body, request.headers.get("Content-Type", "application/octet-stream"))
+            return web.Response(status=200)
+        if request.method == "DELETE":
+            s3_objects.pop(key, None)
+            return web.Response(status=204)
+        if key not in s3_objects:
+            return web.Response(status=404, text="NoSuchKey")
+        stats["s3_get"] += 1
+        data, content_type = s3_objects[key]
+        return web.Response(body=data if request.method == "GET" else None, content_type=content_type)
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response({**stats, "s3_objects": len(s3_objects)})
+
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/context/create", create_context)
+    app.router.add_post("/v1/context/chat/completions", chat_completions)
+    app.router.add_post("/v1/images/generations", image_generations)
+    app.router.add_get("/images/{seed:\\d+}.png", image_file)
+    app.router.add_get("/fonts/css2", font_css)
+    app.router.add_get("/fonts/files/{name}", font_file)
+    app.router.add_route("*", "/s3/{bucket}/{key:.+}", s3_object)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="聊天接口首 token 延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="聊天接口输出速率（token/秒）")
+    parser.add_argument("--html-tokens", type=int, default=1500, help="HTML 补全的 token 数")
+    parser.add_argument("--image-latency", type=float, default=2.0, help="生图接口延迟（秒）")
+    parser.add_argument("--image-tail-ratio", type=float, default=0.0, help="生图慢请求的比例（0~1），模拟长尾")
+    parser.add_argument("--image-tail-latency", type=float, default=0.0, help="生图慢请求的延迟（秒）")
+    parser.add_argument("--image-size", type=int, default=512, help="生成图片的边长（像素）")
+    parser.add_argument("--font-latency", type=float, default=0.1, help="字体文件响应延迟（秒）")
+    parser.add_argument("--font-file", default=None, help="作为字体返回的文件，默认在系统字体目录中查找")
+
+
+def stub_config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        chat_latency=args.chat_latency,
+        token_rate=args.token_rate,
+        html_tokens=args.html_tokens,
+        image_latency=args.image_latency,
+        image_tail_ratio=args.image_tail_ratio,
+        image_tail_latency=args.image_tail_latency,
+        image_size=args.image_size,
+        font_latency=args.font_latency,
+        font_file=args.font_file,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线压测替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(build_app(stub_config_from_args(args)), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
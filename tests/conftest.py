@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+# 测试不访问真实服务：必填配置给占位值（需要在导入 app 之前设置）
+for name in ("AI_CHAT_API_KEY", "AI_IMAGE_API_KEY", "WECHAT_APP_ID", "WECHAT_APP_SECRET", "JWT_SECRET_KEY"):
+    os.environ.setdefault(name, "test")
+
+
+class FakeClock:
+    """代替模块中的 time（提供 monotonic 与 time），手动推进时间；不影响事件循环的计时。"""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
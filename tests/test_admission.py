@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected, StageLimiter
+from app.services.scheduler import priority
+
+
+def _limiter(concurrency: int = 1, max_waiting: int = 8, wait_timeout: float = 5.0) -> StageLimiter:
+    return StageLimiter("test", concurrency, max_waiting, wait_timeout, aging=60)
+
+
+async def _hold(limiter: StageLimiter, entered: asyncio.Event, release: asyncio.Event):
+    async with limiter.slot():
+        entered.set()
+        await release.wait()
+
+
+def test_slot_released_when_body_raises():
+    async def scenario():
+        limiter = _limiter()
+        with pytest.raises(ValueError):
+            async with limiter.slot():
+                raise ValueError("boom")
+        async with limiter.slot():
+            pass
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert (limiter.active, limiter.waiting, limiter._free) == (0, 0, 1)
+
+
+def test_slot_released_when_holder_is_cancelled():
+    async def scenario():
+        limiter = _limiter()
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, entered, release))
+        await entered.wait()
+        waiter_entered = asyncio.Event()
+        waiter = asyncio.create_task(_hold(limiter, waiter_entered, release))
+        await asyncio.sleep(0)
+        # 客户端断开：持有名额的请求被取消，名额交给排队的请求
+        holder.cancel()
+        await asyncio.gather(holder, return_exceptions=True)
+        await asyncio.wait_for(waiter_entered.wait(), 1)
+        release.set()
+        await waiter
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert (limiter.active, limiter.waiting, limiter._free) == (0, 0, 1)
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        limiter = _limiter()
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, entered, release))
+        await entered.wait()
+        waiter = asyncio.create_task(_hold(limiter, asyncio.Event(), release))
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await holder
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert (limiter.active, limiter.waiting, limiter._free, len(limiter._waiters)) == (0, 0, 1, 0)
+
+
+def test_waiter_cancelled_after_grant_passes_slot_on():
+    async def scenario():
+        limiter = _limiter()
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, entered, release))
+        await entered.wait()
+        first = asyncio.create_task(_hold(limiter, asyncio.Event(), asyncio.Event()))
+        second_entered = asyncio.Event()
+        second = asyncio.create_task(_hold(limiter, second_entered, release))
+        await asyncio.sleep(0)
+        # 名额交给 first 的同时 first 被取消：名额必须转交给 second，而不是丢失
+        release.set()
+        await holder
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.wait_for(second_entered.wait(), 1)
+        await second
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert (limiter.active, limiter.waiting, limiter._free) == (0, 0, 1)
+
+
+def test_full_queue_and_wait_timeout_reject():
+    async def scenario():
+        limiter = _limiter(max_waiting=1, wait_timeout=0.05)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, entered, release))
+        await entered.wait()
+        with pytest.raises(AdmissionRejected) as timed_out:
+            async with limiter.slot():
+                pass
+        waiter = asyncio.create_task(_hold(limiter, asyncio.Event(), release))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            async with limiter.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return limiter, timed_out.value, full.value
+
+    limiter, timed_out, full = asyncio.run(scenario())
+    assert timed_out.status_code == full.status_code == 503
+    assert limiter.rejected == 2
+    assert (limiter.active, limiter.waiting, limiter._free) == (0, 0, 1)
+
+
+def test_waiters_admitted_by_tier_weight():
+    async def scenario():
+        limiter = _limiter()
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, entered, release))
+        await entered.wait()
+        order = []
+
+        async def queued(tier: str):
+            with priority(tier):
+                async with limiter.slot():
+                    order.append(tier)
+
+        # 免费请求先排队，付费请求仍先放行，之后按 4 : 1 交替
+        tasks = [asyncio.create_task(queued(tier)) for tier in ("free", "free", "paid", "paid", "paid", "paid")]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["paid", "free", "paid", "paid", "paid", "free"]
+
+
+def test_request_quota_released_on_error():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=2, user_max_concurrent=1, stages={})
+        entered, release = asyncio.Event(), asyncio.Event()
+
+        async def hold():
+            async with controller.request("user"):
+                entered.set()
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await entered.wait()
+        with pytest.raises(AdmissionRejected) as quota:
+            async with controller.request("user"):
+                pass
+        holder.cancel()
+        await asyncio.gather(holder, return_exceptions=True)
+        with pytest.raises(ValueError):
+            async with controller.request("user"):
+                raise ValueError("boom")
+        return controller, quota.value
+
+    controller, quota = asyncio.run(scenario())
+    assert quota.status_code == 429
+    assert controller.in_flight == 0
+    assert controller._users == {}
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import ai_service
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """流式规划脚本化：先声明数量，描述在 release 之后才给出；记录每次 HTML 生成时的占位符数与规划是否结束。"""
+    state = {"declared": 1, "prompts": ["red background"], "html_calls": [], "planned": False}
+    release = asyncio.Event()
+
+    async def stream_image_prompts(prompt, on_count=None):
+        if state["declared"] is not None:
+            on_count(state["declared"])
+        await release.wait()
+        for image_prompt in state["prompts"]:
+            yield image_prompt
+        state["planned"] = True
+
+    async def generate_images_from_stream(image_prompts):
+        return [f"https://images.example/{i}.png" async for i, _ in _enumerate(image_prompts)]
+
+    async def generate_html_code(prompt, image_urls, width, height, on_head=None):
+        state["html_calls"].append((len(image_urls), state["planned"]))
+        # HTML 已经开始后规划才继续
+        release.set()
+        await asyncio.sleep(0)
+        return "".join(f'<img src="{url}">' for url in image_urls)
+
+    async def prepare(urls, width, height):
+        pass
+
+    monkeypatch.setattr(settings, "PLAN_MODE", "streaming")
+    monkeypatch.setattr(settings, "HTML_MODE", "llm")
+    monkeypatch.setattr(ai_service, "stream_image_prompts", stream_image_prompts)
+    monkeypatch.setattr(ai_service, "generate_images_from_stream", generate_images_from_stream)
+    monkeypatch.setattr(ai_service, "generate_html_code", generate_html_code)
+    monkeypatch.setattr(ai_service.image_ingest, "prepare", prepare)
+    return state, release
+
+
+async def _enumerate(items):
+    index = 0
+    async for item in items:
+        yield index, item
+        index += 1
+
+
+def test_html_starts_when_count_is_declared(pipeline):
+    state, _ = pipeline
+    html, _, _, image_urls = asyncio.run(ai_service.generate_html_from_ai("猫咪海报"))
+    assert state["html_calls"] == [(1, False)]
+    assert html == '<img src="https://images.example/0.png">' and image_urls == ["https://images.example/0.png"]
+
+
+def test_more_images_than_declared_regenerates_html(pipeline):
+    state, _ = pipeline
+    state["prompts"] = ["red background", "golden title"]
+    html, _, _, image_urls = asyncio.run(ai_service.generate_html_from_ai("猫咪海报"))
+    assert state["html_calls"] == [(1, False), (2, True)]
+    # 两张图片都用上
+    assert all(f'src="{url}"' in html for url in image_urls) and len(image_urls) == 2
+
+
+def test_html_waits_for_plan_without_declared_count(pipeline):
+    state, release = pipeline
+    state["declared"] = None
+    release.set()
+    asyncio.run(ai_service.generate_html_from_ai("猫咪海报"))
+    assert state["html_calls"] == [(1, True)]
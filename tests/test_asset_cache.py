@@ -0,0 +1,161 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+from app.services.renderer.asset_cache import AssetCache
+
+FONT_URL = "https://fonts.example/a.woff2"
+
+
+def _cache(tmp_path, max_bytes: int = 1024, memory_max_bytes: int = 1024, offline: bool = False) -> AssetCache:
+    return AssetCache(str(tmp_path / "assets"), max_bytes, memory_max_bytes, offline)
+
+
+class FakeResponse:
+    def __init__(self, body: bytes, ok: bool = True):
+        self.body_bytes = body
+        self.ok = ok
+        self.headers = {"content-type": "font/woff2"}
+
+    async def body(self) -> bytes:
+        return self.body_bytes
+
+
+class FakeRoute:
+    """代替 Playwright Route：记录页面最终收到的处理方式，回源返回固定内容。"""
+
+    def __init__(self, url: str, resource_type: str = "font", response: FakeResponse | None = None):
+        self.request = SimpleNamespace(method="GET", url=url, resource_type=resource_type)
+        self.response = response
+        self.outcome = None
+
+    async def fetch(self):
+        if self.response is None:
+            raise ConnectionError("offline")
+        return self.response
+
+    async def fulfill(self, **kwargs):
+        self.outcome = ("fulfill", kwargs)
+
+    async def abort(self):
+        self.outcome = ("abort", None)
+
+    async def fallback(self):
+        self.outcome = ("fallback", None)
+
+
+def test_put_get_and_reload(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path)
+        await cache.load()
+        await cache.put(FONT_URL, b"font", "font/woff2")
+        hit = await cache.get(FONT_URL)
+        await cache.close()
+        reloaded = _cache(tmp_path)
+        await reloaded.load()
+        return hit, await reloaded.get(FONT_URL), reloaded.stats()
+
+    hit, reloaded_hit, stats = asyncio.run(scenario())
+    assert hit == reloaded_hit == (b"font", "font/woff2")
+    assert stats["entries"] == 1 and stats["disk_bytes"] == 4
+
+
+def test_shared_content_stored_once_and_evicted_with_last_reference(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path, max_bytes=10)
+        await cache.load()
+        await cache.put("https://a.example/1.woff2", b"same", "font/woff2")
+        await cache.put("https://b.example/1.woff2", b"same", "font/woff2")
+        shared = cache.disk_bytes
+        blob = cache._blob_path(cache._index["https://a.example/1.woff2"]["sha256"])
+        # 超出容量：淘汰最久未使用的两个 URL，共享的文件在最后一个引用淘汰时删除
+        await cache.put("https://c.example/1.woff2", b"0123456789", "font/woff2")
+        return cache, shared, blob
+
+    cache, shared, blob = asyncio.run(scenario())
+    assert shared == 4
+    assert not os.path.exists(blob)
+    assert list(cache._index) == ["https://c.example/1.woff2"]
+    assert cache.disk_bytes == 10 and cache.evictions == 2
+
+
+def test_replacing_url_content_releases_old_blob(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path)
+        await cache.load()
+        await cache.put(FONT_URL, b"v1", "font/woff2")
+        old_blob = cache._blob_path(cache._index[FONT_URL]["sha256"])
+        await cache.put(FONT_URL, b"v2", "font/woff2")
+        return cache, old_blob, await cache.get(FONT_URL)
+
+    cache, old_blob, hit = asyncio.run(scenario())
+    assert hit == (b"v2", "font/woff2")
+    assert not os.path.exists(old_blob)
+    assert cache.disk_bytes == 2
+
+
+def test_corrupt_blob_is_a_miss(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path, memory_max_bytes=0)
+        await cache.load()
+        await cache.put(FONT_URL, b"font", "font/woff2")
+        with open(cache._blob_path(cache._index[FONT_URL]["sha256"]), "wb") as f:
+            f.write(b"tampered")
+        return cache, await cache.get(FONT_URL)
+
+    cache, hit = asyncio.run(scenario())
+    assert hit is None
+    assert cache.stats()["entries"] == 0 and cache.disk_bytes == 0
+
+
+def test_route_serves_hits_and_aborts_misses_offline(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path, offline=True)
+        await cache.load()
+        await cache.put(FONT_URL, b"font", "font/woff2")
+        hit, miss = FakeRoute(FONT_URL), FakeRoute("https://fonts.example/missing.woff2")
+        page = FakeRoute("https://example.com/", resource_type="document")
+        for route in (hit, miss, page):
+            await cache.handle_route(route)
+        return cache, hit, miss, page
+
+    cache, hit, miss, page = asyncio.run(scenario())
+    assert hit.outcome[0] == "fulfill" and hit.outcome[1]["body"] == b"font"
+    assert miss.outcome == ("abort", None)
+    assert page.outcome == ("fallback", None)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_route_miss_fulfills_before_background_write(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path)
+        await cache.load()
+        route = FakeRoute(FONT_URL, response=FakeResponse(b"fetched"))
+        await cache.handle_route(route)
+        # 页面已收到内容，写入仍在后台进行
+        fulfilled_before_write = route.outcome[0] == "fulfill" and FONT_URL not in cache._index
+        await cache.close()
+        return cache, fulfilled_before_write
+
+    cache, fulfilled_before_write = asyncio.run(scenario())
+    assert fulfilled_before_write
+    assert not cache._writes
+    assert cache._index[FONT_URL]["size"] == len(b"fetched")
+    assert os.path.exists(os.path.join(cache.cache_dir, "index.json"))
+
+
+def test_failed_fetch_aborts_and_error_response_not_cached(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path)
+        await cache.load()
+        failed = FakeRoute(FONT_URL)
+        await cache.handle_route(failed)
+        not_found = FakeRoute(FONT_URL, response=FakeResponse(b"404", ok=False))
+        await cache.handle_route(not_found)
+        await cache.close()
+        return cache, failed, not_found
+
+    cache, failed, not_found = asyncio.run(scenario())
+    assert failed.outcome == ("abort", None)
+    assert not_found.outcome[0] == "fulfill"
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,62 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.generator import coder
+from app.services.generator.coder import HeadScanner
+from app.services.generator.layouts import LAYOUTS, SlotError
+
+HTML = "```html\n<!DOCTYPE html><html><HEAD><style>body{}</style></HEAD><body>海报</body></html>\n```"
+HEAD = "<!DOCTYPE html><html><HEAD><style>body{}</style></HEAD>"
+
+
+def _feed(scanner: HeadScanner, pieces: list[str]) -> list[str]:
+    return [head for head in (scanner.feed(piece) for piece in pieces) if head is not None]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 6, 7, 8, 64])
+def test_head_found_across_chunk_boundaries(size):
+    pieces = [HTML[i:i + size] for i in range(0, len(HTML), size)]
+    scanner = HeadScanner()
+    assert _feed(scanner, pieces) == [HEAD]
+    assert scanner.done
+
+
+def test_head_without_fence():
+    scanner = HeadScanner()
+    assert _feed(scanner, ["<html><head></he", "ad><body>"]) == ["<html><head></head>"]
+
+
+def test_gives_up_after_limit():
+    scanner = HeadScanner(limit=16)
+    assert _feed(scanner, ["<html><head>", "<style>" * 3, "</head>"]) == []
+    assert scanner.done
+
+
+def _template_reply(monkeypatch, content: str):
+    async def create(client, prompt, messages, **kwargs):
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(coder.prompt_cache, "create", create)
+    monkeypatch.setattr(coder.prompt_cache, "record_usage", lambda prompt, usage: None)
+    monkeypatch.setattr(coder, "ai_clients", SimpleNamespace(chat=lambda stage: None))
+
+
+def _render(monkeypatch, content: str) -> str:
+    _template_reply(monkeypatch, content)
+    return asyncio.run(coder.generate_html_from_template("海报", ["https://images.example/a.png"], ["猫"], 1080, 1920))
+
+
+def test_template_slots_parsed_from_first_json_object(monkeypatch):
+    slots = {"layout": next(iter(LAYOUTS)), "title": "限时五折"}
+    # 之后的说明文字里还有花括号，贪婪匹配会把两段拼在一起
+    html = _render(monkeypatch, f"版式如下：{json.dumps(slots, ensure_ascii=False)}\n备注：{{可选}}")
+    assert "限时五折" in html
+
+
+@pytest.mark.parametrize("content", ["没有 JSON", '{"layout": ', '["not", "an", "object"]'])
+def test_unusable_template_reply_raises_slot_error(monkeypatch, content):
+    with pytest.raises(SlotError):
+        _render(monkeypatch, content)
@@ -0,0 +1,40 @@
+import pytest
+
+from app.services.generator.editor import MAX_HTML_EDITS, EditError, apply_html_edits, apply_slot_patch
+
+HTML = "<h1>猫咖开业</h1><p>全场八折</p><p>全场八折</p>"
+
+
+def test_slot_patch_merges_known_fields_and_palette():
+    slots = {"title": "猫咖开业", "body": "全场八折", "palette": {"bg": "#fff", "fg": "#000"}}
+    patch = {"title": "猫咖周年庆", "palette": {"fg": "#c00"}, "script": "alert(1)"}
+    merged = apply_slot_patch(slots, patch)
+    assert merged == {"title": "猫咖周年庆", "body": "全场八折", "palette": {"bg": "#fff", "fg": "#c00"}}
+    # 原版式数据不被修改
+    assert slots["palette"]["fg"] == "#000"
+
+
+def test_html_edits_replace_first_occurrence_in_order():
+    edits = [
+        {"find": "猫咖开业", "replace": "猫咖周年庆"},
+        {"find": "全场八折", "replace": "全场七折"},
+        {"find": "猫咖周年庆", "replace": "喵星人周年庆"},
+    ]
+    assert apply_html_edits(HTML, edits) == "<h1>喵星人周年庆</h1><p>全场七折</p><p>全场八折</p>"
+
+
+@pytest.mark.parametrize(
+    "edits",
+    [
+        None,
+        [],
+        [{"find": "不存在的片段", "replace": "x"}],
+        [{"find": "", "replace": "x"}],
+        [{"find": "猫咖开业"}],
+        ["猫咖开业"],
+        [{"find": "猫咖开业", "replace": "x"}] * (MAX_HTML_EDITS + 1),
+    ],
+)
+def test_invalid_html_edits_raise(edits):
+    with pytest.raises(EditError):
+        apply_html_edits(HTML, edits)
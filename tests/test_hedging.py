@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app.services.hedging import HedgeTarget, HedgingEngine
+
+
+def _engine(**kwargs) -> HedgingEngine:
+    options = {
+        "quantile": 0.95, "default_delay": 0.02, "min_delay": 0.01, "min_samples": 3,
+        "window": 10, "budget_ratio": 1.0, "max_hedges": 1,
+    }
+    return HedgingEngine("test", **{**options, **kwargs})
+
+
+class Provider:
+    """脚本化的服务商：按顺序执行 behaviors 中的每一项（秒数表示耗时后成功，异常表示失败）。"""
+
+    def __init__(self, name: str, *behaviors):
+        self.name = name
+        self.behaviors = list(behaviors)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def call(self) -> str:
+        behavior = self.behaviors[min(self.calls, len(self.behaviors) - 1)]
+        self.calls += 1
+        if isinstance(behavior, BaseException):
+            raise behavior
+        try:
+            await asyncio.sleep(behavior)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.name
+
+    def target(self) -> HedgeTarget[str]:
+        return HedgeTarget(self.name, self.call)
+
+
+def test_fast_primary_is_not_hedged():
+    engine = _engine()
+    primary, secondary = Provider("primary", 0), Provider("secondary", 0)
+    assert asyncio.run(engine.run([primary.target(), secondary.target()])) == "primary"
+    assert secondary.calls == 0
+    assert engine.stats()["hedges_fired"] == 0
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    engine = _engine()
+    primary, secondary = Provider("primary", 5), Provider("secondary", 0)
+    assert asyncio.run(engine.run([primary.target(), secondary.target()])) == "secondary"
+    assert primary.cancelled == 1
+    assert (engine.fired, engine.wins) == (1, 1)
+    # 被取消的慢请求也计入耗时样本
+    assert len(engine._latency["primary"]) == 1
+
+
+def test_failed_primary_hedges_immediately():
+    engine = _engine(default_delay=5)
+    primary, secondary = Provider("primary", RuntimeError("503")), Provider("secondary", 0)
+
+    async def scenario():
+        return await asyncio.wait_for(engine.run([primary.target(), secondary.target()]), 1)
+
+    assert asyncio.run(scenario()) == "secondary"
+    assert engine.fired == 1
+
+
+def test_all_attempts_failing_raises_last_error():
+    engine = _engine()
+    primary, secondary = Provider("primary", RuntimeError("primary")), Provider("secondary", ValueError("secondary"))
+    with pytest.raises(ValueError):
+        asyncio.run(engine.run([primary.target(), secondary.target()]))
+    assert engine.errors == 1 and engine.fired == 1
+
+
+def test_budget_limits_hedges():
+    engine = _engine(budget_ratio=0.1, min_samples=100)
+    primary = Provider("primary", 0.05)
+
+    async def scenario():
+        return [await engine.run([primary.target()]) for _ in range(3)]
+
+    assert asyncio.run(scenario()) == ["primary"] * 3
+    # 初始的 1 个令牌用于第一次对冲，之后预算不足
+    assert engine.fired == 1
+    assert engine.denied == 2
+
+
+def test_delay_follows_rolling_quantile():
+    engine = _engine(min_samples=3, min_delay=0.5)
+    assert engine.delay("primary") == engine.default_delay
+    for seconds in (1.0, 2.0, 3.0):
+        engine._tracker("primary").add(seconds)
+    assert engine.delay("primary") == 3.0
+    slow = _engine(min_samples=1, min_delay=0.5)
+    slow._tracker("primary").add(0.1)
+    assert slow.delay("primary") == 0.5
@@ -0,0 +1,115 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.api.routes import jobs as jobs_route
+from app.services.admission import admission
+from app.services.jobs import manager as jobs_manager
+from app.services.jobs.manager import JobManager, JobQueueFull
+from app.services.jobs.store import MemoryJobStore, SqliteJobStore
+
+
+def _result() -> SimpleNamespace:
+    return SimpleNamespace(
+        width=100, height=100, image_urls=[], poster_id="poster1", image_key="objects/poster.jpg",
+        cached=False, image_url=None, variants=[], timeline=[],
+    )
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """脚本化的流水线：依次上报阶段后返回结果，fail 为异常时抛出。"""
+    script = {"stages": ["planned", "rendered"], "fail": None}
+
+    async def run_poster_pipeline(prompt, on_stage=None, use_cache=True, variants=None):
+        for stage in script["stages"]:
+            await on_stage(stage)
+        if script["fail"]:
+            raise script["fail"]
+        return _result()
+
+    monkeypatch.setattr(jobs_manager, "run_poster_pipeline", run_poster_pipeline)
+    return script
+
+
+async def _run_job(manager: JobManager, user_id: str | None = None) -> list[dict]:
+    await manager.start()
+    job = await manager.submit("猫咖海报", user_id=user_id)
+    events = [event async for event in manager.subscribe(job["id"])]
+    await manager.close()
+    return events
+
+
+def test_subscriber_receives_every_stage_until_done(pipeline):
+    manager = JobManager(MemoryJobStore(), concurrency=1, queue_size=4)
+    events = asyncio.run(_run_job(manager, user_id="user-1"))
+    assert [(event["status"], event["stage"]) for event in events] == [
+        ("queued", None), ("running", None), ("running", "planned"), ("running", "rendered"), ("succeeded", "rendered"),
+    ]
+    result = events[-1]["result"]
+    assert result["url"] == f"/api/jobs/{events[-1]['id']}/result"
+    assert set(events[-1]["stages"]) == {"planned", "rendered"}
+    # 任务结束后归还用户配额、移除订阅
+    assert "user-1" not in admission._users
+    assert manager._subscribers == {}
+
+
+def test_failed_pipeline_marks_job_failed(pipeline):
+    pipeline["fail"] = RuntimeError("生图失败")
+    events = asyncio.run(_run_job(JobManager(MemoryJobStore(), concurrency=1, queue_size=4), user_id="user-2"))
+    assert events[-1]["status"] == "failed" and events[-1]["error"] == "生图失败"
+    assert "user-2" not in admission._users
+
+
+def test_full_queue_rejects_and_releases_user_quota():
+    async def scenario():
+        # worker 未启动，任务只排队
+        manager = JobManager(MemoryJobStore(), concurrency=1, queue_size=1)
+        await manager.submit("第一张")
+        with pytest.raises(JobQueueFull):
+            await manager.submit("第二张", user_id="user-3")
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert manager.stats()["queue_depth"] == 1
+    assert "user-3" not in admission._users
+
+
+def test_sqlite_store_fails_unfinished_jobs_on_restart(tmp_path):
+    async def scenario():
+        store = SqliteJobStore(str(tmp_path / "jobs.sqlite3"))
+        await store.start()
+        for job_id, status in (("running", "running"), ("done", "succeeded")):
+            await store.create({"id": job_id, "status": status, "error": None, "updated_at": 0})
+        await store.close()
+        restarted = SqliteJobStore(str(tmp_path / "jobs.sqlite3"))
+        await restarted.start()
+        jobs = [await restarted.get(job_id) for job_id in ("running", "done", "missing")]
+        await restarted.close()
+        return jobs
+
+    interrupted, done, missing = asyncio.run(scenario())
+    assert interrupted["status"] == "failed" and interrupted["error"]
+    assert done["status"] == "succeeded"
+    assert missing is None
+
+
+def test_events_route_streams_sse_until_terminal(pipeline, monkeypatch):
+    manager = JobManager(MemoryJobStore(), concurrency=1, queue_size=4)
+    monkeypatch.setattr(jobs_route, "job_manager", manager)
+
+    async def scenario():
+        await manager.start()
+        job = await manager.submit("猫咖海报")
+        response = await jobs_route.stream_job_events(job["id"])
+        body = "".join([chunk async for chunk in response.body_iterator])
+        await manager.close()
+        return response, body
+
+    response, body = asyncio.run(scenario())
+    assert response.media_type == "text/event-stream"
+    messages = [message.split("\n") for message in body.strip().split("\n\n")]
+    assert [lines[0] for lines in messages] == ["event: progress"] * 4 + ["event: succeeded"]
+    assert json.loads(messages[-1][1].removeprefix("data: "))["result"]["poster_id"] == "poster1"
@@ -0,0 +1,188 @@
+import asyncio
+
+import pytest
+
+from app.services.renderer.page_pool import PagePool, RenderPoolExhausted
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+        self.url = "about:blank"
+        self.fail_reset = False
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    async def evaluate(self, script: str):
+        if self.fail_reset:
+            raise RuntimeError("page crashed")
+
+    async def goto(self, url: str):
+        self.url = url
+
+
+class FakeContext:
+    def __init__(self):
+        self.page = FakePage()
+        self.closed = False
+        self.cookies_cleared = 0
+        self.routes = []
+
+    async def route(self, pattern, handler):
+        self.routes.append((pattern, handler))
+
+    async def new_page(self) -> FakePage:
+        return self.page
+
+    async def clear_cookies(self):
+        self.cookies_cleared += 1
+
+    async def close(self):
+        self.closed = True
+        self.page.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts: list[FakeContext] = []
+        self.connected = True
+
+    async def new_context(self) -> FakeContext:
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+
+def _pool(size: int = 2, max_uses: int = 3, acquire_timeout: float = 0.05, route_handler=None) -> PagePool:
+    return PagePool(size, max_uses, acquire_timeout, health_check_interval=0, route_handler=route_handler)
+
+
+def test_start_prewarms_every_slot_with_route_handler():
+    async def handler(route):
+        pass
+
+    async def scenario():
+        browser = FakeBrowser()
+        pool = _pool(size=3, route_handler=handler)
+        await pool.start(browser)
+        return browser, pool.stats()
+
+    browser, stats = asyncio.run(scenario())
+    assert len(browser.contexts) == 3
+    assert all(context.routes == [("**/*", handler)] for context in browser.contexts)
+    assert stats == {"size": 3, "idle": 3, "in_use": 0, "waiting": 0, "recycled": 0}
+
+
+def test_lease_resets_and_reuses_page():
+    async def scenario():
+        browser = FakeBrowser()
+        pool = _pool(size=1)
+        await pool.start(browser)
+        async with pool.lease() as page:
+            page.url = "data:text/html,poster"
+            first = page
+        async with pool.lease() as page:
+            second = page
+        return browser, pool, first, second
+
+    browser, pool, first, second = asyncio.run(scenario())
+    assert first is second
+    assert first.url == "about:blank"
+    assert browser.contexts[0].cookies_cleared == 2
+    assert pool.stats()["recycled"] == 0
+
+
+def test_slot_recycled_after_max_uses():
+    async def scenario():
+        browser = FakeBrowser()
+        pool = _pool(size=1, max_uses=2)
+        await pool.start(browser)
+        pages = []
+        for _ in range(3):
+            async with pool.lease() as page:
+                pages.append(page)
+        return browser, pool, pages
+
+    browser, pool, pages = asyncio.run(scenario())
+    assert pages[0] is pages[1] and pages[2] is not pages[0]
+    assert browser.contexts[0].closed
+    assert pool.stats()["recycled"] == 1
+
+
+def test_error_inside_lease_discards_slot():
+    async def scenario():
+        browser = FakeBrowser()
+        pool = _pool(size=1)
+        await pool.start(browser)
+        with pytest.raises(ValueError):
+            async with pool.lease():
+                raise ValueError("render failed")
+        async with pool.lease() as page:
+            fresh = page
+        return browser, pool, fresh
+
+    browser, pool, fresh = asyncio.run(scenario())
+    assert browser.contexts[0].closed
+    assert fresh is browser.contexts[1].page
+    assert pool.stats()["in_use"] == 0
+
+
+def test_failed_reset_recycles_slot():
+    async def scenario():
+        browser = FakeBrowser()
+        pool = _pool(size=1)
+        await pool.start(browser)
+        async with pool.lease() as page:
+            page.fail_reset = True
+        return browser, pool
+
+    browser, pool = asyncio.run(scenario())
+    assert browser.contexts[0].closed
+    assert pool.stats() == {"size": 1, "idle": 0, "in_use": 0, "waiting": 0, "recycled": 1}
+
+
+def test_exhausted_pool_applies_backpressure():
+    async def scenario():
+        browser = FakeBrowser()
+        pool = _pool(size=1, acquire_timeout=0.05)
+        await pool.start(browser)
+        slot = await pool.acquire()
+        with pytest.raises(RenderPoolExhausted):
+            await pool.acquire()
+
+        # 等待中的调用方在槽位归还后拿到页面
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+        waiting = pool.stats()["waiting"]
+        await pool.release(slot)
+        reused = await asyncio.wait_for(waiter, 1)
+        await pool.release(reused)
+        return pool, slot, reused, waiting
+
+    pool, slot, reused, waiting = asyncio.run(scenario())
+    assert waiting == 1
+    assert reused is slot
+    assert pool.stats()["in_use"] == 0
+
+
+def test_dead_idle_slot_replaced_on_acquire_and_health_check():
+    async def scenario():
+        browser = FakeBrowser()
+        pool = _pool(size=2)
+        await pool.start(browser)
+        browser.contexts[0].page.closed = True
+        browser.contexts[1].page.closed = True
+        slot = await pool.acquire()
+        await pool.release(slot)
+        # 健康检查补足被剔除的槽位
+        await pool.check_health()
+        return browser, pool
+
+    browser, pool = asyncio.run(scenario())
+    assert pool.stats()["idle"] == 2
+    assert pool.stats()["recycled"] == 2
+    assert len(browser.contexts) == 4
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from app.services.generator import painter
+from app.services.resilience import CircuitOpen
+
+
+def _fail_with(monkeypatch, error: BaseException):
+    async def run(targets):
+        raise error
+
+    monkeypatch.setattr(painter.image_hedging, "run", run)
+    monkeypatch.setattr(painter, "_image_targets", lambda prompt: [])
+
+
+def test_open_circuit_fails_fast(monkeypatch):
+    _fail_with(monkeypatch, CircuitOpen("images.example", 30))
+    with pytest.raises(CircuitOpen):
+        asyncio.run(painter.generate_images_from_ai(["红色背景", "猫"]))
+
+
+def test_single_image_failure_is_tolerated(monkeypatch):
+    calls = 0
+
+    async def run(targets):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("bad image")
+        return "https://images.example/ok.png"
+
+    monkeypatch.setattr(painter.image_hedging, "run", run)
+    monkeypatch.setattr(painter, "_image_targets", lambda prompt: [])
+    monkeypatch.setattr(painter.image_ingest, "prefetch", lambda url: None)
+    assert asyncio.run(painter.generate_images_from_ai(["红色背景", "猫"])) == ["https://images.example/ok.png"]
+
+
+def test_all_images_failing_raises(monkeypatch):
+    _fail_with(monkeypatch, RuntimeError("bad image"))
+    with pytest.raises(Exception, match="所有图片生成均失败"):
+        asyncio.run(painter.generate_images_from_ai(["红色背景"]))
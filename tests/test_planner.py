@@ -0,0 +1,142 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+
+from app.services.generator import planner
+from app.services.generator.planner import ImagePromptParser, stream_image_prompts
+from app.services.resilience import Resilience
+
+PLAN = json.dumps({"image_prompts": ["红色背景", "一只 \"猫\"", "金色\\n标题"], "style": "海报"}, ensure_ascii=False)
+
+
+def _chunk(text: str) -> SimpleNamespace:
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+def _split(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class _StubPromptCache:
+    """代替 prompt_cache：每次 create 按顺序返回一个脚本化的流（分片列表，遇到异常对象时抛出）。"""
+
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.calls = 0
+
+    async def create(self, client, prompt, messages, **kwargs):
+        script = self.scripts[self.calls]
+        self.calls += 1
+
+        async def stream():
+            for item in script:
+                if isinstance(item, BaseException):
+                    raise item
+                await asyncio.sleep(0)
+                yield _chunk(item)
+
+        return stream()
+
+    def record_usage(self, prompt, usage):
+        pass
+
+
+def _stub(monkeypatch, cache: _StubPromptCache):
+    monkeypatch.setattr(planner, "prompt_cache", cache)
+    monkeypatch.setattr(planner, "ai_clients", SimpleNamespace(chat=lambda stage: None))
+    monkeypatch.setattr(planner, "resilience", Resilience(
+        max_attempts=3, backoff_base=0, backoff_max=0, budget_ratio=1,
+        failure_ratio=0.5, min_calls=100, window=100, open_seconds=30,
+    ))
+
+
+async def _collect(prompt: str = "猫咪海报") -> list[str]:
+    return [image_prompt async for image_prompt in stream_image_prompts(prompt)]
+
+
+def test_parser_emits_each_prompt_once_across_chunks():
+    parser = ImagePromptParser()
+    found = []
+    for piece in _split(PLAN, 3):
+        found.extend(parser.feed(piece))
+    assert found == json.loads(PLAN)["image_prompts"]
+    assert parser.prompts == found
+    assert parser.feed("更多内容") == []
+
+
+def test_stream_yields_every_planned_prompt(monkeypatch):
+    _stub(monkeypatch, _StubPromptCache(_split(PLAN, 5)))
+    assert asyncio.run(_collect()) == json.loads(PLAN)["image_prompts"]
+
+
+def test_retry_after_partial_stream_does_not_duplicate(monkeypatch):
+    prompts = json.loads(PLAN)["image_prompts"]
+    partial = PLAN[:PLAN.index("一只")]  # 第一个描述已完整，随后连接断开
+    cache = _StubPromptCache([partial, httpx.ReadError("reset")], _split(PLAN, 7))
+    _stub(monkeypatch, cache)
+    assert asyncio.run(_collect()) == prompts
+    assert cache.calls == 2
+
+
+def test_failed_plan_falls_back_to_original_prompt(monkeypatch):
+    cache = _StubPromptCache(*([httpx.ReadError("reset")],) * 3)
+    _stub(monkeypatch, cache)
+    assert asyncio.run(_collect("猫咪海报")) == ["猫咪海报"]
+
+
+def test_plan_without_prompts_falls_back(monkeypatch):
+    _stub(monkeypatch, _StubPromptCache(['{"image_prompts": []}']))
+    assert asyncio.run(_collect("猫咪海报")) == ["猫咪海报"]
+
+
+def test_slow_consumer_does_not_hold_chat_slot(monkeypatch):
+    _stub(monkeypatch, _StubPromptCache(_split(PLAN, 5)))
+    chat = planner.admission.stages["chat"]
+
+    async def scenario():
+        stream = stream_image_prompts("猫咪海报")
+        first = await stream.__anext__()
+        # 调用方还没处理完第一个描述，规划流已读完并释放 chat 阶段名额
+        for _ in range(50):
+            await asyncio.sleep(0)
+        active = chat.active
+        rest = [image_prompt async for image_prompt in stream]
+        return [first, *rest], active
+
+    prompts, active = asyncio.run(scenario())
+    assert prompts == json.loads(PLAN)["image_prompts"]
+    assert active == 0
+
+
+def test_parser_reads_declared_count_before_prompts():
+    plan = json.dumps({"image_count": 12, "image_prompts": ["红色背景"]}, ensure_ascii=False)
+    parser = ImagePromptParser()
+    counts = []
+    for piece in _split(plan, 1):
+        parser.feed(piece)
+        counts.append(parser.image_count)
+    # "12" 完整之前不报告数量
+    assert counts[plan.index("12") + 1] is None
+    assert counts[plan.index("12") + 2] == 12
+    assert parser.prompts == ["红色背景"]
+
+
+def test_count_after_prompts_is_ignored():
+    parser = ImagePromptParser()
+    parser.feed(json.dumps({"image_prompts": ["红色背景"], "image_count": 1}, ensure_ascii=False))
+    assert parser.image_count is None
+
+
+def test_stream_reports_count_once_across_retries(monkeypatch):
+    plan = json.dumps({"image_count": 3, **json.loads(PLAN)}, ensure_ascii=False)
+    partial = plan[:plan.index("一只")]
+    _stub(monkeypatch, _StubPromptCache([partial, httpx.ReadError("reset")], _split(plan, 7)))
+    counts = []
+
+    async def scenario():
+        return [image_prompt async for image_prompt in stream_image_prompts("猫咪海报", on_count=counts.append)]
+
+    assert asyncio.run(scenario()) == json.loads(PLAN)["image_prompts"]
+    assert counts == [3]
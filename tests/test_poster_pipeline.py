@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import poster_pipeline
+from app.services.generator.editor import EditError
+from app.services.result_cache import ResultCache
+
+PROMPT = "猫咖开业海报"
+IMAGE_URL = "https://images.example/cat.png"
+
+
+@pytest.fixture
+def stubbed(tmp_path, monkeypatch):
+    """替换流水线依赖的 AI、渲染与存储，记录每次保存的海报清单参数。"""
+    saved = []
+    calls = {"generate": 0, "edit": 0}
+
+    async def generate(prompt, on_head=None, on_stage=None, shared=None):
+        calls["generate"] += 1
+        return "<html>poster</html>", 100, 100, [IMAGE_URL]
+
+    async def render(html_content, width, height, speculative=None):
+        return b"jpeg"
+
+    async def save_artifacts(html_content, image_urls, image_bytes, width, height, prompt, edited_from, image_keys):
+        saved.append({"image_keys": image_keys, "edited_from": edited_from})
+        return {"id": f"poster{len(saved)}", "image": "objects/poster.jpg", "url": None}
+
+    monkeypatch.setattr(settings, "RESULT_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "HTML_STREAMING", False)
+    monkeypatch.setattr(poster_pipeline, "generate_html_from_ai", generate)
+    monkeypatch.setattr(poster_pipeline, "render_html_to_image", render)
+    monkeypatch.setattr(poster_pipeline, "save_artifacts", save_artifacts)
+    monkeypatch.setattr(poster_pipeline, "result_cache", ResultCache(str(tmp_path / "results"), 1024 * 1024, 0))
+    return saved, calls
+
+
+def test_cache_hit_reuses_image_keys_of_original_generation(stubbed, monkeypatch):
+    saved, calls = stubbed
+    persisted = {IMAGE_URL: "objects/cat.png"}
+
+    async def persist(urls):
+        return [persisted.get(url) for url in urls]
+
+    monkeypatch.setattr(poster_pipeline.image_ingest, "persist", persist)
+
+    async def scenario():
+        await poster_pipeline.result_cache.load()
+        first = await poster_pipeline.run_poster_pipeline(PROMPT)
+        await asyncio.gather(*poster_pipeline._background_tasks)
+        # 命中缓存时生成图片早已不在预取内存中
+        persisted.clear()
+        second = await poster_pipeline.run_poster_pipeline(PROMPT)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert calls["generate"] == 1
+    assert not first.cached and second.cached
+    assert [item["image_keys"] for item in saved] == [["objects/cat.png"], ["objects/cat.png"]]
+    assert second.image_keys == ["objects/cat.png"]
+
+
+def test_edit_checks_images_before_requesting_patch(stubbed, monkeypatch):
+    saved, calls = stubbed
+    poster = {
+        "id": "poster1", "html": "objects/poster.html", "width": 100, "height": 100,
+        "image_urls": [IMAGE_URL], "image_keys": [None],
+    }
+
+    async def get(key):
+        return b"<html>poster</html>"
+
+    async def noop(*args):
+        pass
+
+    async def edit_html(*args):
+        calls["edit"] += 1
+        return "<html>edited</html>", "html"
+
+    monkeypatch.setattr(poster_pipeline.artifact_store, "get", get)
+    monkeypatch.setattr(poster_pipeline.image_ingest, "restore", noop)
+    monkeypatch.setattr(poster_pipeline.image_ingest, "prepare", noop)
+    monkeypatch.setattr(poster_pipeline.image_ingest, "missing", lambda urls: list(urls))
+    monkeypatch.setattr(poster_pipeline, "edit_html", edit_html)
+
+    with pytest.raises(EditError):
+        asyncio.run(poster_pipeline.run_edit_pipeline(poster, "标题改成红色"))
+    # 图片取不到时不调用模型
+    assert calls["edit"] == 0
+    assert saved == []
@@ -0,0 +1,149 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import resilience as resilience_module
+from app.services.resilience import CircuitBreaker, CircuitOpen, Resilience, RetryBudget
+
+
+def _breaker(clock, monkeypatch) -> CircuitBreaker:
+    monkeypatch.setattr(resilience_module, "time", clock)
+    return CircuitBreaker("test", failure_ratio=0.5, min_calls=4, window=10, open_seconds=30)
+
+
+def test_breaker_opens_after_failure_ratio(monkeypatch, clock):
+    breaker = _breaker(clock, monkeypatch)
+    for success in (True, False, True):
+        breaker.allow()
+        breaker.record(success)
+    assert breaker.state == "closed"  # 调用数未达到 min_calls
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen) as rejected:
+        breaker.allow()
+    assert rejected.value.retry_after == pytest.approx(30)
+    assert breaker.rejected == 1
+
+
+def test_half_open_allows_single_probe_then_closes(monkeypatch, clock):
+    breaker = _breaker(clock, monkeypatch)
+    breaker._open()
+    clock.advance(31)
+    assert breaker.allow() is True
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()  # 探测进行中，其余调用仍被拒绝
+    breaker.record(True)
+    assert breaker.state == "closed"
+    assert breaker.allow() is False
+
+
+def test_failed_probe_reopens(monkeypatch, clock):
+    breaker = _breaker(clock, monkeypatch)
+    breaker._open()
+    clock.advance(31)
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_cancelled_probe_lets_next_call_probe(monkeypatch, clock):
+    breaker = _breaker(clock, monkeypatch)
+    breaker._open()
+    clock.advance(31)
+    breaker.allow()
+    breaker.cancel_probe()
+    assert breaker.allow() is True
+
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def _resilience(max_attempts: int = 3, budget_ratio: float = 0.2) -> Resilience:
+    return Resilience(
+        max_attempts=max_attempts,
+        backoff_base=0,
+        backoff_max=0,
+        budget_ratio=budget_ratio,
+        failure_ratio=0.5,
+        min_calls=100,
+        window=100,
+        open_seconds=30,
+    )
+
+
+def _flaky(failures: int):
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        if calls <= failures:
+            raise httpx.ConnectError("down")
+        return calls
+
+    return call
+
+
+def test_call_retries_transient_errors():
+    guard = _resilience()
+    assert asyncio.run(guard.call("provider", "test", _flaky(2), timeout=1)) == 3
+
+
+def test_call_does_not_retry_client_errors():
+    guard = _resilience()
+    calls = 0
+
+    async def bad_request():
+        nonlocal calls
+        calls += 1
+        raise ValueError("invalid")
+
+    with pytest.raises(ValueError):
+        asyncio.run(guard.call("provider", "test", bad_request, timeout=1))
+    assert calls == 1
+    # 不可重试的错误说明服务商可用，计为成功
+    assert guard.breakers["provider"].stats()["recent_failures"] == 0
+
+
+def test_exhausted_budget_stops_retrying():
+    guard = _resilience(max_attempts=5)
+    guard.breaker("provider")
+    guard.budgets["provider"] = RetryBudget(ratio=0, max_tokens=1)
+    call = _flaky(10)
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(guard.call("provider", "test", call, timeout=1))
+    # 首次调用 + 预算内的 1 次重试
+    assert guard.breakers["provider"].stats()["recent_failures"] == 2
+
+
+def test_timeout_counts_as_failure_and_opens_breaker():
+    guard = Resilience(
+        max_attempts=1, backoff_base=0, backoff_max=0, budget_ratio=0,
+        failure_ratio=0.5, min_calls=2, window=10, open_seconds=30,
+    )
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(asyncio.TimeoutError):
+                await guard.call("provider", "test", slow, timeout=0.01)
+        with pytest.raises(CircuitOpen):
+            await guard.call("provider", "test", slow, timeout=0.01)
+
+    asyncio.run(scenario())
+    assert guard.breakers["provider"].state == "open"
@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+from app.core.config import settings
+from app.services import result_cache
+from app.services.result_cache import ResultCache, normalize_prompt, result_cache_key
+
+KEYS = ["objects/cat.png"]
+
+
+def _cache(tmp_path, max_bytes: int = 1024, ttl: float = 0) -> ResultCache:
+    return ResultCache(str(tmp_path / "results"), max_bytes, ttl)
+
+
+async def _put(cache: ResultCache, key: str, size: int = 10):
+    await cache.put(key, b"j" * (size - 1), "h", 100, 100, ["https://images.example/cat.png"], KEYS)
+
+
+def test_key_ignores_formatting_but_not_size_or_mode(monkeypatch):
+    assert normalize_prompt("  猫咖　开业海报。 ") == normalize_prompt("猫咖 开业海报") == "猫咖 开业海报"
+    assert result_cache_key("Cat  Cafe 海报!") == result_cache_key("cat cafe 海报")
+    assert result_cache_key("猫咖海报 800x600") != result_cache_key("猫咖海报 1080x1920")
+    key = result_cache_key("猫咖海报")
+    monkeypatch.setattr(settings, "HTML_MODE", "llm" if settings.HTML_MODE == "template" else "template")
+    assert result_cache_key("猫咖海报") != key
+
+
+def test_put_get_and_reload(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path)
+        await cache.load()
+        await _put(cache, "a" * 64)
+        hit = await cache.get("a" * 64)
+        reloaded = _cache(tmp_path)
+        await reloaded.load()
+        return hit, await reloaded.get("a" * 64), await reloaded.get("b" * 64), reloaded
+
+    hit, reloaded_hit, miss, reloaded = asyncio.run(scenario())
+    assert hit == reloaded_hit
+    assert hit["html_content"] == "h" and hit["image_keys"] == KEYS
+    assert miss is None
+    assert (reloaded.hits, reloaded.misses) == (1, 1)
+
+
+def test_expired_entry_is_a_miss_and_removed(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(result_cache, "time", clock)
+
+    async def scenario():
+        cache = _cache(tmp_path, ttl=60)
+        await cache.load()
+        await _put(cache, "a" * 64)
+        clock.advance(30)
+        fresh = await cache.get("a" * 64)
+        clock.advance(31)
+        return cache, fresh, await cache.get("a" * 64)
+
+    cache, fresh, expired = asyncio.run(scenario())
+    assert fresh is not None and expired is None
+    assert not os.path.exists(cache.image_path("a" * 64))
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_least_recently_used_entry_evicted(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path, max_bytes=25)
+        await cache.load()
+        await _put(cache, "a" * 64)
+        await _put(cache, "b" * 64)
+        # 读取 a 后 b 成为最久未使用
+        await cache.get("a" * 64)
+        await _put(cache, "c" * 64)
+        return cache, [await cache.get(key * 64) is not None for key in "abc"]
+
+    cache, present = asyncio.run(scenario())
+    assert present == [True, False, True]
+    assert cache.evictions == 1 and cache.stats()["bytes"] == 20
+
+
+def test_entry_larger_than_cache_is_not_stored(tmp_path):
+    async def scenario():
+        cache = _cache(tmp_path, max_bytes=5)
+        await cache.load()
+        await _put(cache, "a" * 64, size=10)
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cache.stats()["entries"] == 0
+    assert not os.path.exists(cache.image_path("a" * 64))
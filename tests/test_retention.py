@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+
+from app.services.storage.backends import LocalStorageBackend
+from app.services.storage.retention import ArtifactIndex, RetentionManager
+from app.services.storage.store import ArtifactStore, variant_key
+
+
+def _manager(root, **kwargs) -> RetentionManager:
+    store = ArtifactStore(LocalStorageBackend(str(root / "store")), queue_size=32, batch_size=8, workers=1, flush_timeout=5)
+    options = {
+        "max_age": 0, "max_bytes": 0, "sweep_interval": 0, "sweep_batch": 10, "orphan_grace": 0,
+    }
+    return RetentionManager(store, ArtifactIndex(str(root / "index.db")), **{**options, **kwargs})
+
+
+async def _poster(store: ArtifactStore, poster_id: str, payload: bytes) -> dict:
+    image = await store.put(payload + b"-image", ".jpg", "image/jpeg")
+    html = await store.put(payload + b"-html", ".html", "text/html")
+    source = await store.put(payload + b"-source", ".png", "image/png")
+    variant = await store.put_as(variant_key(image, 480, 80, ".webp"), payload + b"-webp", "image/webp")
+    manifest = {
+        "id": poster_id, "created_at": time.time(), "image": image, "html": html,
+        "image_urls": ["https://images.example/a.png"], "image_keys": [source],
+    }
+    manifest_key = await store.put_as(f"posters/{poster_id}.json", json.dumps(manifest).encode(), "application/json")
+    return {"image": image, "html": html, "source": source, "variant": variant, "manifest": manifest_key}
+
+
+async def _exists(store: ArtifactStore, key: str) -> bool:
+    return await store.backend.get(key) is not None
+
+
+def test_orphans_are_swept_but_referenced_objects_kept(tmp_path):
+    async def scenario():
+        manager = _manager(tmp_path)
+        await manager.store.start()
+        await manager.start()
+        keys = await _poster(manager.store, "p1", b"one")
+        orphan = await manager.store.put(b"orphan", ".jpg", "image/jpeg")
+        await manager.store.flush()
+        result = await manager.sweep()
+        kept = {name: await _exists(manager.store, key) for name, key in keys.items()}
+        orphan_exists = await _exists(manager.store, orphan)
+        await manager.close()
+        await manager.store.close()
+        return result, kept, orphan_exists
+
+    result, kept, orphan_exists = asyncio.run(scenario())
+    assert result["posters"] == 0 and result["objects"] == 1
+    assert not orphan_exists
+    # 海报图片、HTML、修改时使用的生成图片与派生图都仍被引用
+    assert all(kept.values())
+
+
+def test_expired_poster_and_its_objects_are_reclaimed(tmp_path):
+    async def scenario():
+        manager = _manager(tmp_path, max_age=0.05)
+        await manager.store.start()
+        await manager.start()
+        keys = await _poster(manager.store, "p1", b"one")
+        await manager.store.flush()
+        await asyncio.sleep(0.1)
+        first = await manager.sweep()
+        # 派生图在原图被回收后的下一轮回收
+        second = await manager.sweep()
+        remaining = {name: await _exists(manager.store, key) for name, key in keys.items()}
+        totals = await manager.index.totals()
+        await manager.close()
+        await manager.store.close()
+        return first, second, remaining, totals, manager
+
+    first, second, remaining, totals, manager = asyncio.run(scenario())
+    assert first["posters"] == 1 and first["objects"] == 3
+    assert second["objects"] == 1
+    assert not any(remaining.values())
+    assert totals == {"objects": 0, "bytes": 0, "posters": 0}
+    assert manager.reclaimed_bytes > 0
+
+
+def test_over_budget_evicts_least_recently_used(tmp_path):
+    async def scenario():
+        manager = _manager(tmp_path, max_bytes=1)
+        await manager.store.start()
+        await manager.start()
+        old = await _poster(manager.store, "old", b"old")
+        await manager.store.flush()
+        await asyncio.sleep(0.01)
+        new = await _poster(manager.store, "new", b"new")
+        await manager.store.flush()
+        await asyncio.sleep(0.01)
+        # 访问旧海报后，新海报变为最久未访问
+        await manager.store.get(old["image"])
+        manager.sweep_batch = 1
+        result = await manager.sweep()
+        old_exists = await _exists(manager.store, old["manifest"])
+        new_exists = await _exists(manager.store, new["manifest"])
+        await manager.close()
+        await manager.store.close()
+        return result, old_exists, new_exists
+
+    result, old_exists, new_exists = asyncio.run(scenario())
+    assert result["posters"] == 1
+    assert old_exists and not new_exists
+
+
+def test_index_rebuilt_from_local_storage(tmp_path):
+    async def scenario():
+        manager = _manager(tmp_path)
+        await manager.store.start()
+        await manager.start()
+        await _poster(manager.store, "p1", b"one")
+        await manager.store.flush()
+        await manager.close()
+        (tmp_path / "index.db").unlink()
+        rebuilt = _manager(tmp_path)
+        rebuilt.store = manager.store
+        await rebuilt.start()
+        totals = await rebuilt.index.totals()
+        await rebuilt.close()
+        await manager.store.close()
+        return totals
+
+    totals = asyncio.run(scenario())
+    assert totals["posters"] == 1 and totals["objects"] == 5
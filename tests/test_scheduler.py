@@ -0,0 +1,79 @@
+from app.services import scheduler
+from app.services.scheduler import FairQueue, current_tier, normalize_tier, priority
+
+
+def _drain(queue: FairQueue) -> list[str]:
+    order = []
+    while queue:
+        order.append(queue.pop()[0])
+    return order
+
+
+def test_backlogged_tiers_share_by_weight(monkeypatch, clock):
+    monkeypatch.setattr(scheduler, "time", clock)
+    queue = FairQueue("test", {"paid": 4, "free": 1}, aging=60)
+    for i in range(10):
+        queue.put("free", f"free-{i}")
+        queue.put("paid", f"paid-{i}")
+
+    order = _drain(queue)
+    # 两个等级都有积压时按 4 : 1 放行
+    assert order[0] == "paid"
+    assert [window.count("paid") for window in (order[:5], order[5:10])] == [4, 4]
+    assert order.count("free") == 10
+
+
+def test_fifo_within_tier(monkeypatch, clock):
+    monkeypatch.setattr(scheduler, "time", clock)
+    queue = FairQueue("test", {"paid": 4, "free": 1}, aging=60)
+    for i in range(3):
+        queue.put("free", i)
+    assert [queue.pop()[1] for _ in range(3)] == [0, 1, 2]
+
+
+def test_aging_promotes_starved_tier(monkeypatch, clock):
+    monkeypatch.setattr(scheduler, "time", clock)
+    queue = FairQueue("test", {"paid": 100, "free": 1}, aging=15)
+    queue.put("free", "old")
+    queue.pop()  # 免费等级的虚拟时间领先很多
+    queue.put("free", "starved")
+    clock.advance(20)
+    for i in range(5):
+        queue.put("paid", i)
+
+    # 权重下本应先放行全部付费项，但免费项已等待超过 aging 秒
+    assert queue.pop() == ("free", "starved")
+    assert queue.aged == 1
+
+
+def test_idle_tier_does_not_bank_credit(monkeypatch, clock):
+    monkeypatch.setattr(scheduler, "time", clock)
+    queue = FairQueue("test", {"paid": 1, "free": 1}, aging=60)
+    for i in range(6):
+        queue.put("paid", i)
+    for _ in range(4):
+        queue.pop()
+    # 免费等级空闲期间没有积攒额度，重新排队后与付费等级交替放行
+    for i in range(2):
+        queue.put("free", i)
+    assert _drain(queue) == ["free", "paid", "free", "paid"]
+
+
+def test_remove_and_stats(monkeypatch, clock):
+    monkeypatch.setattr(scheduler, "time", clock)
+    queue = FairQueue("test", {"paid": 4, "free": 1}, aging=60)
+    item = object()
+    queue.put("paid", item)
+    clock.advance(2)
+    assert queue.stats()["paid"] == {"waiting": 1, "oldest_wait_ms": 2000.0}
+    assert queue.remove("paid", item)
+    assert not queue.remove("paid", item)
+    assert len(queue) == 0
+
+
+def test_unknown_tier_falls_back_to_default(monkeypatch):
+    monkeypatch.setattr(scheduler.settings, "PRIORITY_DEFAULT_TIER", "enterprise")
+    assert normalize_tier("gold") == "free"
+    assert normalize_tier("paid") == "paid"
+    with priority(None):
+        assert current_tier() == "free"
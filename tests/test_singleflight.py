@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from app.utils.singleflight import SingleFlight
+
+
+def test_followers_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = 0
+        release = asyncio.Event()
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "poster"
+
+        tasks = [asyncio.create_task(flight.do("key", compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+        return calls, results, flight.stats()
+
+    calls, results, stats = asyncio.run(scenario())
+    assert calls == 1
+    assert results == [("poster", False), ("poster", True), ("poster", True)]
+    assert stats == {"in_flight": 0, "executions": 1, "shared": 2}
+
+
+def test_error_reaches_every_waiter_and_key_is_retried():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fail():
+            await release.wait()
+            raise ValueError("boom")
+
+        tasks = [asyncio.create_task(flight.do("key", fail)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+
+        async def succeed():
+            return "ok"
+
+        # 失败的计算不会留在表中，下一次调用重新执行
+        return outcomes, await flight.do("key", succeed)
+
+    outcomes, retried = asyncio.run(scenario())
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert retried == ("ok", False)
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "poster"
+
+        leader = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.gather(leader, return_exceptions=True)
+        release.set()
+        return leader, await follower
+
+    leader, result = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert result == ("poster", True)
+
+
+def test_all_waiters_cancelled_leaves_no_entry():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fail():
+            await release.wait()
+            raise ValueError("boom")
+
+        waiter = asyncio.create_task(flight.do("key", fail))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # 计算仍在运行，完成后从表中移除，异常已被读取
+        release.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return flight.stats()
+
+    assert asyncio.run(scenario())["in_flight"] == 0
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from app.services.storage.backends import LocalStorageBackend
+from app.services.storage.store import WRITE_ATTEMPTS, ArtifactStore, object_key, variant_key, variant_parent
+
+
+def _store(root, **kwargs) -> ArtifactStore:
+    options = {"queue_size": 16, "batch_size": 8, "workers": 1, "flush_timeout": 5}
+    return ArtifactStore(LocalStorageBackend(str(root)), **{**options, **kwargs})
+
+
+def test_keys_are_content_addressed():
+    key = object_key(b"poster", ".jpg")
+    assert key == object_key(b"poster", ".jpg") != object_key(b"other", ".jpg")
+    assert key.startswith(f"objects/{key[8:10]}/{key[11:13]}/")
+    derived = variant_key(key, 480, 80, ".webp")
+    assert variant_parent(derived) == key
+    assert variant_parent(key) is None
+
+
+def test_put_dedupes_and_serves_pending_reads(tmp_path):
+    async def scenario():
+        store = _store(tmp_path)
+        # worker 尚未启动：写入只入队，读取直接返回内存中的内容
+        key = await store.put(b"poster", ".jpg", "image/jpeg")
+        again = await store.put(b"poster", ".jpg", "image/jpeg")
+        pending = await store.get(key)
+        await store.start()
+        await store.wait([key])
+        stored = await store.get(key)
+        await store.close()
+        return store, key, again, pending, stored
+
+    store, key, again, pending, stored = asyncio.run(scenario())
+    assert key == again
+    assert pending == stored == b"poster"
+    assert (tmp_path / key).read_bytes() == b"poster"
+    assert store.stats()["written"] == 1 and store.deduplicated == 1
+
+
+def test_on_written_callback_receives_batch(tmp_path):
+    async def scenario():
+        store = _store(tmp_path)
+        written = []
+
+        async def on_written(items):
+            written.extend(key for key, _, _ in items)
+
+        store.on_written.append(on_written)
+        await store.start()
+        keys = [await store.put(data, ".bin", "application/octet-stream") for data in (b"a", b"b", b"c")]
+        await store.flush()
+        await store.close()
+        return keys, written
+
+    keys, written = asyncio.run(scenario())
+    assert sorted(written) == sorted(keys)
+
+
+def test_failed_write_reports_without_trailing_backoff(tmp_path, monkeypatch):
+    delays = []
+
+    async def no_sleep(delay):
+        delays.append(delay)
+
+    class BrokenBackend(LocalStorageBackend):
+        async def put_many(self, items):
+            raise OSError("disk full")
+
+    async def scenario():
+        store = ArtifactStore(BrokenBackend(str(tmp_path)), queue_size=4, batch_size=4, workers=1, flush_timeout=1)
+        await store.start()
+        monkeypatch.setattr(asyncio, "sleep", no_sleep)
+        key = await store.put(b"poster", ".jpg", "image/jpeg")
+        with pytest.raises(OSError):
+            await store.wait([key])
+        await store.flush()
+        monkeypatch.undo()
+        await store.close()
+        return store
+
+    store = asyncio.run(scenario())
+    # 每次失败后退避，最后一次失败后不再等待
+    assert delays == [0.5 * 2 ** attempt for attempt in range(WRITE_ATTEMPTS - 1)]
+    assert store.failed == 1 and store.written == 0